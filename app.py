@@ -3,47 +3,94 @@
 Flask + MySQL/SQLite + ユーザー認証を使用した学習プラットフォーム
 """
 
+import time
+
+_import_started = time.perf_counter()
+
+import argparse
 import os
 from datetime import timedelta
 from flask import Flask, redirect, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from app.core.config import Config
 from app.core.database import DatabaseManager
 from app.core.auth import init_auth_routes
 from app.core.question_manager import QuestionManager
+from app.services.import_jobs import ImportJobManager
+from app.services.leaderboard import Leaderboard
+from app.services.weighted_sampler import WeakAreaSampler
 from app.routes import main_bp, practice_bp, exam_bp, admin_bp, upload_bp
+from app.utils.startup_profile import StartupProfile
+
+_IMPORT_SECONDS = time.perf_counter() - _import_started
 
 
 def create_app(config_class=Config):
     """Application Factory Pattern"""
-    app = Flask(__name__, 
-                template_folder='app/templates',
-                static_folder='app/static')
-    app.config.from_object(config_class)
+    profile = StartupProfile()
+    profile.add('imports', _IMPORT_SECONDS)
+    
+    with profile.phase('flask'):
+        app = Flask(__name__, 
+                    template_folder='app/templates',
+                    static_folder='app/static')
+        app.config.from_object(config_class)
     
     # セキュリティ設定
-    _configure_security(app, config_class)
+    with profile.phase('security'):
+        _configure_security(app, config_class)
     
-    # データベース初期化
-    db_manager = _init_database(config_class)
+    # データベース初期化（スキーマが最新ならバージョン確認のみ）
+    with profile.phase('database'):
+        db_manager = _init_database(config_class)
     
     # アプリケーションコンテキスト設定
-    app.db_manager = db_manager
-    app.question_manager = QuestionManager(db_manager)
-    app.config['ADMIN_PASSWORD'] = config_class.ADMIN_PASSWORD
-    
-    # 認証システム初期化
-    init_auth_routes(app, db_manager)
+    with profile.phase('services'):
+        app.db_manager = db_manager
+        app.question_manager = QuestionManager(
+            db_manager,
+            import_chunk_size=config_class.IMPORT_CHUNK_SIZE,
+            import_processes=config_class.IMPORT_PROCESSES,
+            item_stats_interval=config_class.ITEM_STATS_RELOAD_INTERVAL
+        )
+        app.import_jobs = ImportJobManager(db_manager, max_workers=config_class.IMPORT_WORKERS)
+        # 停止したワーカーが残した未完了の取り込みジョブを失敗にする
+        try:
+            app.import_jobs.recover_abandoned()
+        except Exception as e:
+            app.logger.warning(f"取り込みジョブの回収に失敗しました: {e}")
+        # 初回の表示（sync）で user_stats から構築する
+        app.leaderboard = Leaderboard(sync_interval=config_class.LEADERBOARD_SYNC_INTERVAL)
+        # 苦手分野を重視した出題（無効な場合は None で一様に出題する）
+        app.question_sampler = WeakAreaSampler(
+            db_manager,
+            app.question_manager,
+            max_users=config_class.WEAK_SAMPLER_MAX_USERS,
+            ttl=config_class.WEAK_SAMPLER_TTL
+        ) if config_class.WEAK_AREA_SAMPLING else None
+        app.config['ADMIN_PASSWORD'] = config_class.ADMIN_PASSWORD
     
-    # ルーティング登録
-    _register_blueprints(app)
+    # 問題ごとの解答統計を読み込んでおく（preload_app ではフォーク前に1度だけ。
+    # 以降は各ワーカーがバックグラウンドで前回以降に更新された問題だけを読み直す）
+    with profile.phase('item_stats'):
+        app.question_manager.item_stats.refresh(db_manager)
     
-    # Auth endpoint aliases
-    _register_auth_aliases(app)
+    with profile.phase('routes'):
+        # 認証システム初期化
+        init_auth_routes(app, db_manager)
+        
+        # ルーティング登録
+        _register_blueprints(app)
+        
+        # Auth endpoint aliases
+        _register_auth_aliases(app)
     
     # 必要なディレクトリ作成
-    _create_directories()
+    with profile.phase('directories'):
+        _create_directories()
     
+    app.startup_profile = profile
     return app
 
 
@@ -63,6 +110,12 @@ def _configure_security(app, config_class):
         else:
             raise ValueError("セキュリティエラー: ADMIN_PASSWORD環境変数が設定されていません。")
     
+    # リバースプロキシの背後では X-Forwarded-For からクライアントのIPアドレスを求める
+    # （ログインの流量制御がプロキシのIPアドレス1つに集約されないようにする）
+    if config_class.TRUSTED_PROXIES > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config_class.TRUSTED_PROXIES,
+                                x_proto=config_class.TRUSTED_PROXIES)
+    
     # セッション設定
     app.config.update(
         SESSION_COOKIE_SECURE=not config_class.DEBUG,
@@ -133,7 +186,11 @@ def _create_directories():
 
 
 def load_initial_questions(app):
-    """初期問題データ読み込み"""
+    """
+    初期問題データ読み込み（問題が1問も無いときだけ）
+
+    開発サーバーと本番（wsgi.create_app）の起動時に呼び、新しいDBでも問題が空にならないようにする。
+    """
     with app.app_context():
         try:
             json_folder = 'json_questions'
@@ -141,11 +198,9 @@ def load_initial_questions(app):
                 app.logger.info("JSON問題フォルダが見つかりません。スキップします。")
                 return
 
-            existing_count = app.db_manager.execute_query('SELECT COUNT(*) as count FROM questions')
-            existing_total = existing_count[0]['count'] if existing_count else 0
-            
-            if existing_total > 0:
-                app.logger.info(f"データベースに既に {existing_total}問の問題が登録されています。")
+            # 1行あるかだけを見る（ワーカーの起動のたびに呼ばれるので件数は数えない）
+            if app.db_manager.execute_query('SELECT id FROM questions LIMIT 1'):
+                app.logger.info("データベースに問題が登録済みです。初期問題データの読み込みをスキップします。")
                 return
                 
             app.logger.info("JSON問題ファイルを読み込み中...")
@@ -156,8 +211,8 @@ def load_initial_questions(app):
 
 
 def _process_json_files(app, json_folder):
-    """JSONファイル処理"""
-    import json
+    """JSONファイル処理（配列要素を逐次読み込み、チャンク単位で保存）"""
+    from app.utils.json_stream import iter_json_array
     
     loaded_files = []
     total_questions = 0
@@ -167,17 +222,23 @@ def _process_json_files(app, json_folder):
             continue
             
         json_filepath = os.path.join(json_folder, filename)
+        
+        def report_progress(rows, saved_count, filename=filename):
+            app.logger.info(f"   📄 {filename}: {rows}行処理 / {saved_count}問保存")
+        
         try:
+            app.logger.info(f"   📄 {filename}: 読み込み中...")
             with open(json_filepath, 'r', encoding='utf-8') as json_file:
-                questions = json.load(json_file)
-            
-            app.logger.info(f"   📄 {filename}: {len(questions)}問を読み込み中...")
-            result = app.question_manager.save_questions(questions, filename)
+                result = app.question_manager.save_questions(
+                    iter_json_array(json_file),
+                    filename,
+                    progress_callback=report_progress
+                )
             
             if result['saved_count'] > 0:
                 loaded_files.append({
                     'filename': filename,
-                    'file_questions': len(questions),
+                    'file_questions': result['total_count'],
                     'saved_count': result['saved_count']
                 })
                 total_questions += result['saved_count']
@@ -194,11 +255,112 @@ def _process_json_files(app, json_folder):
         app.logger.warning("JSONファイルの読み込みに失敗しました。")
 
 
-# アプリケーション作成
-app = create_app()
+def run_maintenance(app):
+    """
+    メンテナンス処理（初期問題データの読み込み・集計テーブルの再構築・カタログのスナップショット作成）
 
-if __name__ == '__main__':
-    # 初期データ読み込み
+    起動を遅くしないようワーカーの起動時には行わず、デプロイ時に
+    python app.py --maintenance として1度だけ実行する。
+    """
+    load_initial_questions(app)
+    with app.app_context():
+        app.logger.info("user_stats を再構築中...")
+        app.db_manager.rebuild_user_stats()
+        app.db_manager.rebuild_daily_stats()
+        app.db_manager.rebuild_genre_stats()
+        app.db_manager.rebuild_question_stats()
+        app.db_manager.rebuild_review_items()
+        app.db_manager.rebuild_mistakes()
+        app.db_manager.rebuild_coverage()
+        app.db_manager.rebuild_item_stats()
+        app.db_manager.recount_counters()
+        
+        # ワーカーが起動時にDBを読まずに済むよう、カタログのスナップショットを用意しておく
+        snapshot_path = app.config.get('CATALOG_SNAPSHOT_PATH')
+        if app.config.get('QUESTION_CATALOG') and snapshot_path:
+            catalog = app.question_manager.enable_catalog(snapshot_path=snapshot_path)
+            app.logger.info(f"問題カタログのスナップショット: {snapshot_path}（{len(catalog)}問）")
+
+
+def run_irt_calibration(app, model):
+    """
+    回答履歴から IRT の問題パラメータ（難易度・識別力）とユーザーの能力値を推定して保存する
+
+    時間のかかるオフライン処理なので、python app.py --calibrate-irt として定期的に実行する（NumPy が必要）。
+    """
+    from app.services import irt
+    with app.app_context():
+        app.logger.info(f"IRT（{model.upper()}）の推定を開始します...")
+        try:
+            result = irt.calibrate(app.db_manager, model=model)
+        except RuntimeError as e:
+            app.logger.error(str(e))
+            raise SystemExit(1)
+        app.logger.info(
+            f"IRT の推定が完了しました: 回答 {result['responses']}件、問題 {result['questions']}問、"
+            f"ユーザー {result['users']}人、反復 {result['iterations']}回"
+            f"{'' if result['converged'] else '（未収束）'}、{result['seconds']:.1f}秒"
+        )
+
+
+def profile_startup():
+    """起動処理の段階ごとの所要時間と、時間のかかった関数の一覧を表示"""
+    import cProfile
+    import io
+    import pstats
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    app = create_app()
+    if app.config.get('QUESTION_CATALOG'):
+        with app.startup_profile.phase('catalog'):
+            app.question_manager.enable_catalog(snapshot_path=app.config.get('CATALOG_SNAPSHOT_PATH') or None)
+    profiler.disable()
+    
+    print(app.startup_profile.report())
+    print()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+    print(stream.getvalue())
+    print("モジュール読み込みの内訳は python -X importtime app.py --profile-startup で確認できます。")
+
+
+def __getattr__(name):
+    """モジュール属性 app は初回参照時に生成する（import しただけではDBに接続しない）"""
+    if name == 'app':
+        application = create_app()
+        globals()['app'] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基本情報技術者試験 学習アプリ')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='起動処理の所要時間の内訳を表示して終了する')
+    parser.add_argument('--maintenance', action='store_true',
+                        help='初期問題データの読み込みと集計テーブルの再構築を行って終了する')
+    parser.add_argument('--calibrate-irt', action='store_true',
+                        help='回答履歴から IRT の問題パラメータとユーザーの能力値を推定して終了する（NumPy が必要）')
+    parser.add_argument('--irt-model', choices=('1pl', '2pl'), default='2pl',
+                        help='--calibrate-irt で使うモデル（既定: 2pl）')
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        profile_startup()
+        return
+    
+    app = create_app()
+    
+    if args.maintenance:
+        run_maintenance(app)
+        return
+    
+    if args.calibrate_irt:
+        run_irt_calibration(app, args.irt_model)
+        return
+    
+    # 開発サーバー: 空のDBなら初期データを読み込む
     load_initial_questions(app)
     
     # アプリケーション起動
@@ -207,4 +369,8 @@ if __name__ == '__main__':
     app.logger.info(f"💾 Database: {Config.DATABASE_TYPE.upper()}")
     app.logger.info(f"🔒 Cookie Secure: {'ON (HTTPS必須)' if not Config.DEBUG else 'OFF (開発環境)'}")
     
-    app.run(debug=Config.DEBUG, host=Config.HOST, port=Config.PORT)
\ No newline at end of file
+    app.run(debug=Config.DEBUG, host=Config.HOST, port=Config.PORT)
+
+
+if __name__ == '__main__':
+    main()
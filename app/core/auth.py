@@ -1,7 +1,9 @@
-from flask import render_template, request, redirect, url_for, session, flash
-from werkzeug.security import check_password_hash, generate_password_hash
+import math
+
+from flask import render_template, request, redirect, url_for, session, flash, make_response
 from functools import wraps
 from .config import Config
+from .passwords import hash_password, rehash_if_needed
 
 
 def login_required(f):
@@ -26,8 +28,19 @@ def admin_required(f):
     return decorated_function
 
 
+def _too_many_login_attempts(retry_after):
+    """ログイン試行の制限時のレスポンス（パスワード検証を行わずにすぐ返す）"""
+    flash('ログインの試行が多すぎます。しばらく待ってから再度お試しください。', 'error')
+    response = make_response(render_template('auth/login.html'), 429)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
 def init_auth_routes(app, db_manager):
     """認証ルートの初期化"""
+    from app.services.login_guard import LoginGuard, LoginBusy
+    
+    app.login_guard = LoginGuard.from_config(app.config, db_manager)
     
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -44,6 +57,11 @@ def init_auth_routes(app, db_manager):
                 flash('ユーザー名とパスワードを入力してください。', 'error')
                 return render_template('auth/login.html')
             
+            # IPアドレス・ユーザー名ごとの試行回数制限（管理者ログインも対象）
+            retry_after = app.login_guard.check_rate(request.remote_addr, username)
+            if retry_after:
+                return _too_many_login_attempts(retry_after)
+            
             # 管理者ログイン確認
             if username == Config.ADMIN_USERNAME and password == Config.ADMIN_PASSWORD:
                 session.permanent = True
@@ -58,7 +76,15 @@ def init_auth_routes(app, db_manager):
                 (username,)
             )
             
-            if users and check_password_hash(users[0]['password_hash'], password):
+            try:
+                password_ok = bool(users) and app.login_guard.verify_password(users[0]['password_hash'], password)
+            except LoginBusy:
+                app.logger.warning("パスワード検証の待ち行列が一杯のためログインを拒否しました")
+                return _too_many_login_attempts(1)
+            
+            if password_ok:
+                _upgrade_password_hash(users[0], password)
+                
                 from markupsafe import escape
                 session.permanent = True
                 session['user_id'] = users[0]['id']
@@ -70,6 +96,26 @@ def init_auth_routes(app, db_manager):
                 
         return render_template('auth/login.html')
     
+    def _upgrade_password_hash(user, password):
+        """保存済みハッシュの方式・コストが設定と異なれば作り直す（混雑時は次回に回す）"""
+        try:
+            new_hash = app.login_guard.run(
+                rehash_if_needed, user['password_hash'], password,
+                app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_SALT_LENGTH']
+            )
+        except LoginBusy:
+            return
+        if not new_hash:
+            return
+        try:
+            # 同時に別のログインで更新済みなら上書きしない
+            db_manager.execute_query(
+                'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                (new_hash, user['id'], user['password_hash'])
+            )
+        except Exception as e:
+            app.logger.error(f"パスワードハッシュ更新エラー: {e}")
+    
     @app.route('/register', methods=['GET', 'POST'])
     def register():
         if request.method == 'POST':
@@ -107,13 +153,28 @@ def init_auth_routes(app, db_manager):
                 flash('そのユーザー名は既に使用されています。', 'error')
                 return render_template('auth/register.html')
             
-            # ユーザー作成
-            password_hash = generate_password_hash(password)
+            # ユーザー作成（ハッシュ化もログインと同じ上限付きスレッドプールで行う）
             try:
-                db_manager.execute_query(
-                    'INSERT INTO users (username, password_hash) VALUES (?, ?)',
-                    (username, password_hash)
+                password_hash = app.login_guard.run(
+                    hash_password, password,
+                    app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_SALT_LENGTH']
                 )
+            except LoginBusy:
+                flash('混雑しています。しばらく待ってから再度お試しください。', 'error')
+                response = make_response(render_template('auth/register.html'), 429)
+                response.headers['Retry-After'] = '1'
+                return response
+            try:
+                # ユーザー・空の集計行（管理画面の統計での並べ替えに最初から含めるため）・
+                # ユーザー数カウンターを同じトランザクションで作成する
+                with db_manager.transaction() as tx:
+                    tx.execute(
+                        'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                        (username, password_hash)
+                    )
+                    created = tx.execute('SELECT id FROM users WHERE username = ?', (username,))
+                    db_manager.ensure_user_stats_row(created[0]['id'], tx=tx)
+                    db_manager.increment_counter('users', 1, tx=tx)
                 flash('アカウントが作成されました。ログインしてください。', 'success')
                 return redirect(url_for('login'))
             except Exception as e:
@@ -67,6 +67,72 @@ class Config:
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD')
 
+    # Password hashing
+    # Werkzeug の method 文字列（例: pbkdf2:sha256:600000, scrypt:32768:8:1）。
+    # 保存済みのハッシュと異なる場合はログイン成功時に作り直す
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+
+    # Login rate limiting
+    # memory: ワーカーごとに制限 / database: rate_limit_buckets テーブルで全ワーカー共通に制限
+    LOGIN_RATE_LIMIT_BACKEND = os.environ.get('LOGIN_RATE_LIMIT_BACKEND', 'memory')
+    # IPアドレスごと（教室などで同じIPから一斉にログインしても通る程度に緩め）
+    LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST', 30))
+    LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE', 60))
+    # ユーザー名ごと（パスワード総当たり対策）
+    LOGIN_USER_BURST = int(os.environ.get('LOGIN_USER_BURST', 5))
+    LOGIN_USER_PER_MINUTE = float(os.environ.get('LOGIN_USER_PER_MINUTE', 5))
+    # アプリの前段にあるリバースプロキシ（ロードバランサー等）の段数。
+    # 1以上なら X-Forwarded-For / X-Forwarded-Proto のその段数分を信頼してクライアントのIPアドレスを決める
+    # （0: プロキシなし。プロキシが無いのに設定するとIPアドレスを偽装できてしまう）
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # パスワード検証を並列に実行するスレッド数と待ち行列の長さ（超えたら429）
+    PASSWORD_CHECK_WORKERS = int(os.environ.get('PASSWORD_CHECK_WORKERS', 2))
+    PASSWORD_CHECK_QUEUE = int(os.environ.get('PASSWORD_CHECK_QUEUE', 8))
+    PASSWORD_CHECK_TIMEOUT = float(os.environ.get('PASSWORD_CHECK_TIMEOUT', 10))
+
+    # Import settings
+    # 問題データ取り込み時に1トランザクションで書き込む件数
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+    # 取り込み時の検証・正規化・ハッシュ計算を並列に行うプロセス数
+    # （既定は1: Webワーカー内で処理する。大量の取り込みを行う環境でのみ増やす）
+    IMPORT_PROCESSES = int(os.environ.get('IMPORT_PROCESSES', 1))
+    # ZIPアップロードの上限（展開後サイズ・エントリ数・圧縮率でZIP爆弾を防ぐ）
+    ZIP_MAX_ENTRIES = int(os.environ.get('ZIP_MAX_ENTRIES', 5000))
+    ZIP_MAX_TOTAL_SIZE = int(os.environ.get('ZIP_MAX_TOTAL_SIZE', 512 * 1024 * 1024))
+    ZIP_MAX_MEMBER_SIZE = int(os.environ.get('ZIP_MAX_MEMBER_SIZE', 128 * 1024 * 1024))
+    ZIP_MAX_COMPRESSION_RATIO = int(os.environ.get('ZIP_MAX_COMPRESSION_RATIO', 200))
+    # バックグラウンド取り込みジョブのスレッド数
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+
+    # Question catalog settings
+    # 本番エントリポイント（wsgi.py）で全問題をメモリ上のカタログに載せるか
+    QUESTION_CATALOG = os.environ.get('QUESTION_CATALOG', 'True').lower() == 'true'
+    # 他プロセスでの問題の更新を確認する間隔（秒）
+    CATALOG_CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', 5))
+    # カタログのスナップショットファイル（空文字で無効。DBのカタログバージョンと一致すれば起動時にDBを読まない）
+    CATALOG_SNAPSHOT_PATH = os.environ.get(
+        'CATALOG_SNAPSHOT_PATH', os.path.join(PROJECT_ROOT, 'cache', 'question_catalog.bin')
+    )
+
+    # Ranking
+    # 他のワーカーでの解答をランキングに取り込む間隔（秒）
+    LEADERBOARD_SYNC_INTERVAL = float(os.environ.get('LEADERBOARD_SYNC_INTERVAL', 5))
+
+    # Practice
+    # 苦手な分野・問題ほど多く出題する（False なら一様にランダム）
+    WEAK_AREA_SAMPLING = os.environ.get('WEAK_AREA_SAMPLING', 'True').lower() == 'true'
+    # 出題の重みをメモリに保持するユーザー数と、他のワーカーでの解答を取り込む間隔（秒）
+    WEAK_SAMPLER_MAX_USERS = int(os.environ.get('WEAK_SAMPLER_MAX_USERS', 1000))
+    WEAK_SAMPLER_TTL = float(os.environ.get('WEAK_SAMPLER_TTL', 300))
+    # 問題ごとの解答統計（正答率・選択率）について、他のワーカーでの解答を取り込む間隔（秒）
+    # （前回以降に更新された問題だけをバックグラウンドで読み直す）
+    ITEM_STATS_RELOAD_INTERVAL = float(os.environ.get('ITEM_STATS_RELOAD_INTERVAL', 60))
+
+    # Mock exam
+    # 1回の模擬試験でセッション（Cookie）に保持する問題数の上限（超えた分は出題せず画面に表示する。0で無制限）
+    EXAM_MAX_QUESTIONS = int(os.environ.get('EXAM_MAX_QUESTIONS', 200))
+
     # Server settings
     PORT = int(os.environ.get('PORT', 5002))
     HOST = os.environ.get('HOST', '0.0.0.0')
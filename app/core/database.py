@@ -2,7 +2,10 @@ import os
 import sqlite3
 import json
 import logging
+import random
 import re
+import time
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
 
@@ -46,30 +49,72 @@ def validate_image_url(image_url):
         
     return True, None
 
-# MySQLライブラリのインポート（エラー時はSQLiteのみ使用）
-try:
-    import pymysql
-    pymysql.install_as_MySQLdb()
-    MYSQL_AVAILABLE = True
-except ImportError:
-    MYSQL_AVAILABLE = False
-    print("Warning: pymysql not available. MySQL support disabled.")
+_pymysql = None
+
+
+def _load_pymysql():
+    """
+    pymysqlを初回使用時に読み込む（SQLite構成では読み込まない）
+
+    Returns:
+        pymysqlモジュール（利用できない場合はNone）
+    """
+    global _pymysql
+    if _pymysql is None:
+        try:
+            import pymysql
+            pymysql.install_as_MySQLdb()
+            _pymysql = pymysql
+        except ImportError:
+            _pymysql = False
+            print("Warning: pymysql not available. MySQL support disabled.")
+    return _pymysql or None
+
 
 logger = logging.getLogger(__name__)
 
+
+class _Transaction:
+    """DatabaseManager.transaction() の中でクエリを実行するためのオブジェクト"""
+
+    def __init__(self, db_manager, conn):
+        self.db_manager = db_manager
+        self.db_type = db_manager.db_type
+        self._conn = conn
+
+    def execute(self, query, params=None):
+        """クエリを実行する（execute_query と同じ戻り値。コミットはブロックの終わりで行う）"""
+        return self.db_manager._execute_on(self._conn, query, params or ())
+
+    def iter_query(self, query, params=None, batch_size=500):
+        """
+        SELECTの結果を1行ずつ返す（iter_query と同じ。トランザクションの中で読む）
+
+        MySQLでは読み終えるまで同じトランザクションで他のクエリを実行できない。
+        """
+        return self.db_manager._iter_on(self._conn, query, params or (), batch_size)
+
+
 class DatabaseManager:
+    # テーブル・カラム・インデックス・件数カウンターを追加・変更したら1つ上げる（起動時のスキーマ確認を省略するため）
+    SCHEMA_VERSION = 20
+
     def __init__(self, config):
         self.db_type = config.DATABASE_TYPE
         self.config = config
+        self._pymysql = None
         
         # MySQLが利用できない場合はSQLiteにフォールバック
-        if self.db_type == 'mysql' and not MYSQL_AVAILABLE:
-            print("MySQL requested but pymysql not available. Falling back to SQLite.")
-            self.db_type = 'sqlite'
-            config.DATABASE_TYPE = 'sqlite'
+        if self.db_type == 'mysql':
+            self._pymysql = _load_pymysql()
+            if self._pymysql is None:
+                print("MySQL requested but pymysql not available. Falling back to SQLite.")
+                self.db_type = 'sqlite'
+                config.DATABASE_TYPE = 'sqlite'
         
     def get_connection(self):
-        if self.db_type == 'mysql' and MYSQL_AVAILABLE:
+        if self.db_type == 'mysql':
+            pymysql = self._pymysql
             conn = pymysql.connect(
                 host=self.config.DB_HOST,
                 database=self.config.DB_NAME,
@@ -100,7 +145,7 @@ class DatabaseManager:
         logger.debug(f"DB Type: {self.db_type}")
         
         # MySQL用にパラメータプレースホルダーを変換
-        if self.db_type == 'mysql' and MYSQL_AVAILABLE:
+        if self.db_type == 'mysql':
             # SQLiteの?形式をMySQLの%s形式に変換
             query = query.replace('?', '%s')
             
@@ -109,23 +154,9 @@ class DatabaseManager:
         
         conn = self.get_connection()
         try:
-            if self.db_type == 'mysql' and MYSQL_AVAILABLE:
-                with conn.cursor() as cur:
-                    cur.execute(query, converted_params)
-                    if query.strip().upper().startswith(('SELECT', 'WITH', 'SHOW', 'DESCRIBE')):
-                        result = cur.fetchall()
-                    else:
-                        result = cur.rowcount
-                        conn.commit()
-            else:
-                cur = conn.cursor()
-                cur.execute(original_query, converted_params)
-                if original_query.strip().upper().startswith(('SELECT', 'WITH')):
-                    result = [dict(row) for row in cur.fetchall()]
-                else:
-                    result = cur.rowcount
-                    conn.commit()
-                cur.close()
+            result = self._execute_on(conn, original_query, converted_params)
+            if isinstance(result, int):
+                conn.commit()
             return result
         except Exception as e:
             conn.rollback()
@@ -135,14 +166,159 @@ class DatabaseManager:
             raise e
         finally:
             conn.close()
-    
+
+    def _execute_on(self, conn, query, params):
+        """
+        指定した接続でクエリを1つ実行する（コミットはしない）
+
+        Returns:
+            SELECT等は行（dict）のリスト、それ以外は影響を受けた行数
+        """
+        if self.db_type == 'mysql':
+            with conn.cursor() as cur:
+                cur.execute(query.replace('?', '%s'), params)
+                if query.strip().upper().startswith(('SELECT', 'WITH', 'SHOW', 'DESCRIBE')):
+                    return cur.fetchall()
+                return cur.rowcount
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params)
+            if query.strip().upper().startswith(('SELECT', 'WITH', 'PRAGMA')):
+                return [dict(row) for row in cur.fetchall()]
+            return cur.rowcount
+        finally:
+            cur.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        複数のクエリを1つのトランザクションで実行する
+
+        with db_manager.transaction() as tx:
+            tx.execute('INSERT ...', params)
+            tx.execute('UPDATE ...', params)
+
+        ブロックを抜けるとコミットし、例外が発生した場合はロールバックする。
+        tx.execute の戻り値は execute_query と同じ。
+        """
+        conn = self.get_connection()
+        try:
+            yield _Transaction(self, conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def execute_many(self, query, params_seq):
+        """
+        同一クエリを複数パラメータで一括実行する（1接続・1トランザクション）
+        大量の行を書き込む際に行ごとの接続・コミットを避けるために使用
+        """
+        params_seq = list(params_seq)
+        if not params_seq:
+            return 0
+
+        is_mysql = self.db_type == 'mysql'
+        if is_mysql:
+            query = query.replace('?', '%s')
+
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.executemany(query, params_seq)
+            result = cur.rowcount
+            cur.close()
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Database error (executemany): {e}")
+            logger.error(f"Query: {query}")
+            raise e
+        finally:
+            conn.close()
+
+    def iter_query(self, query, params=None, batch_size=500):
+        """
+        SELECTの結果を1行ずつ返すジェネレーター（サーバーサイドカーソル）
+
+        MySQLでは結果をクライアントに溜め込まない SSDictCursor、SQLiteでは fetchmany で
+        batch_size 行ずつ読むので、行数に関わらずメモリ使用量は一定。
+        接続は読み終えたとき、またはジェネレーターが閉じられたときに閉じる。
+        """
+        conn = self.get_connection()
+        try:
+            yield from self._iter_on(conn, query, params or (), batch_size)
+        finally:
+            conn.close()
+
+    def _iter_on(self, conn, query, params, batch_size):
+        """指定した接続で SELECT の結果を batch_size 行ずつ読みながら1行ずつ返す"""
+        if self.db_type == 'mysql':
+            cur = conn.cursor(self._pymysql.cursors.SSDictCursor)
+            cur.execute(query.replace('?', '%s'), params)
+        else:
+            cur = conn.cursor()
+            cur.execute(query, params)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cur.close()
+
     def init_database(self):
-        if self.db_type == 'mysql' and MYSQL_AVAILABLE:
-            self._init_mysql()
+        """
+        テーブルを作成・移行する
+
+        app_meta に記録済みのスキーマバージョンが SCHEMA_VERSION と一致する場合は
+        バージョンの確認だけで終える。一致しない場合のみ CREATE TABLE・カラム追加を実行し、
+        既存データから集計テーブルを同期してからバージョンを記録する。
+
+        Returns:
+            スキーマの作成・移行を実行した場合True
+        """
+        if self.get_schema_version() == self.SCHEMA_VERSION:
+            return False
+
+        if self.db_type == 'mysql':
+            succeeded = self._init_mysql()
         else:
-            self._init_sqlite()
-        # 既存データから集計テーブルを同期
+            succeeded = self._init_sqlite()
+        # 既存データから集計テーブル・件数カウンターを同期
         self.rebuild_user_stats()
+        self.rebuild_daily_stats()
+        self.rebuild_genre_stats()
+        self.rebuild_question_stats()
+        self.rebuild_review_items()
+        self.rebuild_mistakes()
+        self.rebuild_coverage()
+        self.rebuild_item_stats()
+        self.recount_counters()
+
+        # DBごとの識別子（カタログのスナップショットが別のDBのものでないことの確認に使う）
+        if not self.get_meta('catalog_epoch'):
+            self.set_meta('catalog_epoch', random.getrandbits(62) or 1)
+
+        # 失敗したDDLがあれば次回の起動で再実行する
+        if succeeded:
+            self.set_meta('schema_version', self.SCHEMA_VERSION)
+        return True
+
+    def get_schema_version(self):
+        """記録済みのスキーマバージョンを取得（未初期化のDBでは0）"""
+        if self.db_type == 'mysql':
+            exists = self.execute_query("SHOW TABLES LIKE 'app_meta'")
+        else:
+            exists = self.execute_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'app_meta'"
+            )
+        return self.get_meta('schema_version') if exists else 0
     
     def _init_mysql(self):
         """MySQL用のテーブル作成"""
@@ -153,7 +329,8 @@ class DatabaseManager:
                 password_hash VARCHAR(255) NOT NULL,
                 is_admin BOOLEAN DEFAULT FALSE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_username (username)
+                INDEX idx_username (username),
+                INDEX idx_users_created_at (created_at)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
             
             """CREATE TABLE IF NOT EXISTS questions (
@@ -166,9 +343,12 @@ class DatabaseManager:
                 genre VARCHAR(100),
                 image_url VARCHAR(500),
                 choice_images JSON,
+                content_hash CHAR(64),
+                coverage_slot INT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 INDEX idx_genre (genre),
-                INDEX idx_question_id (question_id)
+                INDEX idx_question_id (question_id),
+                UNIQUE INDEX idx_questions_coverage_slot (coverage_slot)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
             
             """CREATE TABLE IF NOT EXISTS user_answers (
@@ -181,7 +361,8 @@ class DatabaseManager:
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
                 FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE,
                 INDEX idx_user_id (user_id),
-                INDEX idx_question_id (question_id)
+                INDEX idx_question_id (question_id),
+                INDEX idx_user_answers_user_answered (user_id, answered_at, id)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
 
             """CREATE TABLE IF NOT EXISTS user_stats (
@@ -191,18 +372,197 @@ class DatabaseManager:
                 correct_answers INT DEFAULT 0,
                 accuracy_rate DECIMAL(5,2) DEFAULT 0,
                 last_answered_at DATETIME NULL,
+                stats_version INT NOT NULL DEFAULT 0,
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
                 INDEX idx_accuracy_rate (accuracy_rate),
-                INDEX idx_total_answers (total_answers)
+                INDEX idx_total_answers (total_answers),
+                INDEX idx_user_stats_last_answered_at (last_answered_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_daily_stats (
+                user_id INT NOT NULL,
+                stat_date DATE NOT NULL,
+                genre VARCHAR(100) NOT NULL DEFAULT '',
+                attempts INT NOT NULL DEFAULT 0,
+                correct_answers INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, stat_date, genre),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                INDEX idx_user_daily_stats_date (stat_date),
+                INDEX idx_user_daily_stats_genre_date (genre, stat_date)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_genre_stats (
+                user_id INT NOT NULL,
+                genre VARCHAR(100) NOT NULL DEFAULT '',
+                attempts INT NOT NULL DEFAULT 0,
+                correct_answers INT NOT NULL DEFAULT 0,
+                last_answered_at DATETIME NULL,
+                PRIMARY KEY (user_id, genre),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_question_stats (
+                user_id INT NOT NULL,
+                question_id INT NOT NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                wrong_answers INT NOT NULL DEFAULT 0,
+                last_answered_at DATETIME NULL,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS review_items (
+                user_id INT NOT NULL,
+                question_id INT NOT NULL,
+                repetitions INT NOT NULL DEFAULT 0,
+                interval_days DOUBLE NOT NULL DEFAULT 0,
+                ease_factor DOUBLE NOT NULL DEFAULT 2.5,
+                due_at DATETIME NOT NULL,
+                last_reviewed_at DATETIME NULL,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE,
+                INDEX idx_review_items_user_due (user_id, due_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_mistakes (
+                user_id INT NOT NULL,
+                question_id INT NOT NULL,
+                miss_count INT NOT NULL DEFAULT 1,
+                missed_at DATETIME NOT NULL,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE,
+                INDEX idx_user_mistakes_user_missed (user_id, missed_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_coverage (
+                user_id INT PRIMARY KEY,
+                bits BLOB NOT NULL,
+                updated_at DATETIME NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS question_stats (
+                question_id INT PRIMARY KEY,
+                attempts INT NOT NULL DEFAULT 0,
+                correct_answers INT NOT NULL DEFAULT 0,
+                accuracy_rate DOUBLE NOT NULL DEFAULT 0,
+                updated_at DATETIME NULL,
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE,
+                INDEX idx_question_stats_accuracy (accuracy_rate),
+                INDEX idx_question_stats_updated_at (updated_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS question_choice_stats (
+                question_id INT NOT NULL,
+                choice VARCHAR(20) NOT NULL,
+                answers INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (question_id, choice),
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS question_irt (
+                question_id INT PRIMARY KEY,
+                difficulty DOUBLE NOT NULL,
+                discrimination DOUBLE NOT NULL DEFAULT 1,
+                responses INT NOT NULL DEFAULT 0,
+                model VARCHAR(10) NOT NULL,
+                calibrated_at DATETIME NOT NULL,
+                FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS user_ability (
+                user_id INT PRIMARY KEY,
+                ability DOUBLE NOT NULL,
+                responses INT NOT NULL DEFAULT 0,
+                model VARCHAR(10) NOT NULL,
+                calibrated_at DATETIME NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS import_jobs (
+                id VARCHAR(32) PRIMARY KEY,
+                filename VARCHAR(255),
+                exam_key VARCHAR(100),
+                state VARCHAR(20) NOT NULL,
+                rows_processed INT DEFAULT 0,
+                saved_count INT DEFAULT 0,
+                unchanged_count INT DEFAULT 0,
+                images_count INT DEFAULT 0,
+                errors TEXT,
+                created_at DATETIME NOT NULL,
+                started_at DATETIME NULL,
+                finished_at DATETIME NULL,
+                owner VARCHAR(32) NULL,
+                heartbeat_at DATETIME NULL,
+                INDEX idx_import_jobs_exam_state (exam_key, state),
+                INDEX idx_import_jobs_created_at (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            # 試験（exam_key）ごとの取り込みジョブの確保を直列化するロック行
+            """CREATE TABLE IF NOT EXISTS import_job_locks (
+                exam_key VARCHAR(100) PRIMARY KEY
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS app_meta (
+                meta_key VARCHAR(64) PRIMARY KEY,
+                meta_value BIGINT NOT NULL DEFAULT 0
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+
+            """CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                bucket_key VARCHAR(255) PRIMARY KEY,
+                tokens DOUBLE NOT NULL,
+                updated_at DOUBLE NOT NULL,
+                INDEX idx_rate_limit_buckets_updated_at (updated_at)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
         ]
         
+        succeeded = True
         for query in queries:
             try:
                 self.execute_query(query)
                 logger.info(f"MySQL table created/verified successfully")
             except Exception as e:
                 logger.error(f"Error creating MySQL table: {e}")
+                succeeded = False
+        
+        # 既存のquestionsテーブルにcontent_hashカラムを追加（存在しない場合のみ）
+        try:
+            if not self.execute_query("SHOW COLUMNS FROM questions LIKE 'content_hash'"):
+                self.execute_query("ALTER TABLE questions ADD COLUMN content_hash CHAR(64)")
+                logger.info("Added content_hash column to questions table")
+            # 解答済みの問題のビットセットでの問題の位置（詰めて振った番号）
+            if not self.execute_query("SHOW COLUMNS FROM questions LIKE 'coverage_slot'"):
+                self.execute_query("ALTER TABLE questions ADD COLUMN coverage_slot INT NULL")
+                self.execute_query("CREATE UNIQUE INDEX idx_questions_coverage_slot ON questions (coverage_slot)")
+                logger.info("Added coverage_slot column to questions table")
+            # 統計の変更ごとに増えるバージョン（/api/stats の ETag に使う）
+            if not self.execute_query("SHOW COLUMNS FROM user_stats LIKE 'stats_version'"):
+                self.execute_query("ALTER TABLE user_stats ADD COLUMN stats_version INT NOT NULL DEFAULT 0")
+                logger.info("Added stats_version column to user_stats table")
+            # 取り込みジョブを実行しているワーカーと生存確認の時刻（停止したワーカーのジョブの回収用）
+            for column, definition in (('owner', 'VARCHAR(32) NULL'), ('heartbeat_at', 'DATETIME NULL')):
+                if not self.execute_query(f"SHOW COLUMNS FROM import_jobs LIKE '{column}'"):
+                    self.execute_query(f"ALTER TABLE import_jobs ADD COLUMN {column} {definition}")
+                    logger.info(f"Added {column} column to import_jobs table")
+            # 既存のテーブルに後から追加したインデックス
+            # （学習履歴のキーセットページング、管理画面のユーザー一覧の並べ替え）
+            for table, index_name, columns in (
+                ('user_answers', 'idx_user_answers_user_answered', 'user_id, answered_at, id'),
+                ('users', 'idx_users_created_at', 'created_at'),
+                ('user_stats', 'idx_user_stats_last_answered_at', 'last_answered_at'),
+                ('question_stats', 'idx_question_stats_updated_at', 'updated_at'),
+            ):
+                if not self.execute_query(f"SHOW INDEX FROM {table} WHERE Key_name = '{index_name}'"):
+                    self.execute_query(f"CREATE INDEX {index_name} ON {table} ({columns})")
+                    logger.info(f"Added {index_name} index to {table} table")
+        except Exception as e:
+            logger.warning(f"MySQL alter table warning (non-fatal): {e}")
+            succeeded = False
+        
+        return succeeded
     
     def _init_sqlite(self):
         queries = [
@@ -223,6 +583,8 @@ class DatabaseManager:
                 genre TEXT,
                 image_url TEXT,
                 choice_images TEXT,
+                content_hash TEXT,
+                coverage_slot INTEGER,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )""",
             """CREATE TABLE IF NOT EXISTS user_answers (
@@ -242,15 +604,154 @@ class DatabaseManager:
                 correct_answers INTEGER DEFAULT 0,
                 accuracy_rate REAL DEFAULT 0,
                 last_answered_at DATETIME,
+                stats_version INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS user_daily_stats (
+                user_id INTEGER NOT NULL,
+                stat_date DATE NOT NULL,
+                genre TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct_answers INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, stat_date, genre),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )""",
+            # 期間・ジャンル別ランキングの範囲集計用
+            "CREATE INDEX IF NOT EXISTS idx_user_daily_stats_date ON user_daily_stats (stat_date)",
+            "CREATE INDEX IF NOT EXISTS idx_user_daily_stats_genre_date ON user_daily_stats (genre, stat_date)",
+            """CREATE TABLE IF NOT EXISTS user_genre_stats (
+                user_id INTEGER NOT NULL,
+                genre TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct_answers INTEGER NOT NULL DEFAULT 0,
+                last_answered_at DATETIME,
+                PRIMARY KEY (user_id, genre),
                 FOREIGN KEY (user_id) REFERENCES users (id)
-            )"""
+            )""",
+            """CREATE TABLE IF NOT EXISTS user_question_stats (
+                user_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                wrong_answers INTEGER NOT NULL DEFAULT 0,
+                last_answered_at DATETIME,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS review_items (
+                user_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                repetitions INTEGER NOT NULL DEFAULT 0,
+                interval_days REAL NOT NULL DEFAULT 0,
+                ease_factor REAL NOT NULL DEFAULT 2.5,
+                due_at DATETIME NOT NULL,
+                last_reviewed_at DATETIME,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            # 復習モードで期限の来た問題を古い順に取り出す
+            "CREATE INDEX IF NOT EXISTS idx_review_items_user_due ON review_items (user_id, due_at)",
+            """CREATE TABLE IF NOT EXISTS user_mistakes (
+                user_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                miss_count INTEGER NOT NULL DEFAULT 1,
+                missed_at DATETIME NOT NULL,
+                PRIMARY KEY (user_id, question_id),
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            # 間違えた問題の一覧を間違えた日時の順に読む
+            "CREATE INDEX IF NOT EXISTS idx_user_mistakes_user_missed ON user_mistakes (user_id, missed_at)",
+            """CREATE TABLE IF NOT EXISTS user_coverage (
+                user_id INTEGER PRIMARY KEY,
+                bits BLOB NOT NULL,
+                updated_at DATETIME,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS question_stats (
+                question_id INTEGER PRIMARY KEY,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                correct_answers INTEGER NOT NULL DEFAULT 0,
+                accuracy_rate REAL NOT NULL DEFAULT 0,
+                updated_at DATETIME,
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            # 管理画面で問題を難しい順（正答率の低い順）に読む
+            "CREATE INDEX IF NOT EXISTS idx_question_stats_accuracy ON question_stats (accuracy_rate)",
+            # 各ワーカーが前回の読み込み以降に更新された問題の統計だけを読み直す
+            "CREATE INDEX IF NOT EXISTS idx_question_stats_updated_at ON question_stats (updated_at)",
+            """CREATE TABLE IF NOT EXISTS question_choice_stats (
+                question_id INTEGER NOT NULL,
+                choice TEXT NOT NULL,
+                answers INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (question_id, choice),
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS question_irt (
+                question_id INTEGER PRIMARY KEY,
+                difficulty REAL NOT NULL,
+                discrimination REAL NOT NULL DEFAULT 1,
+                responses INTEGER NOT NULL DEFAULT 0,
+                model TEXT NOT NULL,
+                calibrated_at DATETIME NOT NULL,
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS user_ability (
+                user_id INTEGER PRIMARY KEY,
+                ability REAL NOT NULL,
+                responses INTEGER NOT NULL DEFAULT 0,
+                model TEXT NOT NULL,
+                calibrated_at DATETIME NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS import_jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT,
+                exam_key TEXT,
+                state TEXT NOT NULL,
+                rows_processed INTEGER DEFAULT 0,
+                saved_count INTEGER DEFAULT 0,
+                unchanged_count INTEGER DEFAULT 0,
+                images_count INTEGER DEFAULT 0,
+                errors TEXT,
+                created_at DATETIME NOT NULL,
+                started_at DATETIME,
+                finished_at DATETIME,
+                owner TEXT,
+                heartbeat_at DATETIME
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_import_jobs_exam_state ON import_jobs (exam_key, state)",
+            "CREATE INDEX IF NOT EXISTS idx_import_jobs_created_at ON import_jobs (created_at)",
+            """CREATE TABLE IF NOT EXISTS import_job_locks (
+                exam_key TEXT PRIMARY KEY
+            )""",
+            """CREATE TABLE IF NOT EXISTS app_meta (
+                meta_key TEXT PRIMARY KEY,
+                meta_value INTEGER NOT NULL DEFAULT 0
+            )""",
+            """CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at ON rate_limit_buckets (updated_at)",
+            # 学習履歴のキーセットページング用（user_id で絞り answered_at, id の降順に読む）
+            "CREATE INDEX IF NOT EXISTS idx_user_answers_user_answered ON user_answers (user_id, answered_at, id)",
+            # 管理画面のユーザー一覧の並べ替え用
+            "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_user_stats_total_answers ON user_stats (total_answers)",
+            "CREATE INDEX IF NOT EXISTS idx_user_stats_accuracy_rate ON user_stats (accuracy_rate)",
+            "CREATE INDEX IF NOT EXISTS idx_user_stats_last_answered_at ON user_stats (last_answered_at)"
         ]
         
+        succeeded = True
         for query in queries:
             try:
                 self.execute_query(query)
             except Exception as e:
                 logger.error(f"SQLite init error: {e}")
+                succeeded = False
         
         # 既存のテーブルにimage_urlカラムを追加（存在しない場合のみ）
         try:
@@ -273,138 +774,1102 @@ class DatabaseManager:
             if 'choice_images' not in column_names:
                 self.execute_query("ALTER TABLE questions ADD COLUMN choice_images TEXT")
                 logger.info("Added choice_images column to questions table")
+            
+            # content_hashカラムを追加（差分取り込み用）
+            if 'content_hash' not in column_names:
+                self.execute_query("ALTER TABLE questions ADD COLUMN content_hash TEXT")
+                logger.info("Added content_hash column to questions table")
+            
+            # 解答済みの問題のビットセットでの問題の位置（詰めて振った番号）
+            if 'coverage_slot' not in column_names:
+                self.execute_query("ALTER TABLE questions ADD COLUMN coverage_slot INTEGER")
+                logger.info("Added coverage_slot column to questions table")
+            self.execute_query(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_coverage_slot ON questions (coverage_slot)"
+            )
+            
+            # 統計の変更ごとに増えるバージョン（/api/stats の ETag に使う）
+            stats_columns = [row['name'] for row in self.execute_query("PRAGMA table_info(user_stats)") or []]
+            if 'stats_version' not in stats_columns:
+                self.execute_query("ALTER TABLE user_stats ADD COLUMN stats_version INTEGER NOT NULL DEFAULT 0")
+                logger.info("Added stats_version column to user_stats table")
+            
+            # 取り込みジョブを実行しているワーカーと生存確認の時刻（停止したワーカーのジョブの回収用）
+            job_columns = [row['name'] for row in self.execute_query("PRAGMA table_info(import_jobs)") or []]
+            for column, definition in (('owner', 'TEXT'), ('heartbeat_at', 'DATETIME')):
+                if column not in job_columns:
+                    self.execute_query(f"ALTER TABLE import_jobs ADD COLUMN {column} {definition}")
+                    logger.info(f"Added {column} column to import_jobs table")
                 
         except Exception as e:
             # ALTER TABLEエラーをより詳細にログ出力し、継続実行
             logger.warning(f"SQLite alter table warning (non-fatal): {e}")
             print(f"SQLite alter table error: {e}")
+            succeeded = False
+        
+        return succeeded
+
+    def get_meta(self, key, default=0):
+        """app_meta の値を取得"""
+        result = self.execute_query(
+            "SELECT meta_value FROM app_meta WHERE meta_key = ?", (key,)
+        )
+        return int(result[0]['meta_value']) if result else default
+
+    def set_meta(self, key, value, tx=None):
+        """app_meta に値を保存（tx を渡すとそのトランザクションの中で行う）"""
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, ?)
+                ON DUPLICATE KEY UPDATE meta_value = VALUES(meta_value)
+            """
+        else:
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, ?)
+                ON CONFLICT(meta_key) DO UPDATE SET meta_value = excluded.meta_value
+            """
+        (tx.execute if tx else self.execute_query)(query, (key, value))
+
+    # 管理画面に表示する件数（app_meta の counter:<名前> に保持し、追加・削除と同じトランザクションで増減する）
+    COUNTER_QUERIES = {
+        'users': 'SELECT COUNT(*) AS count FROM users',
+        'answers': 'SELECT COUNT(*) AS count FROM user_answers',
+        # 1問以上解答したユーザー数（最初の解答とユーザーの削除で増減する）
+        'active_users': 'SELECT COUNT(*) AS count FROM user_stats s JOIN users u ON u.id = s.user_id WHERE s.total_answers > 0',
+    }
+
+    def increment_counter(self, name, delta=1, tx=None):
+        """件数カウンターを増減する（tx を渡すとそのトランザクションの中で行う）"""
+        self.increment_meta(f'counter:{name}', delta, tx=tx)
+
+    def increment_meta(self, key, delta=1, tx=None):
+        """app_meta の値を増減する（tx を渡すとそのトランザクションの中で行う）"""
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, ?)
+                ON DUPLICATE KEY UPDATE meta_value = meta_value + VALUES(meta_value)
+            """
+        else:
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, ?)
+                ON CONFLICT(meta_key) DO UPDATE SET meta_value = meta_value + excluded.meta_value
+            """
+        (tx.execute if tx else self.execute_query)(query, (key, delta))
+
+    def recount_counters(self):
+        """
+        件数カウンターを実際の件数で上書きする
+
+        スキーマの移行時とメンテナンス処理（python app.py --maintenance）で行い、
+        増減の取りこぼしや、まだ作られていないカウンターを補正する。
+        """
+        for name, query in self.COUNTER_QUERIES.items():
+            try:
+                result = self.execute_query(query)
+                self.set_meta(f'counter:{name}', result[0]['count'] if result else 0)
+            except Exception as e:
+                logger.warning(f"Counter recount skipped for {name}: {e}")
 
-    def update_user_stats(self, user_id):
-        """指定ユーザーの集計結果をuser_statsに反映"""
+    def get_counters(self):
+        """
+        件数カウンターを1回のクエリで取得（保存済みの値を読むだけで、テーブルの件数は数えない）
+
+        Returns:
+            {'users': 件数, 'answers': 件数, 'active_users': 件数}
+        """
+        keys = [f'counter:{name}' for name in self.COUNTER_QUERIES]
+        placeholders = ', '.join(['?'] * len(keys))
+        rows = self.execute_query(
+            f"SELECT meta_key, meta_value FROM app_meta WHERE meta_key IN ({placeholders})", tuple(keys)
+        ) or []
+        values = {row['meta_key']: int(row['meta_value']) for row in rows}
+        return {name: max(values.get(f'counter:{name}', 0), 0) for name in self.COUNTER_QUERIES}
+
+    def get_catalog_version(self):
+        """問題カタログのバージョンを取得（問題が追加・変更・削除されるたびに増える）"""
+        return self.get_meta('catalog_version')
+
+    def bump_catalog_version(self):
+        """問題カタログのバージョンを1つ進める（追加された問題にはビットセットの位置を振る）"""
+        self.assign_coverage_slots()
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, 1)
+                ON DUPLICATE KEY UPDATE meta_value = meta_value + 1
+            """
+        else:
+            query = """
+                INSERT INTO app_meta (meta_key, meta_value) VALUES (?, 1)
+                ON CONFLICT(meta_key) DO UPDATE SET meta_value = meta_value + 1
+            """
+        self.execute_query(query, ('catalog_version',))
+        return self.get_catalog_version()
+
+    def record_user_answer(self, user_id, is_correct, answered_at, tx=None):
+        """
+        ユーザーの集計（user_stats）に1回答を加え、統計バージョンを進める
+        （tx を渡すとそのトランザクションの中で行う。回答履歴は集計しない）
+
+        最初の解答なら件数カウンター active_users も増やす。
+        """
+        correct = 1 if is_correct else 0
+        if self.db_type == 'mysql':
+            # ON DUPLICATE KEY UPDATE の代入は左から順に行われ、後の式は更新後の値を参照する
+            query = """
+                INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at, stats_version)
+                VALUES (?, 1, ?, ?, ?, 1)
+                ON DUPLICATE KEY UPDATE
+                    total_answers = total_answers + 1,
+                    correct_answers = correct_answers + VALUES(correct_answers),
+                    accuracy_rate = ROUND(correct_answers * 100.0 / total_answers, 1),
+                    last_answered_at = GREATEST(COALESCE(last_answered_at, VALUES(last_answered_at)), VALUES(last_answered_at)),
+                    stats_version = stats_version + 1
+            """
+        else:
+            query = """
+                INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at, stats_version)
+                VALUES (?, 1, ?, ?, ?, 1)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    total_answers = total_answers + 1,
+                    correct_answers = correct_answers + excluded.correct_answers,
+                    accuracy_rate = ROUND((correct_answers + excluded.correct_answers) * 100.0 / (total_answers + 1), 1),
+                    last_answered_at = MAX(COALESCE(last_answered_at, excluded.last_answered_at), excluded.last_answered_at),
+                    stats_version = stats_version + 1
+            """
+        execute = tx.execute if tx else self.execute_query
+        execute(query, (user_id, correct, correct * 100.0, answered_at))
+        # 最初の解答なら「1問以上解答したユーザー数」を増やす
+        rows = execute("SELECT total_answers FROM user_stats WHERE user_id = ?", (user_id,))
+        if rows and rows[0]['total_answers'] == 1:
+            self.increment_counter('active_users', 1, tx=tx)
+
+    def rebuild_user_stats(self):
+        """既存の回答履歴からuser_statsを再構築（全ユーザーを1文で集計）"""
+        select = """
+            SELECT
+                u.id,
+                COUNT(ua.id),
+                COALESCE(SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END), 0),
+                CASE WHEN COUNT(ua.id) > 0
+                     THEN ROUND(SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END) * 100.0 / COUNT(ua.id), 1)
+                     ELSE 0 END,
+                MAX(ua.answered_at),
+                1
+            FROM users u
+            LEFT JOIN user_answers ua ON ua.user_id = u.id
+            WHERE 1 = 1  -- SQLiteの INSERT ... SELECT ... ON CONFLICT の構文上の曖昧さを避ける
+            GROUP BY u.id
+        """
+        if self.db_type == 'mysql':
+            upsert = """
+                ON DUPLICATE KEY UPDATE
+                    total_answers = VALUES(total_answers),
+                    correct_answers = VALUES(correct_answers),
+                    accuracy_rate = VALUES(accuracy_rate),
+                    last_answered_at = VALUES(last_answered_at),
+                    stats_version = stats_version + 1
+            """
+        else:
+            upsert = """
+                ON CONFLICT(user_id) DO UPDATE SET
+                    total_answers = excluded.total_answers,
+                    correct_answers = excluded.correct_answers,
+                    accuracy_rate = excluded.accuracy_rate,
+                    last_answered_at = excluded.last_answered_at,
+                    stats_version = user_stats.stats_version + 1
+            """
         try:
-            stats = self.execute_query(
+            self.execute_query(
+                f"""
+                INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at, stats_version)
+                {select}
+                {upsert}
                 """
-                SELECT 
-                    COUNT(*) AS total_answers,
-                    SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct_answers,
-                    MAX(answered_at) AS last_answered_at
-                FROM user_answers
-                WHERE user_id = ?
-                """,
-                (user_id,)
             )
+        except Exception as e:
+            logger.warning(f"user_stats rebuild skipped: {e}")
+
+    def record_daily_answer(self, user_id, genre, is_correct, stat_date, tx=None):
+        """日別・ジャンル別の集計（user_daily_stats）に1回答を加える（tx を渡すとそのトランザクションの中で行う）"""
+        correct = 1 if is_correct else 0
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO user_daily_stats (user_id, stat_date, genre, attempts, correct_answers)
+                VALUES (?, ?, ?, 1, ?)
+                ON DUPLICATE KEY UPDATE
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + VALUES(correct_answers)
+            """
+        else:
+            query = """
+                INSERT INTO user_daily_stats (user_id, stat_date, genre, attempts, correct_answers)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(user_id, stat_date, genre) DO UPDATE SET
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + excluded.correct_answers
+            """
+        (tx.execute if tx else self.execute_query)(query, (user_id, str(stat_date), genre or '', correct))
+
+    def rebuild_daily_stats(self):
+        """既存の回答履歴から user_daily_stats を作り直す（全ユーザーを1文で集計）"""
+        try:
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM user_daily_stats")
+                tx.execute(
+                    """
+                    INSERT INTO user_daily_stats (user_id, stat_date, genre, attempts, correct_answers)
+                    SELECT
+                        ua.user_id,
+                        DATE(ua.answered_at),
+                        COALESCE(q.genre, ''),
+                        COUNT(*),
+                        SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END)
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    LEFT JOIN questions q ON q.id = ua.question_id
+                    WHERE ua.answered_at IS NOT NULL
+                    GROUP BY ua.user_id, DATE(ua.answered_at), COALESCE(q.genre, '')
+                    """
+                )
+        except Exception as e:
+            logger.warning(f"user_daily_stats rebuild skipped: {e}")
+
+    def record_genre_answer(self, user_id, genre, is_correct, answered_at, tx=None):
+        """ジャンル別の集計（user_genre_stats）に1回答を加える（tx を渡すとそのトランザクションの中で行う）"""
+        correct = 1 if is_correct else 0
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO user_genre_stats (user_id, genre, attempts, correct_answers, last_answered_at)
+                VALUES (?, ?, 1, ?, ?)
+                ON DUPLICATE KEY UPDATE
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + VALUES(correct_answers),
+                    last_answered_at = GREATEST(COALESCE(last_answered_at, VALUES(last_answered_at)), VALUES(last_answered_at))
+            """
+        else:
+            query = """
+                INSERT INTO user_genre_stats (user_id, genre, attempts, correct_answers, last_answered_at)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT(user_id, genre) DO UPDATE SET
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + excluded.correct_answers,
+                    last_answered_at = MAX(COALESCE(last_answered_at, excluded.last_answered_at), excluded.last_answered_at)
+            """
+        (tx.execute if tx else self.execute_query)(query, (user_id, genre or '', correct, answered_at))
+
+    def rebuild_genre_stats(self):
+        """既存の回答履歴から user_genre_stats を作り直す（全ユーザーを1文で集計）"""
+        try:
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM user_genre_stats")
+                tx.execute(
+                    """
+                    INSERT INTO user_genre_stats (user_id, genre, attempts, correct_answers, last_answered_at)
+                    SELECT
+                        ua.user_id,
+                        COALESCE(q.genre, ''),
+                        COUNT(*),
+                        SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END),
+                        MAX(ua.answered_at)
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    LEFT JOIN questions q ON q.id = ua.question_id
+                    GROUP BY ua.user_id, COALESCE(q.genre, '')
+                    """
+                )
+        except Exception as e:
+            logger.warning(f"user_genre_stats rebuild skipped: {e}")
+
+    def get_genre_stats(self, user_id):
+        """ユーザーのジャンル別集計（主キーの先頭 user_id で引くだけで回答履歴は集計しない）"""
+        return self.execute_query(
+            """
+            SELECT genre, attempts, correct_answers, last_answered_at
+            FROM user_genre_stats
+            WHERE user_id = ?
+            """,
+            (user_id,)
+        ) or []
+
+    def record_question_answer(self, user_id, question_id, is_correct, answered_at, tx=None):
+        """問題ごとの解答回数・誤答回数（user_question_stats）に1回答を加える（tx を渡すとそのトランザクションの中で行う）"""
+        wrong = 0 if is_correct else 1
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO user_question_stats (user_id, question_id, attempts, wrong_answers, last_answered_at)
+                VALUES (?, ?, 1, ?, ?)
+                ON DUPLICATE KEY UPDATE
+                    attempts = attempts + 1,
+                    wrong_answers = wrong_answers + VALUES(wrong_answers),
+                    last_answered_at = VALUES(last_answered_at)
+            """
+        else:
+            query = """
+                INSERT INTO user_question_stats (user_id, question_id, attempts, wrong_answers, last_answered_at)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT(user_id, question_id) DO UPDATE SET
+                    attempts = attempts + 1,
+                    wrong_answers = wrong_answers + excluded.wrong_answers,
+                    last_answered_at = excluded.last_answered_at
+            """
+        (tx.execute if tx else self.execute_query)(query, (user_id, question_id, wrong, answered_at))
+
+    def rebuild_question_stats(self):
+        """既存の回答履歴から user_question_stats を作り直す（全ユーザーを1文で集計）"""
+        try:
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM user_question_stats")
+                tx.execute(
+                    """
+                    INSERT INTO user_question_stats (user_id, question_id, attempts, wrong_answers, last_answered_at)
+                    SELECT
+                        ua.user_id,
+                        ua.question_id,
+                        COUNT(*),
+                        SUM(CASE WHEN ua.is_correct THEN 0 ELSE 1 END),
+                        MAX(ua.answered_at)
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    JOIN questions q ON q.id = ua.question_id
+                    GROUP BY ua.user_id, ua.question_id
+                    """
+                )
+        except Exception as e:
+            logger.warning(f"user_question_stats rebuild skipped: {e}")
+
+    def get_question_stats(self, user_id):
+        """ユーザーの問題ごとの解答回数・誤答回数（主キーの先頭 user_id で引く）"""
+        return self.execute_query(
+            "SELECT question_id, attempts, wrong_answers FROM user_question_stats WHERE user_id = ?",
+            (user_id,)
+        ) or []
+
+    def record_mistake(self, user_id, question_id, is_correct, answered_at, tx=None):
+        """
+        間違えた問題の一覧（user_mistakes）を更新する（tx を渡すとそのトランザクションの中で行う）
+
+        間違えたら追加（既にあれば回数と日時を更新）し、正解したら取り除く。
+        """
+        execute = tx.execute if tx else self.execute_query
+        if is_correct:
+            execute("DELETE FROM user_mistakes WHERE user_id = ? AND question_id = ?", (user_id, question_id))
+            return
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO user_mistakes (user_id, question_id, miss_count, missed_at)
+                VALUES (?, ?, 1, ?)
+                ON DUPLICATE KEY UPDATE
+                    miss_count = miss_count + 1,
+                    missed_at = VALUES(missed_at)
+            """
+        else:
+            query = """
+                INSERT INTO user_mistakes (user_id, question_id, miss_count, missed_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(user_id, question_id) DO UPDATE SET
+                    miss_count = miss_count + 1,
+                    missed_at = excluded.missed_at
+            """
+        execute(query, (user_id, question_id, answered_at))
+
+    def rebuild_mistakes(self):
+        """
+        既存の回答履歴から user_mistakes を作り直す
+
+        問題ごとに最後に正解した後の誤答（正解していなければすべての誤答）を数える。
+        """
+        try:
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM user_mistakes")
+                tx.execute(
+                    """
+                    INSERT INTO user_mistakes (user_id, question_id, miss_count, missed_at)
+                    SELECT ua.user_id, ua.question_id, COUNT(*), MAX(ua.answered_at)
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    JOIN questions q ON q.id = ua.question_id
+                    LEFT JOIN (
+                        SELECT user_id, question_id, MAX(answered_at) AS last_correct_at
+                        FROM user_answers
+                        WHERE is_correct
+                        GROUP BY user_id, question_id
+                    ) c ON c.user_id = ua.user_id AND c.question_id = ua.question_id
+                    WHERE NOT ua.is_correct
+                      AND ua.answered_at IS NOT NULL
+                      AND (c.last_correct_at IS NULL OR ua.answered_at > c.last_correct_at)
+                    GROUP BY ua.user_id, ua.question_id
+                    """
+                )
+        except Exception as e:
+            logger.warning(f"user_mistakes rebuild skipped: {e}")
+
+    def get_mistakes(self, user_id, limit=50, offset=0, oldest_first=False):
+        """
+        間違えた問題の一覧の1ページ（idx_user_mistakes_user_missed の順に読む）
+
+        削除された問題の行は読み飛ばす（SQLite では外部キーが効かず、問題を入れ替えても行が残る）。
+
+        Returns:
+            (行のリスト, 件数)
+        """
+        direction = 'ASC' if oldest_first else 'DESC'
+        rows = self.execute_query(
+            f"""
+            SELECT m.question_id, m.miss_count, m.missed_at
+            FROM user_mistakes m
+            JOIN questions q ON q.id = m.question_id
+            WHERE m.user_id = ?
+            ORDER BY m.missed_at {direction}, m.question_id {direction}
+            LIMIT ? OFFSET ?
+            """,
+            (user_id, int(limit), int(offset))
+        ) or []
+        total = self.execute_query(
+            """
+            SELECT COUNT(*) AS count
+            FROM user_mistakes m
+            JOIN questions q ON q.id = m.question_id
+            WHERE m.user_id = ?
+            """,
+            (user_id,)
+        )
+        return rows, (total[0]['count'] if total else 0)
+
+    def get_coverage(self, user_id, tx=None):
+        """
+        解答済みの問題のビットセット（未解答なら空のバイト列）
+
+        tx を渡すとそのトランザクションの中で読む（MySQL では更新のために行をロックする）。
+        """
+        query = "SELECT bits FROM user_coverage WHERE user_id = ?"
+        if tx and self.db_type == 'mysql':
+            query += " FOR UPDATE"
+        rows = (tx.execute if tx else self.execute_query)(query, (user_id,))
+        return bytes(rows[0]['bits']) if rows and rows[0]['bits'] is not None else b''
+
+    def assign_coverage_slots(self):
+        """
+        ビットセットの位置（coverage_slot）がまだ無い問題に、使ったことの無い位置を id 順に振る
+
+        削除された問題の位置は再利用しない（古い解答のビットが新しい問題に付かないようにする）。
+        空いた位置は rebuild_coverage で詰める。
+
+        Returns:
+            位置を振った問題の数
+        """
+        with self.transaction() as tx:
+            rows = tx.execute("SELECT id FROM questions WHERE coverage_slot IS NULL ORDER BY id")
+            if not rows:
+                return 0
+            # 振った位置の数（app_meta の行ロックで同時に振る処理を直列にする）
+            self.increment_meta('coverage_slots', len(rows), tx=tx)
+            end = tx.execute("SELECT meta_value FROM app_meta WHERE meta_key = ?", ('coverage_slots',))
+            start = int(end[0]['meta_value']) - len(rows)
+            for offset, row in enumerate(rows):
+                tx.execute(
+                    "UPDATE questions SET coverage_slot = ? WHERE id = ? AND coverage_slot IS NULL",
+                    (start + offset, row['id'])
+                )
+        return len(rows)
+
+    def get_coverage_slots(self):
+        """
+        問題IDからビットセットの位置への対応（位置の無い問題には先に位置を振る）
+
+        Returns:
+            {問題ID: 位置}
+        """
+        self.assign_coverage_slots()
+        rows = self.execute_query("SELECT id, coverage_slot FROM questions") or []
+        return {row['id']: row['coverage_slot'] for row in rows if row['coverage_slot'] is not None}
+
+    def record_coverage(self, user_id, question_id, answered_at, tx=None):
+        """
+        問題を解答済みにする（tx を渡すとそのトランザクションの中で行う）
+
+        Returns:
+            初めて解答した問題ならTrue（位置がまだ振られていない問題は記録しない）
+        """
+        from app.services import coverage
+        bits = self.get_coverage(user_id, tx=tx)
+        # rebuild_coverage が位置を詰め直している間は、その完了を待って新しい位置を読む
+        query = "SELECT coverage_slot FROM questions WHERE id = ?"
+        if tx and self.db_type == 'mysql':
+            query += " LOCK IN SHARE MODE"
+        rows = (tx.execute if tx else self.execute_query)(query, (question_id,))
+        if not rows or rows[0]['coverage_slot'] is None:
+            return False
+        bits = coverage.set_bit(bits, rows[0]['coverage_slot'])
+        if bits is None:
+            return False
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO user_coverage (user_id, bits, updated_at)
+                VALUES (?, ?, ?)
+                ON DUPLICATE KEY UPDATE bits = VALUES(bits), updated_at = VALUES(updated_at)
+            """
+        else:
+            query = """
+                INSERT INTO user_coverage (user_id, bits, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET bits = excluded.bits, updated_at = excluded.updated_at
+            """
+        (tx.execute if tx else self.execute_query)(query, (user_id, bits, answered_at))
+        return True
 
-            if not stats:
-                return
-
-            total_answers = stats[0].get('total_answers', 0) or 0
-            correct_answers = stats[0].get('correct_answers', 0) or 0
-            accuracy_rate = round((correct_answers / total_answers) * 100, 1) if total_answers else 0
-            last_answered_at = stats[0].get('last_answered_at')
-
-            if self.db_type == 'mysql' and MYSQL_AVAILABLE:
-                upsert_query = """
-                    INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        total_answers = VALUES(total_answers),
-                        correct_answers = VALUES(correct_answers),
-                        accuracy_rate = VALUES(accuracy_rate),
-                        last_answered_at = VALUES(last_answered_at)
+    def rebuild_coverage(self, batch_size=5000):
+        """
+        既存の回答履歴から user_coverage を作り直す（ユーザーごとの解答済みの問題をビットセットにする）
+
+        削除された問題で空いた位置を詰め（現在の問題に id 順に 0 から振り直す）、
+        ビットセットの削除・回答履歴の読み込み・書き込みを1つのトランザクションで行う。
+        先に user_coverage を削除してロックを取るので、再構築中の解答はコミットを待ってから
+        詰め直した位置で記録される。位置を詰め直した場合はカタログのバージョンを進め、
+        各ワーカーのジャンルごとのマスクを作り直させる。
+        """
+        from app.services import coverage
+        try:
+            renumbered = False
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM user_coverage")
+                questions = tx.execute("SELECT id, coverage_slot FROM questions ORDER BY id") or []
+                if any(row['coverage_slot'] != slot for slot, row in enumerate(questions)):
+                    tx.execute("UPDATE questions SET coverage_slot = NULL")
+                    for slot, row in enumerate(questions):
+                        tx.execute("UPDATE questions SET coverage_slot = ? WHERE id = ?", (slot, row['id']))
+                    renumbered = True
+                self.set_meta('coverage_slots', len(questions), tx=tx)
+                slots = {row['id']: slot for slot, row in enumerate(questions)}
+
+                rows = tx.iter_query(
+                    """
+                    SELECT DISTINCT ua.user_id, ua.question_id
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    JOIN questions q ON q.id = ua.question_id
+                    ORDER BY ua.user_id
+                    """,
+                    batch_size=batch_size
+                )
+                bitsets = {}
+                for row in rows:
+                    bitsets.setdefault(row['user_id'], []).append(slots[row['question_id']])
+                now = time.strftime('%Y-%m-%d %H:%M:%S')
+                for user_id, indexes in bitsets.items():
+                    tx.execute(
+                        "INSERT INTO user_coverage (user_id, bits, updated_at) VALUES (?, ?, ?)",
+                        (user_id, coverage.from_indexes(indexes), now)
+                    )
+            if renumbered:
+                self.bump_catalog_version()
+        except Exception as e:
+            logger.warning(f"user_coverage rebuild skipped: {e}")
+
+    # 選択肢ごとの集計に使う選択肢の最大長（question_choice_stats.choice）
+    CHOICE_MAX_LENGTH = 20
+
+    def record_item_answer(self, question_id, choice, is_correct, answered_at, tx=None):
+        """
+        問題ごとの解答数・正解数（question_stats）と選択肢ごとの解答数（question_choice_stats）に
+        1回答を加える（tx を渡すとそのトランザクションの中で行う）
+
+        choice は問題の選択肢のキー（選択肢に無い解答は None を渡して選択肢ごとの集計に含めない）。
+        """
+        execute = tx.execute if tx else self.execute_query
+        correct = 1 if is_correct else 0
+        if self.db_type == 'mysql':
+            # ON DUPLICATE KEY UPDATE の代入は左から順に行われ、後の式は更新後の値を参照する
+            execute(
                 """
-            else:
-                upsert_query = """
-                    INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at)
-                    VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        total_answers = excluded.total_answers,
-                        correct_answers = excluded.correct_answers,
-                        accuracy_rate = excluded.accuracy_rate,
-                        last_answered_at = excluded.last_answered_at
+                INSERT INTO question_stats (question_id, attempts, correct_answers, accuracy_rate, updated_at)
+                VALUES (?, 1, ?, ?, ?)
+                ON DUPLICATE KEY UPDATE
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + VALUES(correct_answers),
+                    accuracy_rate = ROUND(correct_answers * 100.0 / attempts, 2),
+                    updated_at = VALUES(updated_at)
+                """,
+                (question_id, correct, correct * 100.0, answered_at)
+            )
+            if choice is not None:
+                execute(
+                    """
+                    INSERT INTO question_choice_stats (question_id, choice, answers) VALUES (?, ?, 1)
+                    ON DUPLICATE KEY UPDATE answers = answers + 1
+                    """,
+                    (question_id, choice)
+                )
+        else:
+            execute(
                 """
-
-            self.execute_query(
-                upsert_query,
-                (user_id, total_answers, correct_answers, accuracy_rate, last_answered_at)
+                INSERT INTO question_stats (question_id, attempts, correct_answers, accuracy_rate, updated_at)
+                VALUES (?, 1, ?, ?, ?)
+                ON CONFLICT(question_id) DO UPDATE SET
+                    attempts = attempts + 1,
+                    correct_answers = correct_answers + excluded.correct_answers,
+                    accuracy_rate = ROUND((correct_answers + excluded.correct_answers) * 100.0 / (attempts + 1), 2),
+                    updated_at = excluded.updated_at
+                """,
+                (question_id, correct, correct * 100.0, answered_at)
             )
-        except Exception as e:
-            logger.error(f"Failed to update user_stats for user {user_id}: {e}")
+            if choice is not None:
+                execute(
+                    """
+                    INSERT INTO question_choice_stats (question_id, choice, answers) VALUES (?, ?, 1)
+                    ON CONFLICT(question_id, choice) DO UPDATE SET answers = answers + 1
+                    """,
+                    (question_id, choice)
+                )
 
-    def rebuild_user_stats(self):
-        """既存の回答履歴からuser_statsを再構築"""
+    def remove_user_item_answers(self, user_id, tx):
+        """
+        ユーザーの解答を question_stats / question_choice_stats から差し引く
+        （ユーザーの削除時に、user_answers を消す前に同じトランザクションの中で呼ぶ）
+        """
+        tx.execute(
+            """
+            UPDATE question_stats SET
+                attempts = attempts - (
+                    SELECT COUNT(*) FROM user_answers ua
+                    WHERE ua.user_id = ? AND ua.question_id = question_stats.question_id),
+                correct_answers = correct_answers - (
+                    SELECT COUNT(*) FROM user_answers ua
+                    WHERE ua.user_id = ? AND ua.question_id = question_stats.question_id AND ua.is_correct)
+            WHERE question_id IN (SELECT question_id FROM user_answers WHERE user_id = ?)
+            """,
+            (user_id, user_id, user_id)
+        )
+        # updated_at も進め、各ワーカーの差分の読み直しで差し引いた値を読ませる
+        tx.execute(
+            """
+            UPDATE question_stats
+            SET accuracy_rate = CASE WHEN attempts > 0 THEN ROUND(correct_answers * 100.0 / attempts, 2) ELSE 0 END,
+                updated_at = ?
+            WHERE question_id IN (SELECT question_id FROM user_answers WHERE user_id = ?)
+            """,
+            (time.strftime('%Y-%m-%d %H:%M:%S'), user_id)
+        )
+        tx.execute(
+            """
+            UPDATE question_choice_stats SET
+                answers = answers - (
+                    SELECT COUNT(*) FROM user_answers ua
+                    WHERE ua.user_id = ? AND ua.question_id = question_choice_stats.question_id
+                      AND ua.user_answer = question_choice_stats.choice)
+            WHERE question_id IN (SELECT question_id FROM user_answers WHERE user_id = ?)
+            """,
+            (user_id, user_id)
+        )
+
+    def rebuild_item_stats(self):
+        """
+        既存の回答履歴から question_stats / question_choice_stats を作り直す
+
+        選択肢ごとの集計は問題の選択肢のキーに一致する解答だけを数える（解答時の記録と同じ条件）。
+        """
         try:
-            users = self.execute_query("SELECT id FROM users") or []
-            for user in users:
+            choice_keys = {}
+            for row in self.execute_query("SELECT id, choices FROM questions") or []:
                 try:
-                    self.update_user_stats(user['id'])
-                except Exception as inner:
-                    logger.warning(f"Skipping stats rebuild for user {user.get('id')}: {inner}")
+                    choices = json.loads(row['choices']) if isinstance(row['choices'], str) else row['choices']
+                except ValueError:
+                    choices = None
+                choice_keys[row['id']] = set(choices) if isinstance(choices, dict) else set()
+
+            with self.transaction() as tx:
+                tx.execute("DELETE FROM question_stats")
+                tx.execute("DELETE FROM question_choice_stats")
+                tx.execute(
+                    """
+                    INSERT INTO question_stats (question_id, attempts, correct_answers, accuracy_rate, updated_at)
+                    SELECT
+                        ua.question_id,
+                        COUNT(*),
+                        SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END),
+                        ROUND(SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2),
+                        MAX(ua.answered_at)
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    JOIN questions q ON q.id = ua.question_id
+                    GROUP BY ua.question_id
+                    """
+                )
+                rows = tx.execute(
+                    """
+                    SELECT ua.question_id, ua.user_answer AS choice, COUNT(*) AS answers
+                    FROM user_answers ua
+                    JOIN users u ON u.id = ua.user_id
+                    JOIN questions q ON q.id = ua.question_id
+                    GROUP BY ua.question_id, ua.user_answer
+                    """
+                ) or []
+                for row in rows:
+                    if row['choice'] in choice_keys.get(row['question_id'], ()):
+                        tx.execute(
+                            "INSERT INTO question_choice_stats (question_id, choice, answers) VALUES (?, ?, ?)",
+                            (row['question_id'], row['choice'], row['answers'])
+                        )
         except Exception as e:
-            logger.warning(f"user_stats rebuild skipped: {e}")
+            logger.warning(f"question_stats rebuild skipped: {e}")
 
-    def get_user_rankings(self, limit=50):
-        """ランキング用のユーザー集計を取得"""
-        limit = int(limit) if limit else 50
-        query = """
-            SELECT 
-                u.id,
-                u.username,
-                COALESCE(us.total_answers, 0) AS total_answers,
-                COALESCE(us.correct_answers, 0) AS correct_answers,
-                COALESCE(us.accuracy_rate, 0) AS accuracy_rate,
-                us.last_answered_at
-            FROM users u
-            LEFT JOIN user_stats us ON us.user_id = u.id
-            WHERE COALESCE(us.total_answers, 0) > 0
-            ORDER BY accuracy_rate DESC, total_answers DESC, last_answered_at DESC
-            LIMIT ?
+    def get_item_stats(self, since=None):
         """
-        return self.execute_query(query, (limit,))
+        問題ごとの解答数・正解数と選択肢ごとの解答数（ワーカーのメモリに載せる用。2回のクエリで読む）
 
-    def get_user_stat(self, user_id):
-        """単一ユーザーの集計を取得"""
-        result = self.execute_query(
+        Args:
+            since: 指定するとこの時刻以降に更新された問題だけを読む（idx_question_stats_updated_at）
+
+        Returns:
+            {問題ID: {'attempts', 'correct_answers', 'choices': {選択肢: 解答数}}}
+        """
+        if since is None:
+            stats_query = "SELECT question_id, attempts, correct_answers FROM question_stats"
+            choices_query = "SELECT question_id, choice, answers FROM question_choice_stats"
+            params = ()
+        else:
+            stats_query = "SELECT question_id, attempts, correct_answers FROM question_stats WHERE updated_at >= ?"
+            choices_query = (
+                "SELECT c.question_id, c.choice, c.answers FROM question_choice_stats c "
+                "JOIN question_stats s ON s.question_id = c.question_id WHERE s.updated_at >= ?"
+            )
+            params = (since.strftime('%Y-%m-%d %H:%M:%S'),)
+        stats = {}
+        for row in self.execute_query(stats_query, params) or []:
+            stats[row['question_id']] = {
+                'attempts': int(row['attempts'] or 0),
+                'correct_answers': int(row['correct_answers'] or 0),
+                'choices': {}
+            }
+        for row in self.execute_query(choices_query, params) or []:
+            entry = stats.get(row['question_id'])
+            if entry is not None and row['answers']:
+                entry['choices'][row['choice']] = int(row['answers'])
+        return stats
+
+    def get_item_difficulty_page(self, min_attempts=1, limit=50, offset=0):
+        """
+        管理画面の問題の難易度一覧の1ページ（idx_question_stats_accuracy の順に正答率の低い順）
+
+        Returns:
+            (行のリスト, 条件に一致する問題数)
+        """
+        rows = self.execute_query(
             """
-            SELECT 
-                u.id,
-                u.username,
-                COALESCE(us.total_answers, 0) AS total_answers,
-                COALESCE(us.correct_answers, 0) AS correct_answers,
-                COALESCE(us.accuracy_rate, 0) AS accuracy_rate,
-                us.last_answered_at
-            FROM users u
-            LEFT JOIN user_stats us ON us.user_id = u.id
-            WHERE u.id = ?
+            SELECT
+                q.id, q.question_id AS question_code, q.question_text, q.genre, q.correct_answer,
+                s.attempts, s.correct_answers, s.accuracy_rate
+            FROM question_stats s
+            JOIN questions q ON q.id = s.question_id
+            WHERE s.attempts >= ?
+            ORDER BY s.accuracy_rate ASC, s.question_id ASC
+            LIMIT ? OFFSET ?
+            """,
+            (int(min_attempts), int(limit), int(offset))
+        ) or []
+        if rows:
+            placeholders = ', '.join('?' for _ in rows)
+            choices = self.execute_query(
+                f"SELECT question_id, choice, answers FROM question_choice_stats WHERE question_id IN ({placeholders})",
+                tuple(row['id'] for row in rows)
+            ) or []
+            by_question = {}
+            for choice in choices:
+                if choice['answers']:
+                    by_question.setdefault(choice['question_id'], {})[choice['choice']] = int(choice['answers'])
+            for row in rows:
+                row['choices'] = by_question.get(row['id'], {})
+        total = self.execute_query(
+            "SELECT COUNT(*) AS count FROM question_stats WHERE attempts >= ?", (int(min_attempts),)
+        )
+        return rows, (total[0]['count'] if total else 0)
+
+    def save_irt_calibration(self, items, users, model, calibrated_at):
+        """
+        IRT の推定結果で question_irt / user_ability を置き換える（1つのトランザクションで行う）
+
+        Args:
+            items: (問題ID, 難易度, 識別力, 回答数) のリスト
+            users: (ユーザーID, 能力値, 回答数) のリスト
+        """
+        with self.transaction() as tx:
+            tx.execute("DELETE FROM question_irt")
+            tx.execute("DELETE FROM user_ability")
+            for question_id, difficulty, discrimination, responses in items:
+                tx.execute(
+                    """
+                    INSERT INTO question_irt (question_id, difficulty, discrimination, responses, model, calibrated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (question_id, difficulty, discrimination, responses, model, calibrated_at)
+                )
+            for user_id, ability, responses in users:
+                tx.execute(
+                    "INSERT INTO user_ability (user_id, ability, responses, model, calibrated_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, ability, responses, model, calibrated_at)
+                )
+
+    def rebuild_review_items(self):
+        """既存の回答履歴から復習状態（review_items）を作り直す"""
+        from app.services import spaced_repetition
+        try:
+            spaced_repetition.rebuild(self)
+        except Exception as e:
+            logger.warning(f"review_items rebuild skipped: {e}")
+
+    def get_review_item(self, user_id, question_id, tx=None):
+        """1問の復習状態（未登録ならNone。tx を渡すとそのトランザクションの中で読む）"""
+        rows = (tx.execute if tx else self.execute_query)(
+            """
+            SELECT repetitions, interval_days, ease_factor, due_at
+            FROM review_items
+            WHERE user_id = ? AND question_id = ?
+            """,
+            (user_id, question_id)
+        )
+        return rows[0] if rows else None
+
+    def save_review_item(self, user_id, question_id, state, reviewed_at, tx=None):
+        """復習状態を保存する（tx を渡すとそのトランザクションの中で行う）"""
+        if self.db_type == 'mysql':
+            query = """
+                INSERT INTO review_items (user_id, question_id, repetitions, interval_days, ease_factor, due_at, last_reviewed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON DUPLICATE KEY UPDATE
+                    repetitions = VALUES(repetitions),
+                    interval_days = VALUES(interval_days),
+                    ease_factor = VALUES(ease_factor),
+                    due_at = VALUES(due_at),
+                    last_reviewed_at = VALUES(last_reviewed_at)
+            """
+        else:
+            query = """
+                INSERT INTO review_items (user_id, question_id, repetitions, interval_days, ease_factor, due_at, last_reviewed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, question_id) DO UPDATE SET
+                    repetitions = excluded.repetitions,
+                    interval_days = excluded.interval_days,
+                    ease_factor = excluded.ease_factor,
+                    due_at = excluded.due_at,
+                    last_reviewed_at = excluded.last_reviewed_at
+            """
+        (tx.execute if tx else self.execute_query)(
+            query,
+            (user_id, question_id, state['repetitions'], state['interval_days'],
+             state['ease_factor'], state['due_at'], reviewed_at)
+        )
+
+    def get_review_queue(self, user_id, now):
+        """
+        復習キューの先頭と件数（idx_review_items_user_due の範囲を読むだけ）
+
+        削除された問題の行は読み飛ばす（SQLite では外部キーが効かず、問題を入れ替えても行が残る）。
+
+        Returns:
+            {'next': 期限の来た最も古い問題の行（無ければNone）,
+             'due_count': 期限の来た問題数, 'next_due_at': 次に期限が来る日時（復習対象が無ければNone）}
+        """
+        rows = self.execute_query(
+            """
+            SELECT r.question_id, r.repetitions, r.due_at
+            FROM review_items r
+            JOIN questions q ON q.id = r.question_id
+            WHERE r.user_id = ?
+            ORDER BY r.due_at
             LIMIT 1
             """,
             (user_id,)
         )
-        return result[0] if result else None
+        head = rows[0] if rows else None
+        if head is None or str(head['due_at']) > str(now):
+            return {'next': None, 'due_count': 0, 'next_due_at': head['due_at'] if head else None}
+        count = self.execute_query(
+            """
+            SELECT COUNT(*) AS count
+            FROM review_items r
+            JOIN questions q ON q.id = r.question_id
+            WHERE r.user_id = ? AND r.due_at <= ?
+            """,
+            (user_id, now)
+        )
+        return {'next': head, 'due_count': count[0]['count'] if count else 1, 'next_due_at': head['due_at']}
 
-    def get_user_rank(self, user_id):
-        """指定ユーザーのランキング順位を取得"""
-        user_stat = self.get_user_stat(user_id)
-        if not user_stat or user_stat.get('total_answers', 0) == 0:
-            return None
+    def _daily_stats_source(self, since=None, genre=None):
+        """期間・ジャンルで絞り込んだ user_daily_stats の条件（WHERE 句とパラメータ）"""
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("d.stat_date >= ?")
+            params.append(str(since))
+        if genre is not None:
+            conditions.append("d.genre = ?")
+            params.append(genre)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return where, params
 
-        accuracy = user_stat.get('accuracy_rate', 0) or 0
-        total = user_stat.get('total_answers', 0) or 0
-        last_answered = user_stat.get('last_answered_at') or '1970-01-01'
+    _DAILY_TOTALS = """
+        SUM(d.attempts) AS total_answers,
+        SUM(d.correct_answers) AS correct_answers,
+        ROUND(SUM(d.correct_answers) * 100.0 / SUM(d.attempts), 1) AS accuracy_rate,
+        MAX(d.stat_date) AS last_answered_at
+    """
+
+    def get_period_rankings(self, since=None, genre=None, limit=50, user_id=None):
+        """
+        期間・ジャンル別のランキングと1ユーザーの順位（user_daily_stats の範囲集計。回答履歴は読まない）
 
+        ユーザーごとの集計は派生テーブルで1度だけ行い、上位の行と user_id の行を
+        ウィンドウ関数の順位と一緒に1回のクエリで返す。
+        正答率・解答数・最終解答日がすべて同じユーザーは同じ順位（rank。RANK() の順位）になる。
+        一覧も user_id の行も同じ rank を使い、ROW_NUMBER() は上位 limit 件で切るためだけに使う。
+
+        Args:
+            since: この日付（date）以降の集計に限る。Noneなら全期間
+            genre: このジャンルに限る。Noneなら全ジャンル
+            user_id: 順位を求めるユーザー（上位に入っていなくても返す）
+
+        Returns:
+            (上位 limit 件の行のリスト, user_id の行（解答が無いかNoneならNone）)
+        """
+        where, params = self._daily_stats_source(since, genre)
+        order = "t.accuracy_rate DESC, t.total_answers DESC, t.last_answered_at DESC"
+        rows = self.execute_query(
+            f"""
+            SELECT *
+            FROM (
+                SELECT t.id, u.username, t.total_answers, t.correct_answers, t.accuracy_rate, t.last_answered_at,
+                       RANK() OVER (ORDER BY {order}) AS user_rank,
+                       ROW_NUMBER() OVER (ORDER BY {order}, t.id) AS position
+                FROM (
+                    SELECT d.user_id AS id, {self._DAILY_TOTALS}
+                    FROM user_daily_stats d
+                    {where}
+                    GROUP BY d.user_id
+                ) t
+                JOIN users u ON u.id = t.id
+            ) ranked
+            WHERE position <= ? OR id = ?
+            ORDER BY position
+            """,
+            tuple(params) + (int(limit), user_id)
+        ) or []
+
+        rankings, current = [], None
+        for row in rows:
+            row['rank'] = row.pop('user_rank')
+            if row.pop('position') <= limit:
+                rankings.append(row)
+            if user_id is not None and row['id'] == user_id and row['total_answers']:
+                current = row
+        return rankings, current
+
+    def get_stats_row(self, user_id):
+        """
+        user_stats の1行を取得（主キー相当の user_id で引くだけで回答履歴は集計しない）
+
+        Returns:
+            total_answers, correct_answers, accuracy_rate, last_answered_at, stats_version
+            （まだ回答が無い場合はNone）
+        """
         result = self.execute_query(
             """
-            SELECT COUNT(*) + 1 AS user_rank
+            SELECT total_answers, correct_answers, accuracy_rate, last_answered_at, stats_version
             FROM user_stats
-            WHERE total_answers > 0 AND (
-                accuracy_rate > ?
-                OR (accuracy_rate = ? AND total_answers > ?)
-                OR (accuracy_rate = ? AND total_answers = ? AND COALESCE(last_answered_at, '1970-01-01') > COALESCE(?, '1970-01-01'))
-            )
+            WHERE user_id = ?
             """,
-            (accuracy, accuracy, total, accuracy, total, last_answered)
+            (user_id,)
         )
+        return result[0] if result else None
 
-        return result[0].get('user_rank') if result else None
+    def get_answer_history(self, user_id, before=None, limit=30):
+        """
+        回答履歴を新しい順に取得（キーセットページング）
+
+        idx_user_answers_user_answered を使い、OFFSET を使わずに
+        カーソルより古い行から limit 件だけ読む。
+
+        Args:
+            before: 前のページの最後の行の (answered_at, id)。Noneなら最新から
+        """
+        query = """
+            SELECT id, question_id, user_answer, is_correct, answered_at
+            FROM user_answers
+            WHERE user_id = ?
+        """
+        params = [user_id]
+        if before is not None:
+            answered_at, answer_id = before
+            query += " AND (answered_at < ? OR (answered_at = ? AND id < ?))"
+            params.extend([answered_at, answered_at, answer_id])
+        query += " ORDER BY answered_at DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+        return self.execute_query(query, tuple(params)) or []
+
+    # 管理画面のユーザー一覧の並べ替え（キー: (並べ替えに使う列, user_stats から読むか)）
+    USER_LIST_SORTS = {
+        'created_at': ('u.created_at', False),
+        'username': ('u.username', False),
+        'total_answers': ('us.total_answers', True),
+        'accuracy_rate': ('us.accuracy_rate', True),
+        'last_activity': ('us.last_answered_at', True),
+    }
+
+    def ensure_user_stats_row(self, user_id, tx=None):
+        """user_stats に空の行を作る（登録直後のユーザーも統計での並べ替えに含めるため）"""
+        ignore = 'INSERT IGNORE' if self.db_type == 'mysql' else 'INSERT OR IGNORE'
+        (tx.execute if tx else self.execute_query)(f'{ignore} INTO user_stats (user_id) VALUES (?)', (user_id,))
+
+    def get_users_page(self, prefix='', sort='created_at', descending=True, limit=50, offset=0):
+        """
+        管理画面のユーザー一覧の1ページ（回答履歴は集計せず user_stats を読む）
+
+        ユーザー名・登録日での並べ替えは users のインデックス順に、統計での並べ替えは
+        user_stats のインデックス順に読み、LIMIT 件だけ結合する。
+        prefix はユーザー名の前方一致（users.username のインデックスで範囲検索する）。
+
+        Returns:
+            (行のリスト, 条件に一致するユーザー数)
+        """
+        column, from_stats = self.USER_LIST_SORTS.get(sort, self.USER_LIST_SORTS['created_at'])
+        direction = 'DESC' if descending else 'ASC'
+
+        where, params = '', []
+        if prefix:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(escaped + '%')
+            if self.db_type == 'mysql':
+                # MySQLの LIKE はバックスラッシュが既定のエスケープ文字
+                where = "WHERE u.username LIKE ?"
+            else:
+                where = "WHERE u.username LIKE ? ESCAPE '\\'"
+                # SQLiteの LIKE は大文字小文字を区別しないためインデックスを使えないので、
+                # 範囲条件を併用してインデックスで絞り込む（SQLiteでは大文字小文字を区別した前方一致になる）
+                where += " AND u.username >= ? AND u.username < ?"
+                params.extend([prefix, prefix + '\U0010ffff'])
+
+        # 同値の並びは読み出すテーブルの主キー順（インデックスの順序のまま読める）
+        if from_stats:
+            source = "FROM user_stats us JOIN users u ON u.id = us.user_id"
+            tie_breaker = 'us.id'
+        else:
+            source = "FROM users u LEFT JOIN user_stats us ON us.user_id = u.id"
+            tie_breaker = 'u.id'
+
+        rows = self.execute_query(
+            f"""
+            SELECT
+                u.id, u.username, u.created_at, u.is_admin,
+                COALESCE(us.total_answers, 0) AS total_answers,
+                COALESCE(us.correct_answers, 0) AS correct_answers,
+                COALESCE(us.accuracy_rate, 0) AS accuracy_rate,
+                us.last_answered_at AS last_activity
+            {source}
+            {where}
+            ORDER BY {column} {direction}, {tie_breaker} {direction}
+            LIMIT ? OFFSET ?
+            """,
+            tuple(params) + (int(limit), int(offset))
+        ) or []
+        total = self.execute_query(f"SELECT COUNT(*) AS count FROM users u {where}", tuple(params))
+        return rows, (total[0]['count'] if total else 0)
 
 class QuestionManager:
     def __init__(self, db_manager):
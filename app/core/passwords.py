@@ -0,0 +1,50 @@
+"""
+パスワードハッシュの方式・コスト
+ハッシュ方式（Werkzeug の method 文字列）を設定で切り替え、
+保存済みのハッシュが現在の方式と異なる場合はログイン時に作り直す
+"""
+
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash
+
+# Werkzeug 2.3 の既定値と同じ
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+
+
+@lru_cache(maxsize=16)
+def canonical_method(method):
+    """
+    method 文字列をハッシュに記録される形式に揃える
+
+    'pbkdf2' のように省略されたパラメータは Werkzeug の既定値で補われるので、
+    実際にハッシュを1つ作って '$' より前の部分を取り出す。
+    """
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def hash_method_of(password_hash):
+    """保存済みハッシュの方式とパラメータ（例: 'pbkdf2:sha256:600000'）"""
+    return (password_hash or '').split('$', 1)[0]
+
+
+def hash_password(password, method=DEFAULT_METHOD, salt_length=16):
+    """指定した方式でパスワードをハッシュ化"""
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def needs_rehash(password_hash, method=DEFAULT_METHOD):
+    """保存済みハッシュの方式・コストが目標と異なるか"""
+    return hash_method_of(password_hash) != canonical_method(method)
+
+
+def rehash_if_needed(password_hash, password, method=DEFAULT_METHOD, salt_length=16):
+    """
+    検証済みのパスワードを目標の方式でハッシュし直す
+
+    Returns:
+        新しいハッシュ（作り直す必要が無い場合はNone）
+    """
+    if not needs_rehash(password_hash, method):
+        return None
+    return hash_password(password, method, salt_length)
@@ -4,111 +4,157 @@
 """
 
 import json
+import threading
+import time
 from datetime import datetime
 import re
 
+from app.services import coverage, spaced_repetition
+from app.services.item_stats import ItemStats
+from app.utils import question_normalize
+
 class QuestionManager:
     """問題管理クラス（MySQL/SQLite対応）"""
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, import_chunk_size=500, import_processes=1, item_stats_interval=60.0):
         self.db_manager = db_manager
+        self.import_chunk_size = import_chunk_size  # 取り込み時に一括書き込みする件数
+        self.import_processes = import_processes  # 取り込み時の検証・正規化に使うプロセス数
         self.last_question_id = None  # 前回出題した問題ID
+        self.catalog = None  # 問題カタログ（enable_catalog() で有効化）
+        self.catalog_check_interval = 5.0  # カタログのバージョン確認間隔（秒）
+        self.catalog_snapshot_path = None  # カタログのスナップショットファイル（Noneなら使わない）
+        self._catalog_checked_at = float('-inf')
+        self._catalog_lock = threading.Lock()
+        self._summary = None  # カタログ無効時の問題数・ジャンル一覧のキャッシュ
+        self._summary_checked_at = float('-inf')
+        self._pool = None  # 出題候補（問題IDとジャンル）のキャッシュ
+        self._pool_checked_at = float('-inf')
+        self.item_stats = ItemStats(reload_interval=item_stats_interval)  # 問題ごとの解答統計のスナップショット
     
-    def is_image_url(self, text):
-        """テキストが画像URLかどうかを判定"""
-        if not text or not isinstance(text, str):
-            return False
+    def enable_catalog(self, check_interval=None, snapshot_path=None):
+        """
+        問題カタログを読み込み、以降の問題の読み取りをメモリ上のカタログから返す
+
+        カタログは app_meta の catalog_version が変わったときにだけ作り直す。
+        他プロセスでの取り込み・削除は check_interval 秒以内に反映される。
+        snapshot_path を指定すると、バージョンが一致するスナップショットがあれば
+        DBを読まずにそれを mmap し、無ければDBから構築してスナップショットを書き出す。
+        """
+        if check_interval is not None:
+            self.catalog_check_interval = check_interval
+        if snapshot_path is not None:
+            self.catalog_snapshot_path = snapshot_path
+        self.catalog = self._load_catalog()
+        self._catalog_checked_at = time.monotonic()
+        return self.catalog
+    
+    def _load_catalog(self):
+        """スナップショット（あれば）またはDBからカタログを読み込む"""
+        from app.services.catalog import QuestionCatalog
+        from app.services import catalog_snapshot
         
-        # 画像URLのパターン
-        image_patterns = [
-            r'/static/images/',
-            r'\.png$',
-            r'\.jpg$',
-            r'\.jpeg$',
-            r'\.gif$',
-            r'\.svg$',
-            r'\.webp$'
-        ]
+        path = self.catalog_snapshot_path
+        if not path:
+            return QuestionCatalog.build(self)
         
-        text_lower = text.lower()
-        is_image = any(re.search(pattern, text_lower) for pattern in image_patterns)
+        epoch = self.db_manager.get_meta('catalog_epoch')
+        snapshot = catalog_snapshot.open_snapshot(path, epoch, self.db_manager.get_catalog_version())
+        if snapshot is not None:
+            return snapshot
         
-        # デバッグログ
-        print(f"[DEBUG] is_image_url: text='{text}', is_image={is_image}")
+        catalog = QuestionCatalog.build(self)
+        try:
+            catalog_snapshot.write_snapshot(path, catalog, epoch)
+        except OSError as e:
+            print(f"Error writing catalog snapshot {path}: {e}")
+            return catalog
+        return catalog_snapshot.open_snapshot(path, epoch, catalog.version) or catalog
+    
+    def invalidate_catalog(self):
+        """次の読み取り時にカタログのバージョンを確認させる（このプロセスで問題を書き換えた後に呼ぶ）"""
+        self._catalog_checked_at = float('-inf')
+        self._summary_checked_at = float('-inf')
+        self._pool_checked_at = float('-inf')
+    
+    def _current_catalog(self):
+        """最新のカタログを返す（無効な場合はNone）"""
+        if self.catalog is None:
+            return None
+        if time.monotonic() - self._catalog_checked_at < self.catalog_check_interval:
+            return self.catalog
         
-        return is_image
+        with self._catalog_lock:
+            # 別スレッドが確認・再構築済みならそれを使う
+            if time.monotonic() - self._catalog_checked_at >= self.catalog_check_interval:
+                try:
+                    if self.db_manager.get_catalog_version() != self.catalog.version:
+                        self.catalog = self._load_catalog()
+                except Exception as e:
+                    print(f"Error refreshing question catalog: {e}")
+                self._catalog_checked_at = time.monotonic()
+        return self.catalog
+    
+    def is_image_url(self, text):
+        """テキストが画像URLかどうかを判定"""
+        return question_normalize.is_image_url(text)
 
     def normalize_media_value(self, val):
         """Normalize image path/URL; return None when empty."""
-        if not val or not isinstance(val, str):
-            return None
-        cleaned = val.strip()
-        if not cleaned:
-            return None
-        cleaned = cleaned.replace('\\', '/')
-
-        if 'protected_images/questions/' in cleaned:
-            fname = cleaned.split('/')[-1]
-            return f'/images/questions/{fname}'
-
-        if cleaned.startswith('/images/questions/'):
-            return cleaned
-        if cleaned.startswith('images/questions/'):
-            return '/' + cleaned
-        if cleaned.startswith('/static/'):
-            return cleaned
-        if cleaned.startswith('static/'):
-            return '/' + cleaned
-
-        # If it looks like just a filename, map to protected route
-        if '/' not in cleaned:
-            return f'/images/questions/{cleaned}'
-
-        return cleaned
+        return question_normalize.normalize_media_value(val)
 
     def sanitize_question_text(self, text):
         """Remove stray image path fragments from question text."""
-        if not text or not isinstance(text, str):
-            return text
-        patterns = [
-            r'/image\\?s?/question[s]?/[^\s]+',
-            r'images?/questions?/[^\s]+',
-            r'protected_images/questions/[^\s]+'
-        ]
-        cleaned = text
-        for p in patterns:
-            cleaned = re.sub(p, '', cleaned, flags=re.IGNORECASE)
-        return cleaned.strip()
+        return question_normalize.sanitize_question_text(text)
 
     def normalize_choice_value(self, val):
         """Normalize choice text or image path, dropping noisy JSON blobs."""
-        if val is None:
-            return None
-        if not isinstance(val, str):
-            val = str(val)
-        s = val.strip()
-        if not s:
-            return None
+        return question_normalize.normalize_choice_value(val)
+    
+    def prepare_question(self, row):
+        """DBの行を表示用の問題dictに変換（テキスト・画像パス・選択肢を正規化）"""
+        question = dict(row)
+        # 解答済みビットセットの位置は出題候補（get_question_pool）でだけ使う内部の値
+        question.pop('coverage_slot', None)
+        
+        # question text sanitize & image normalization
+        question['question_text'] = self.sanitize_question_text(question.get('question_text'))
+        question['image_url'] = self.normalize_media_value(question.get('image_url'))
 
-        lower = s.lower()
-        if re.search(r'(\.png|\.jpg|\.jpeg|\.gif|\.svg|\.webp)$', lower) or '/image' in lower or 'protected_images/questions/' in lower:
-            return self.normalize_media_value(s) or s
+        # choicesをJSONパース
+        if isinstance(question['choices'], str):
+            question['choices'] = json.loads(question['choices'])
 
-        if (s.startswith('{') and s.endswith('}')) or (s.startswith('[') and s.endswith(']')):
-            try:
-                decoded = json.loads(s)
-                if isinstance(decoded, str):
-                    s = decoded.strip()
-                else:
-                    return None
-            except Exception:
-                return None
+        if isinstance(question.get('choices'), dict):
+            cleaned_choices = {}
+            for ck, cv in question['choices'].items():
+                cleaned_val = self.normalize_choice_value(cv)
+                if cleaned_val:
+                    cleaned_choices[ck] = cleaned_val
+            question['choices'] = cleaned_choices
+        else:
+            question['choices'] = {}
+
+        # 選択肢が画像URLかどうかを判定
+        question['has_image_choices'] = False
+        if question['choices']:
+            first_choice = list(question['choices'].values())[0]
+            question['has_image_choices'] = self.is_image_url(first_choice)
 
-        s = self.sanitize_question_text(s)
-        return s if s else None
+        # choice_imagesがあれば処理
+        if question.get('choice_images') and isinstance(question['choice_images'], str):
+            question['choice_images'] = json.loads(question['choice_images'])
+        else:
+            question['choice_images'] = None
+        
+        return question
     
     def get_question(self, question_id):
         """指定されたIDの問題を取得"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return catalog.get(question_id)
+        
         try:
             if self.db_manager.db_type == 'mysql':
                 result = self.db_manager.execute_query(
@@ -121,6 +167,7 @@ class QuestionManager:
             
             if result:
                 question = dict(result[0])
+                question.pop('coverage_slot', None)
                 
                 # question text sanitize
                 question['question_text'] = self.sanitize_question_text(question.get('question_text'))
@@ -143,18 +190,12 @@ class QuestionManager:
                 else:
                     question['choices'] = {}
 
-                # デバッグログ
-                print(f"[DEBUG] Question choices: {question['choices']}")
-
                 # 選択肢が画像URLかどうかを判定
                 question['has_image_choices'] = False
                 if question['choices']:
                     first_choice = list(question['choices'].values())[0]
                     question['has_image_choices'] = self.is_image_url(first_choice)
 
-                    print(f"[DEBUG] First choice: '{first_choice}'")
-                    print(f"[DEBUG] has_image_choices: {question['has_image_choices']}")
-
                 # 後方互換性: choice_imagesがあれば処理（廃止予定）
                 if question.get('choice_images'):
                     if isinstance(question['choice_images'], str):
@@ -172,80 +213,164 @@ class QuestionManager:
     
     def get_questions_by_genre(self, genre):
         """ジャンル別問題を取得"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return catalog.by_genre(genre)
+        
         try:
             result = self.db_manager.execute_query(
                 'SELECT * FROM questions WHERE genre = ? ORDER BY question_id', (genre,)
             )
-            
-            questions = []
-            for row in result:
-                question = dict(row)
-                
-                # question text sanitize & image normalization
-                question['question_text'] = self.sanitize_question_text(question.get('question_text'))
-                question['image_url'] = self.normalize_media_value(question.get('image_url'))
+            return [self.prepare_question(row) for row in result]
+        except Exception as e:
+            print(f"Error getting questions by genre {genre}: {e}")
+            return []
+    
+    def get_questions_by_ids(self, question_ids):
+        """指定されたIDの問題を指定順で取得（存在しないIDは除外）"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return catalog.by_ids(question_ids)
+        
+        if not question_ids:
+            return []
+        try:
+            placeholders = ', '.join(['?'] * len(question_ids))
+            result = self.db_manager.execute_query(
+                f'SELECT * FROM questions WHERE id IN ({placeholders})', tuple(question_ids)
+            ) or []
+            by_id = {row['id']: row for row in result}
+            return [self.prepare_question(by_id[qid]) for qid in question_ids if qid in by_id]
+        except Exception as e:
+            print(f"Error getting questions by ids: {e}")
+            return []
+    
+    def get_question_summary(self):
+        """
+        問題数とジャンル一覧（ダッシュボード用）
 
-                # choicesをJSONパース
-                if isinstance(question['choices'], str):
-                    question['choices'] = json.loads(question['choices'])
+        カタログが有効ならカタログから返す。無効な場合も catalog_version が
+        変わったときにだけ1回の GROUP BY で集計し直し、確認間隔内はDBを読まない。
 
-                if isinstance(question.get('choices'), dict):
-                    cleaned_choices = {}
-                    for ck, cv in question['choices'].items():
-                        cleaned_val = self.normalize_choice_value(cv)
-                        if cleaned_val:
-                            cleaned_choices[ck] = cleaned_val
-                    question['choices'] = cleaned_choices
-                else:
-                    question['choices'] = {}
+        Returns:
+            {'version', 'total_questions', 'genres'}
+        """
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return {'version': catalog.version, 'total_questions': len(catalog), 'genres': catalog.genres()}
+        
+        summary = self._summary
+        if summary is not None and time.monotonic() - self._summary_checked_at < self.catalog_check_interval:
+            return summary
+        
+        try:
+            version = self.db_manager.get_catalog_version()
+            if summary is None or summary['version'] != version:
+                rows = self.db_manager.execute_query(
+                    'SELECT genre, COUNT(*) AS count FROM questions GROUP BY genre'
+                ) or []
+                genres = sorted(
+                    ({'name': row['genre'], 'count': row['count']} for row in rows if row['genre'] is not None),
+                    key=lambda genre: genre['name']
+                )
+                summary = {
+                    'version': version,
+                    'total_questions': sum(row['count'] for row in rows),
+                    'genres': genres
+                }
+                self._summary = summary
+            self._summary_checked_at = time.monotonic()
+        except Exception as e:
+            print(f"Error getting question summary: {e}")
+            return summary or {'version': None, 'total_questions': 0, 'genres': []}
+        return summary
+    
+    @staticmethod
+    def _make_pool(version, ids, genres, slots=None):
+        # 位置が振られていない問題（取り込み直後など）はビットセットのマスクに含めない
+        slots = tuple((slots or {}).get(question_id) for question_id in ids)
+        placed = [(slot, genre) for slot, genre in zip(slots, genres) if slot is not None]
+        return {
+            'version': version,
+            'ids': ids,
+            'genres': genres,
+            'slots': slots,
+            'slot_ids': {slot: question_id for question_id, slot in zip(ids, slots) if slot is not None},
+            'masks': coverage.build_masks([slot for slot, _ in placed], [genre for _, genre in placed]),
+        }
+    
+    def get_question_pool(self):
+        """
+        出題候補の問題IDとジャンル（重み付き出題用）
 
-                # 選択肢が画像URLかどうかを判定
-                question['has_image_choices'] = False
-                if question['choices']:
-                    first_choice = list(question['choices'].values())[0]
-                    question['has_image_choices'] = self.is_image_url(first_choice)
+        カタログが有効ならカタログから、無効な場合は catalog_version が変わったときにだけ
+        1回のクエリで読み直す。version が同じ間は同じオブジェクトを返す。
 
-                # choice_imagesがあれば処理
-                if question.get('choice_images') and isinstance(question['choice_images'], str):
-                    question['choice_images'] = json.loads(question['choice_images'])
-                else:
-                    question['choice_images'] = None
-                
-                questions.append(question)
-            
-            return questions
+        Returns:
+            {'version', 'ids': 問題IDのタプル, 'genres': 同じ順のジャンルのタプル,
+             'slots': 同じ順のビットセットの位置のタプル, 'slot_ids': {位置: 問題ID},
+             'masks': ジャンルごとの問題の位置のビットマスク（coverage.build_masks）}
+        """
+        pool = self._pool
+        catalog = self._current_catalog()
+        if catalog is not None:
+            if pool is None or pool['version'] != catalog.version:
+                questions = list(catalog)
+                pool = self._make_pool(
+                    catalog.version,
+                    tuple(question['id'] for question in questions),
+                    tuple(question.get('genre') for question in questions),
+                    self.db_manager.get_coverage_slots()
+                )
+                self._pool = pool
+            return pool
+        
+        if pool is not None and time.monotonic() - self._pool_checked_at < self.catalog_check_interval:
+            return pool
+        
+        try:
+            version = self.db_manager.get_catalog_version()
+            if pool is None or pool['version'] != version:
+                slots = self.db_manager.get_coverage_slots()
+                rows = self.db_manager.execute_query('SELECT id, genre FROM questions ORDER BY id') or []
+                pool = self._make_pool(
+                    version,
+                    tuple(row['id'] for row in rows),
+                    tuple(row['genre'] for row in rows),
+                    slots
+                )
+                self._pool = pool
+            self._pool_checked_at = time.monotonic()
         except Exception as e:
-            print(f"Error getting questions by genre {genre}: {e}")
-            return []
+            print(f"Error getting question pool: {e}")
+            return pool or self._make_pool(None, (), ())
+        return pool
     
     def get_all_genres(self):
         """すべてのジャンル一覧を取得"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return catalog.genres()
+        
         try:
+            # ジャンル別問題数も1回のクエリで取得
             result = self.db_manager.execute_query(
-                'SELECT DISTINCT genre FROM questions WHERE genre IS NOT NULL ORDER BY genre'
+                'SELECT genre, COUNT(*) as count FROM questions WHERE genre IS NOT NULL GROUP BY genre ORDER BY genre'
             )
-            
-            genres = []
-            for row in result:
-                genre = row['genre']
-                # ジャンル別問題数も取得
-                count_result = self.db_manager.execute_query(
-                    'SELECT COUNT(*) as count FROM questions WHERE genre = ?', (genre,)
-                )
-                count = count_result[0]['count'] if count_result else 0
-                
-                genres.append({
-                    'name': genre,
-                    'count': count
-                })
-            
-            return genres
+            return [{'name': row['genre'], 'count': row['count']} for row in result]
         except Exception as e:
             print(f"Error getting genres: {e}")
             return []
     
     def get_random_question(self):
         """ランダムに1問取得（前回と同じ問題を避ける）"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            question = catalog.random_question(exclude_id=self.last_question_id)
+            if question:
+                self.last_question_id = question['id']
+            return question
+        
         try:
             # DBごとのランダム関数
             if self.db_manager.db_type == 'mysql':
@@ -265,38 +390,7 @@ class QuestionManager:
                 )
             
             if result:
-                question = dict(result[0])
-                
-                # question text sanitize & image normalization
-                question['question_text'] = self.sanitize_question_text(question.get('question_text'))
-                question['image_url'] = self.normalize_media_value(question.get('image_url'))
-
-                # choicesをJSONパース
-                if isinstance(question['choices'], str):
-                    question['choices'] = json.loads(question['choices'])
-
-                if isinstance(question.get('choices'), dict):
-                    cleaned_choices = {}
-                    for ck, cv in question['choices'].items():
-                        cleaned_val = self.normalize_choice_value(cv)
-                        if cleaned_val:
-                            cleaned_choices[ck] = cleaned_val
-                    question['choices'] = cleaned_choices
-                else:
-                    question['choices'] = {}
-
-                # 選択肢が画像URLかどうかを判定
-                question['has_image_choices'] = False
-                if question['choices']:
-                    first_choice = list(question['choices'].values())[0]
-                    question['has_image_choices'] = self.is_image_url(first_choice)
-
-                # choice_imagesがあれば処理
-                if question.get('choice_images') and isinstance(question['choice_images'], str):
-                    question['choice_images'] = json.loads(question['choice_images'])
-                else:
-                    question['choice_images'] = None
-                
+                question = self.prepare_question(result[0])
                 self.last_question_id = question['id']  # 今回の問題IDを記録
                 return question
             return None
@@ -306,6 +400,10 @@ class QuestionManager:
     
     def get_total_questions(self):
         """総問題数を取得"""
+        catalog = self._current_catalog()
+        if catalog is not None:
+            return len(catalog)
+        
         try:
             result = self.db_manager.execute_query('SELECT COUNT(*) as count FROM questions')
             return result[0]['count'] if result else 0
@@ -332,28 +430,59 @@ class QuestionManager:
             print(f"Error checking answer: {e}")
             return {'error': '解答の確認中にエラーが発生しました'}
     
+    def answer_choice(self, question, user_answer):
+        """選択肢ごとの集計に数える選択肢のキー（問題の選択肢に無い解答はNone）"""
+        choices = question.get('choices') if question else None
+        if isinstance(choices, dict) and user_answer in choices and len(user_answer) <= self.db_manager.CHOICE_MAX_LENGTH:
+            return user_answer
+        return None
+    
+    def get_item_stats(self, question_id):
+        """
+        問題の解答統計（正答率・選択肢ごとの選択率。解答数が少なければNone）
+
+        ワーカーのメモリ上のスナップショットから返すので、解答のたびにDBを読まない。
+        """
+        try:
+            return self.item_stats.get(self.db_manager, question_id)
+        except Exception as e:
+            print(f"Error getting item stats: {e}")
+            return None
+    
     def save_answer_history(self, question_id, user_answer, is_correct, user_id):
         """解答履歴を保存（user_idを引数で受け取る）"""
         try:
-            if self.db_manager.db_type == 'mysql':
-                self.db_manager.execute_query(
-                    '''INSERT INTO user_answers 
-                       (user_id, question_id, user_answer, is_correct, answered_at) 
-                       VALUES (%s, %s, %s, %s, %s)''',
-                    (user_id, question_id, user_answer, is_correct, datetime.now())
-                )
-            else:
-                self.db_manager.execute_query(
+            is_correct_value = is_correct if self.db_manager.db_type == 'mysql' else int(is_correct)
+            question = self.get_question(question_id)
+            genre = question.get('genre') if question else None
+            choice = self.answer_choice(question, user_answer)
+            answered_at = datetime.now()
+            # 回答の追加と件数カウンター・各集計・復習状態の更新は同じトランザクションで行う
+            with self.db_manager.transaction() as tx:
+                tx.execute(
                     '''INSERT INTO user_answers 
                        (user_id, question_id, user_answer, is_correct, answered_at) 
                        VALUES (?, ?, ?, ?, ?)''',
-                    (user_id, question_id, user_answer, int(is_correct), datetime.now())
+                    (user_id, question_id, user_answer, is_correct_value, answered_at)
                 )
-            # 回答保存後に集計を更新
-            try:
-                self.db_manager.update_user_stats(user_id)
-            except Exception as stats_error:
-                print(f"Failed to update user_stats for user {user_id}: {stats_error}")
+                self.db_manager.increment_counter('answers', 1, tx=tx)
+                # ダッシュボード・ランキング用のユーザーごとの集計（統計バージョンも進める）
+                self.db_manager.record_user_answer(user_id, is_correct, answered_at, tx=tx)
+                # 期間・ジャンル別ランキング用の日別集計
+                self.db_manager.record_daily_answer(user_id, genre, is_correct, answered_at.date(), tx=tx)
+                # 分野別の正答率・苦手分野用のジャンル別集計
+                self.db_manager.record_genre_answer(user_id, genre, is_correct, answered_at, tx=tx)
+                # 苦手な問題を多く出題するための問題ごとの誤答回数
+                self.db_manager.record_question_answer(user_id, question_id, is_correct, answered_at, tx=tx)
+                # 間違えた問題の復習スケジュール（SM-2）
+                spaced_repetition.record_answer(self.db_manager, user_id, question_id, is_correct, answered_at, tx=tx)
+                # 間違えた問題の一覧（正解するまで残す）
+                self.db_manager.record_mistake(user_id, question_id, is_correct, answered_at, tx=tx)
+                # 解答済みの問題のビットセット（分野ごとの進み具合・未解答の問題からの出題用）
+                self.db_manager.record_coverage(user_id, question_id, answered_at, tx=tx)
+                # 問題ごとの正答率・選択肢ごとの選択数
+                self.db_manager.record_item_answer(question_id, choice, is_correct, answered_at, tx=tx)
+            self.item_stats.record(question_id, choice, is_correct)
             return True
         except Exception as e:
             print(f"解答履歴保存エラー: {e}")
@@ -365,124 +494,106 @@ class QuestionManager:
         match = re.search(r'(\d{4})', filename)
         return match.group(1) if match else None
     
-    def save_questions(self, questions, source_file=''):
-        """問題リストをデータベースに保存"""
-        saved_count = 0
-        errors = []
+    def save_questions(self, questions, source_file='', chunk_size=None, progress_callback=None):
+        """
+        問題リストをデータベースに保存（差分取り込み）
+
+        questions はリストだけでなく任意のイテラブル（逐次パーサーの出力など）を受け付ける。
+        検証・正規化・ハッシュ計算は import_processes 個のプロセスで並列に行い、
+        chunk_size 件ごとに保存済みの content_hash と比較して新規はINSERT、
+        内容が変わった問題のみUPDATEし、変更のない問題は書き込まない。
+        progress_callback(rows, saved_count) はチャンクを書き込むたびに呼ばれる。
+        """
+        from app.services.question_pipeline import QuestionImportPipeline
         
+        pipeline = QuestionImportPipeline(
+            self,
+            processes=self.import_processes,
+            chunk_size=chunk_size or self.import_chunk_size
+        )
         try:
-            # ファイル名から年度を抽出して、既にその年度の問題が登録されているかチェック
-            year = self.extract_year_from_filename(source_file)
-            if year and self.check_year_exists(year):
-                return {
-                    'saved_count': 0,
-                    'total_count': len(questions),
-                    'errors': [f'{year}年度の問題は既に登録されています。データを初期化してから再度アップロードしてください。']
-                }
-            
-            for i, question in enumerate(questions):
-                try:
-                    # 必須フィールドの確認
-                    required_fields = ['question_text', 'choices', 'correct_answer']
-                    if not all(key in question for key in required_fields):
-                        errors.append(f"問題 {i+1}: 必須フィールドが不足しています")
-                        continue
-                    
-                    cleaned_choices = {}
-                    if isinstance(question.get('choices'), dict):
-                        for ck, cv in question['choices'].items():
-                            cleaned_val = self.normalize_choice_value(cv)
-                            if cleaned_val:
-                                cleaned_choices[ck] = cleaned_val
-                    choices_json = json.dumps(cleaned_choices, ensure_ascii=False)
-                    
-                    # question_idの取得
-                    question_id = question.get('question_id', f"Q{i+1:03d}_{source_file}")
-                    
-                    # image_urlの処理（正規化して格納）
-                    image_url = self.normalize_media_value(question.get('image_url'))
-                    
-                    # choice_images（後方互換性のため保持）
-                    choice_images = question.get('choice_images')
-                    choice_images_json = None
-                    if choice_images and isinstance(choice_images, dict):
-                        valid_choice_images = {}
-                        for key, url in choice_images.items():
-                            if url and url not in ['null', 'None', 'undefined', '']:
-                                valid_choice_images[key] = url
-                        
-                        if valid_choice_images:
-                            choice_images_json = json.dumps(valid_choice_images, ensure_ascii=False)
-                    
-                    # 重複チェック（question_idで）
-                    if self.db_manager.db_type == 'mysql':
-                        existing = self.db_manager.execute_query(
-                            'SELECT id FROM questions WHERE question_id = %s',
-                            (question_id,)
-                        )
-                    else:
-                        existing = self.db_manager.execute_query(
-                            'SELECT id FROM questions WHERE question_id = ?',
-                            (question_id,)
-                        )
-                    
-                    if not existing:
-                        # 新しい問題を挿入
-                        if self.db_manager.db_type == 'mysql':
-                            self.db_manager.execute_query(
-                                '''INSERT INTO questions 
-                                   (question_id, question_text, choices, correct_answer, explanation, genre, image_url, choice_images) 
-                                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
-                                (
-                                    question_id,
-                                    self.sanitize_question_text(question.get('question_text')),
-                                    choices_json,
-                                    question['correct_answer'],
-                                    question.get('explanation', ''),
-                                    question.get('genre', 'その他'),
-                                    image_url,
-                                    choice_images_json
-                                )
-                            )
-                        else:
-                            self.db_manager.execute_query(
-                                '''INSERT INTO questions 
-                                   (question_id, question_text, choices, correct_answer, explanation, genre, image_url, choice_images) 
-                                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                                (
-                                    question_id,
-                                    self.sanitize_question_text(question.get('question_text')),
-                                    choices_json,
-                                    question['correct_answer'],
-                                    question.get('explanation', ''),
-                                    question.get('genre', 'その他'),
-                                    image_url,
-                                    choice_images_json
-                                )
-                            )
-                        saved_count += 1
-                    else:
-                        errors.append(f"問題 {question_id}: 既に登録されています（スキップ）")
-                    
-                except Exception as e:
-                    error_msg = f"問題保存エラー {question.get('question_id', f'Q{i+1}')}: {e}"
-                    errors.append(error_msg)
-                    print(error_msg)
-                    continue
-            
-            print(f"データベースに {saved_count}問を保存しました")
-            
+            result = pipeline.run(questions, source_file, normalize=True, progress_callback=progress_callback)
         except Exception as e:
             error_msg = f"Database save error: {e}"
-            errors.append(error_msg)
             print(error_msg)
+            return {'saved_count': 0, 'total_count': 0, 'errors': [error_msg]}
+        
+        print(f"データベースに 新規{result['inserted']}問 / 更新{result['updated']}問を保存しました（変更なし{result['unchanged']}問）")
         
         return {
-            'saved_count': saved_count,
-            'total_count': len(questions),
-            'errors': errors
+            'saved_count': result['count'],
+            'total_count': result['rows'],
+            'inserted': result['inserted'],
+            'updated': result['updated'],
+            'unchanged': result['unchanged'],
+            'errors': result['errors']
         }
     
+    def _build_question_row(self, question, index, source_file=''):
+        """問題データを正規化して書き込み用のタプルに変換（必須フィールド不足時はNone）"""
+        return question_normalize.build_question_row(question, index, source_file)
+    
+    @staticmethod
+    def question_content_hash(row):
+        """保存する列の値（question_idを除く）から内容ハッシュを計算"""
+        return question_normalize.question_content_hash(row)
+    
+    def write_question_rows(self, rows, content_hashes=None):
+        """
+        問題行を保存済みの内容ハッシュと比較して書き込む
+
+        rows は (question_id, question_text, choices, correct_answer, explanation,
+        genre, image_url, choice_images) のタプル。content_hashes を渡した場合は
+        計算済みのハッシュとして使う。1チャンクにつき既存ハッシュの
+        読み込み1回と、INSERT/UPDATEそれぞれの一括実行のみを行う。
+
+        Returns:
+            {'inserted': 件数, 'updated': 件数, 'unchanged': 件数}
+        """
+        if content_hashes is None:
+            content_hashes = [self.question_content_hash(row) for row in rows]
+        
+        # 同一チャンク内で question_id が重複した場合は後勝ち
+        latest = {}
+        for row, content_hash in zip(rows, content_hashes):
+            latest[row[0]] = (row, content_hash)
+        if not latest:
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        
+        question_ids = list(latest.keys())
+        placeholders = ', '.join(['?'] * len(question_ids))
+        existing = self.db_manager.execute_query(
+            f'SELECT question_id, content_hash FROM questions WHERE question_id IN ({placeholders})',
+            tuple(question_ids)
+        ) or []
+        stored_hashes = {row['question_id']: row['content_hash'] for row in existing}
+        
+        inserts = []
+        updates = []
+        unchanged = 0
+        for question_id, (row, content_hash) in latest.items():
+            if question_id not in stored_hashes:
+                inserts.append(row + (content_hash,))
+            elif stored_hashes[question_id] != content_hash:
+                updates.append(row[1:] + (content_hash, question_id))
+            else:
+                unchanged += 1
+        
+        self.db_manager.execute_many(
+            '''INSERT INTO questions 
+               (question_id, question_text, choices, correct_answer, explanation, genre, image_url, choice_images, content_hash) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            inserts
+        )
+        self.db_manager.execute_many(
+            '''UPDATE questions 
+               SET question_text = ?, choices = ?, correct_answer = ?, explanation = ?,
+                   genre = ?, image_url = ?, choice_images = ?, content_hash = ?
+               WHERE question_id = ?''',
+            updates
+        )
+        return {'inserted': len(inserts), 'updated': len(updates), 'unchanged': unchanged}
+    
     def check_year_exists(self, year):
         """指定された年度の問題が既に登録されているかチェック"""
         try:
@@ -505,6 +616,8 @@ class QuestionManager:
         """すべての問題を削除（学習履歴は保持）"""
         try:
             self.db_manager.execute_query('DELETE FROM questions')
+            self.db_manager.bump_catalog_version()
+            self.invalidate_catalog()
             print("✅ すべての問題を削除しました")
             # 学習履歴は削除しない！
             return {'success': True, 'message': 'すべての問題を削除しました（学習履歴は保持）'}
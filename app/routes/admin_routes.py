@@ -1,7 +1,7 @@
 """
 管理者用ユーザー管理機能
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, jsonify, stream_with_context
 from app.core.auth import admin_required
 
 admin_bp = Blueprint('admin', __name__)
@@ -17,21 +17,36 @@ def admin_dashboard():
     
     return render_template('admin/dashboard.html', stats=stats)
 
+# ユーザー一覧の1ページあたりの件数
+USERS_PER_PAGE = 50
+
 @admin_bp.route('/admin/users')
 @admin_required
 def user_management():
-    """ユーザー管理画面"""
+    """ユーザー管理画面（?q=ユーザー名の前方一致 &sort= &order=asc|desc &page=）"""
     db_manager = current_app.db_manager
     
-    # ユーザー一覧と統計の取得
-    users = _get_users_with_stats(db_manager)
-    total_users = len(users)
-    active_users = len([u for u in users if not u.get('is_inactive')])
+    query = request.args.get('q', '').strip()[:80]
+    sort = request.args.get('sort', 'created_at')
+    if sort not in db_manager.USER_LIST_SORTS:
+        sort = 'created_at'
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    
+    users, matched_users = _get_users_page(db_manager, query, sort, order, page)
+    total_pages = max((matched_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE, 1)
+    total_users, active_users = _get_user_counts(db_manager)
     
     return render_template('admin/users.html', 
                          users=users, 
                          total_users=total_users,
-                         active_users=active_users)
+                         active_users=active_users,
+                         matched_users=matched_users,
+                         query=query,
+                         sort=sort,
+                         order=order,
+                         page=page,
+                         total_pages=total_pages)
 
 @admin_bp.route('/admin/users/<int:user_id>')
 @admin_required
@@ -105,15 +120,51 @@ def delete_user(user_id):
             flash('管理者アカウントは削除できません。先に管理者権限を削除してください。', 'error')
             return redirect(url_for('admin.user_management'))
         
-        # ユーザーの解答履歴を削除
-        db_manager.execute_query(
-            "DELETE FROM user_answers WHERE user_id = ?", (user_id,)
-        )
-        
-        # ユーザーを削除
-        db_manager.execute_query(
-            "DELETE FROM users WHERE id = ?", (user_id,)
-        )
+        # 解答履歴・集計・ユーザーの削除と件数カウンターの更新を同じトランザクションで行う
+        with db_manager.transaction() as tx:
+            # 問題ごとの解答統計から、このユーザーの解答を差し引く
+            db_manager.remove_user_item_answers(user_id, tx)
+            answers_deleted = tx.execute(
+                "DELETE FROM user_answers WHERE user_id = ?", (user_id,)
+            )
+            # 1問以上解答していたかは削除した行数で分かる（active_users の減算に使う）
+            active_deleted = tx.execute(
+                "DELETE FROM user_stats WHERE user_id = ? AND total_answers > 0", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_stats WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_daily_stats WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_genre_stats WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_question_stats WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM review_items WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_mistakes WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_coverage WHERE user_id = ?", (user_id,)
+            )
+            tx.execute(
+                "DELETE FROM user_ability WHERE user_id = ?", (user_id,)
+            )
+            users_deleted = tx.execute(
+                "DELETE FROM users WHERE id = ?", (user_id,)
+            )
+            db_manager.increment_counter('answers', -answers_deleted, tx=tx)
+            db_manager.increment_counter('users', -users_deleted, tx=tx)
+            db_manager.increment_counter('active_users', -active_deleted, tx=tx)
+            # 各ワーカーのランキングに全件を読み直させる
+            db_manager.increment_meta('leaderboard_epoch', 1, tx=tx)
+        # このワーカーの問題ごとの解答統計を読み直させる（他のワーカーは定期的な読み直しで反映）
+        current_app.question_manager.item_stats.reset()
         
         flash(f'ユーザー「{username}」を完全に削除しました。', 'success')
     except Exception as e:
@@ -121,34 +172,82 @@ def delete_user(user_id):
     
     return redirect(url_for('admin.user_management'))
 
+# 問題の難易度一覧の1ページあたりの件数
+ITEMS_PER_PAGE = 50
+# 難易度一覧に出す最小の解答数（少なすぎる問題は正答率が安定しない）
+ITEM_MIN_ATTEMPTS = 5
+
+@admin_bp.route('/admin/questions/stats')
+@admin_required
+def question_stats():
+    """問題の難易度一覧（正答率の低い順。?min_attempts= &page=）"""
+    min_attempts = max(request.args.get('min_attempts', ITEM_MIN_ATTEMPTS, type=int) or 1, 1)
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    
+    try:
+        items, matched = current_app.db_manager.get_item_difficulty_page(
+            min_attempts=min_attempts,
+            limit=ITEMS_PER_PAGE,
+            offset=(page - 1) * ITEMS_PER_PAGE
+        )
+    except Exception as e:
+        print(f"Error getting question stats: {e}")
+        items, matched = [], 0
+    
+    for item in items:
+        attempts = int(item['attempts'] or 0)
+        item['accuracy_rate'] = float(item['accuracy_rate'] or 0)
+        item['choice_rates'] = [
+            (choice, round(count * 100.0 / attempts, 1) if attempts else 0.0)
+            for choice, count in sorted(item['choices'].items())
+        ]
+        most_chosen = max(sorted(item['choices']), key=item['choices'].get) if item['choices'] else None
+        # 正解より多く選ばれた選択肢がある問題は、正解・問題文の誤りを疑う
+        item['suspicious'] = most_chosen is not None and most_chosen != item['correct_answer']
+        item['most_chosen'] = most_chosen
+    total_pages = max((matched + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, 1)
+    
+    return render_template('admin/question_stats.html',
+                         items=items,
+                         matched=matched,
+                         min_attempts=min_attempts,
+                         page=page,
+                         total_pages=total_pages)
+
+@admin_bp.route('/admin/export/answers')
+@admin_required
+def export_all_answers():
+    """全ユーザーの解答履歴のダウンロード（?format=csv|ndjson。主キー順に一定件数ずつ読んで送る）"""
+    from app.services import history_export
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in history_export.FORMATS:
+        return jsonify({'error': '形式は csv または ndjson を指定してください'}), 400
+    
+    rows = history_export.iter_all_answers(current_app.db_manager)
+    response = current_app.response_class(
+        stream_with_context(history_export.render(rows, fmt, history_export.ALL_USERS_COLUMNS)),
+        mimetype=history_export.FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=answer_history_all.{fmt}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 def _get_system_stats(db_manager):
-    """システム統計取得"""
+    """
+    システム統計取得
+
+    問題数・ジャンル数は問題カタログ（またはそのキャッシュ）から、ユーザー数・解答数は
+    件数カウンターから読むので、テーブル全体の COUNT(*) はメンテナンス処理の再集計のときだけ行う。
+    """
     try:
-        # 総問題数
-        questions_count = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM questions"
-        )[0]['count']
-        
-        # 総ユーザー数
-        users_count = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM users"
-        )[0]['count']
-        
-        # 総解答数
-        answers_count = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM user_answers"
-        )[0]['count']
-        
-        # ジャンル数
-        genres_count = db_manager.execute_query(
-            "SELECT COUNT(DISTINCT genre) as count FROM questions WHERE genre IS NOT NULL"
-        )[0]['count']
-        
+        summary = current_app.question_manager.get_question_summary()
+        counters = db_manager.get_counters()
         return {
-            'questions_count': questions_count,
-            'users_count': users_count,
-            'answers_count': answers_count,
-            'genres_count': genres_count
+            'questions_count': summary['total_questions'],
+            'users_count': counters['users'],
+            'answers_count': counters['answers'],
+            'genres_count': len([genre for genre in summary['genres'] if genre['name']])
         }
     except Exception:
         return {
@@ -158,41 +257,38 @@ def _get_system_stats(db_manager):
             'genres_count': 0
         }
 
-def _get_users_with_stats(db_manager):
-    """統計付きユーザー一覧取得"""
+def _format_date(value):
+    """日付を表示用の文字列（YYYY-MM-DD）に変換"""
+    if not value:
+        return value
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+def _get_users_page(db_manager, query, sort, order, page):
+    """統計付きユーザー一覧の1ページ（user_stats から読む）"""
     try:
-        users = db_manager.execute_query("""
-            SELECT u.id, u.username, u.created_at, u.is_admin,
-                   COUNT(ua.id) as total_answers,
-                   SUM(CASE WHEN ua.is_correct THEN 1 ELSE 0 END) as correct_answers,
-                   MAX(ua.answered_at) as last_activity
-            FROM users u
-            LEFT JOIN user_answers ua ON u.id = ua.user_id
-            GROUP BY u.id, u.username, u.created_at, u.is_admin
-            ORDER BY u.created_at DESC
-        """)
-        
-        # 正答率とdatetime変換を処理
+        users, matched = db_manager.get_users_page(
+            prefix=query,
+            sort=sort,
+            descending=(order == 'desc'),
+            limit=USERS_PER_PAGE,
+            offset=(page - 1) * USERS_PER_PAGE
+        )
         for user in users:
-            if user['total_answers'] > 0:
-                user['accuracy_rate'] = round((user['correct_answers'] / user['total_answers']) * 100, 1)
-            else:
-                user['accuracy_rate'] = 0
-            
-            # datetime を文字列に変換
-            if user.get('created_at'):
-                if hasattr(user['created_at'], 'strftime'):
-                    user['created_at'] = user['created_at'].strftime('%Y-%m-%d')
-                elif isinstance(user['created_at'], str):
-                    user['created_at'] = user['created_at'][:10]
-            
-            if user.get('last_activity'):
-                if hasattr(user['last_activity'], 'strftime'):
-                    user['last_activity'] = user['last_activity'].strftime('%Y-%m-%d')
-                elif isinstance(user['last_activity'], str):
-                    user['last_activity'] = user['last_activity'][:10]
-                
-        return users
+            user['accuracy_rate'] = float(user['accuracy_rate'] or 0)
+            user['created_at'] = _format_date(user.get('created_at'))
+            user['last_activity'] = _format_date(user.get('last_activity'))
+        return users, matched
     except Exception as e:
         print(f"Error getting users: {e}")
-        return []
\ No newline at end of file
+        return [], 0
+
+def _get_user_counts(db_manager):
+    """総ユーザー数と1問以上解答したユーザー数（どちらも件数カウンターを読むだけ）"""
+    try:
+        counters = db_manager.get_counters()
+        return counters['users'], counters['active_users']
+    except Exception as e:
+        print(f"Error counting users: {e}")
+        return 0, 0
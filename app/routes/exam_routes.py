@@ -11,9 +11,6 @@ import uuid
 
 exam_bp = Blueprint('exam', __name__)
 
-# メモリ内に試験データを保存（本番ではRedisなど使用）
-exam_sessions = {}
-
 def is_image_url(text):
     """テキストが画像URLかどうかを判定"""
     if not text or not isinstance(text, str):
@@ -301,17 +298,19 @@ def mock_exam_start(exam_code):
         # 画像選択肢フラグを追加
         matched_questions = add_image_choice_flags(matched_questions)
 
+        # セッション（Cookie）に保持する問題数の上限を超える分は出題せず、その旨を表示する
+        max_questions = current_app.config.get('EXAM_MAX_QUESTIONS') or 0
+        if max_questions and len(matched_questions) > max_questions:
+            flash(f'この試験は{len(matched_questions)}問ありますが、1回の模擬試験では先頭の{max_questions}問だけを出題します', 'warning')
+            matched_questions = matched_questions[:max_questions]
+
         # 試験セッションIDを生成
         exam_session_id = str(uuid.uuid4())
 
-        # メモリに保存（セッションではなく）
-        exam_sessions[exam_session_id] = {
-            'questions': matched_questions,
-            'user_id': session.get('user_id')
-        }
-
-        # セッションにはIDだけ保存
+        # セッションには問題IDの並びだけを保存し、採点時にDB（カタログ）から引き直す。
+        # プロセス内メモリに置くと、複数ワーカー構成で別ワーカーに採点リクエストが届いたときに見つからない
         session['exam_session_id'] = exam_session_id
+        session['exam_question_ids'] = [q['id'] for q in matched_questions]
         session.modified = True
 
         print(f"📚 Created exam session: {exam_session_id} with {len(matched_questions)} questions")
@@ -347,13 +346,13 @@ def submit_mock_exam():
         print(f"📝 Received answers: {len(answers)} questions")
         print(f"📊 Exam session ID: {exam_session_id}")
         
-        # メモリから問題を取得
-        if not exam_session_id or exam_session_id not in exam_sessions:
+        # セッションの問題IDから問題を取得
+        question_ids = session.get('exam_question_ids')
+        if not exam_session_id or exam_session_id != session.get('exam_session_id') or not question_ids:
             print(f"❌ No exam session found for ID: {exam_session_id}")
             return jsonify({'error': '試験セッションが見つかりません。ページを再読み込みして試験を再開してください。'}), 400
         
-        exam_data = exam_sessions[exam_session_id]
-        questions = exam_data['questions']
+        questions = current_app.question_manager.get_questions_by_ids(question_ids)
         
         print(f"📚 Questions from session: {len(questions)}")
         
@@ -386,8 +385,8 @@ def submit_mock_exam():
         score = round((correct_count / total_count) * 100, 1) if total_count > 0 else 0
         
         # 試験セッションを削除
-        del exam_sessions[exam_session_id]
         session.pop('exam_session_id', None)
+        session.pop('exam_question_ids', None)
         
         print(f"✅ Result: {correct_count}/{total_count} = {score}%")
         
@@ -1,8 +1,14 @@
 """
 メインページのルーティング
 """
-from flask import Blueprint, render_template, session, redirect, url_for, current_app, jsonify
+import base64
+import binascii
+import json
+from datetime import date, timedelta
+
+from flask import Blueprint, render_template, session, redirect, url_for, current_app, jsonify, request, stream_with_context
 from app.core.auth import login_required
+from app.services import genre_stats
 
 main_bp = Blueprint('main', __name__)
 
@@ -25,146 +31,282 @@ def index():
         # 未ログインユーザーはログインページへリダイレクト
         return redirect(url_for('login'))
 
+def _user_stats(user_id, total_questions):
+    """
+    ユーザーの統計（user_stats の1行を主キー相当の user_id で引くだけ）
+
+    Returns:
+        (統計のdict, 統計バージョン)
+    """
+    stats = {
+        'total_questions': total_questions,
+        'correct_answers': 0,
+        'accuracy_rate': 0,
+        'total_answers': 0
+    }
+    stats_version = 0
+    if user_id:
+        row = current_app.db_manager.get_stats_row(user_id)
+        if row:
+            stats['total_answers'] = row['total_answers'] or 0
+            stats['correct_answers'] = row['correct_answers'] or 0
+            stats['accuracy_rate'] = float(row['accuracy_rate'] or 0)
+            stats_version = row['stats_version'] or 0
+    return stats, stats_version
+
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """ダッシュボード"""
-    db_manager = current_app.db_manager
-    question_manager = current_app.question_manager
+    """
+    ダッシュボード
+
+    問題数・ジャンル一覧はキャッシュ（カタログ）から、ユーザーの統計は user_genre_stats から取得し、
+    1回の表示で発行するクエリはユーザーのジャンル別集計の読み出し1回だけにする
+    （全体の解答数・正答率はジャンル別の合計から求める）。
+    """
+    summary = current_app.question_manager.get_question_summary()
     user_id = session.get('user_id')
-    
-    # 統計情報を取得
+    rows = current_app.db_manager.get_genre_stats(user_id) if user_id else []
+    progress = genre_stats.summarize(rows, summary['genres'])
     stats = {
-        'total_questions': question_manager.get_total_questions(),
-        'correct_answers': 0,
-        'accuracy_rate': 0,
-        'total_answers': 0
+        'total_questions': summary['total_questions'],
+        'correct_answers': progress['correct_answers'],
+        'accuracy_rate': progress['accuracy_rate'],
+        'total_answers': progress['total_answers']
     }
+    return render_template('dashboard.html', stats=stats, genres=summary['genres'], genre_progress=progress)
+
+def _stats_etag(user_id, stats_version, total_questions):
+    """/api/stats の ETag（ユーザーの統計バージョンと問題数から作る）"""
+    return f"stats-{user_id}-{stats_version}-{total_questions}"
+
+@main_bp.route('/api/stats')
+@login_required
+def api_stats():
+    """
+    ダッシュボードの統計（JSON）
+
+    user_stats の1行（user_id で引くだけ）とカタログの問題数だけを返す。
+    行の統計バージョンから作った ETag が If-None-Match と一致すれば本文を返さずに304を返す
+    （統計バージョンは解答の保存と同じトランザクションで進むので、他の端末での解答もすぐに反映される）。
+    """
+    user_id = session.get('user_id')
+    total_questions = current_app.question_manager.get_question_summary()['total_questions']
+    stats, stats_version = _user_stats(user_id, total_questions)
     
-    # ジャンル一覧を取得
-    genres = question_manager.get_all_genres()
+    response = jsonify(stats)
+    response.set_etag(_stats_etag(user_id, stats_version, total_questions), weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 学習履歴の1ページあたりの件数
+HISTORY_PAGE_SIZE = 30
+HISTORY_MAX_PAGE_SIZE = 100
+# 一覧に載せる問題文の長さ（全文・解説は必要になったときに取得する）
+HISTORY_TEXT_LENGTH = 50
+
+def _format_answered_at(value):
+    """解答日時を表示用の文字列に変換"""
+    if not value:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d %H:%M')
+    # MySQL・SQLiteから文字列として返される場合は最初の16文字を取得
+    return str(value)[:16]
+
+def _encode_history_cursor(row):
+    """次のページのカーソル（最後の行の answered_at, id）"""
+    raw = json.dumps([str(row['answered_at']), row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_history_cursor(cursor):
+    """カーソルを (answered_at, id) に戻す（不正な値は ValueError）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        answered_at, answer_id = json.loads(raw)
+        return str(answered_at), int(answer_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'invalid cursor: {e}')
+
+def _history_page(user_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """
+    学習履歴の1ページ（回答はキーセットで取得し、問題はカタログからまとめて引く）
+
+    Returns:
+        (行のリスト, 次のページのカーソル または None)
+    """
+    before = _decode_history_cursor(cursor) if cursor else None
+    answers = current_app.db_manager.get_answer_history(user_id, before=before, limit=limit + 1)
+    next_cursor = _encode_history_cursor(answers[limit - 1]) if len(answers) > limit else None
+    answers = answers[:limit]
     
-    if user_id and user_id != 'admin':
-        # ユーザーの解答統計を取得
-        user_stats = db_manager.execute_query('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct
-            FROM user_answers 
-            WHERE user_id = ?
-        ''', (user_id,))
-        
-        if user_stats and user_stats[0]['total'] > 0:
-            stats['total_answers'] = user_stats[0]['total']
-            stats['correct_answers'] = user_stats[0]['correct'] or 0
-            if stats['total_answers'] > 0:
-                stats['accuracy_rate'] = round((stats['correct_answers'] / stats['total_answers']) * 100, 1)
+    question_ids = list(dict.fromkeys(answer['question_id'] for answer in answers))
+    questions = {q['id']: q for q in current_app.question_manager.get_questions_by_ids(question_ids)}
     
-    return render_template('dashboard.html', stats=stats, genres=genres)
+    rows = []
+    for answer in answers:
+        question = questions.get(answer['question_id'])
+        text = question['question_text'] if question else '（削除された問題）'
+        rows.append({
+            'id': answer['id'],
+            'question_id': answer['question_id'],
+            'question_text': text[:HISTORY_TEXT_LENGTH],
+            'truncated': len(text) > HISTORY_TEXT_LENGTH,
+            'genre': (question.get('genre') if question else None) or '不明',
+            'user_answer': answer['user_answer'],
+            'correct_answer': question['correct_answer'] if question else '不明',
+            'is_correct': bool(answer['is_correct']),
+            'has_explanation': bool(question and question.get('explanation')),
+            'answered_at': _format_answered_at(answer['answered_at'])
+        })
+    return rows, next_cursor
 
 @main_bp.route('/history')
 @login_required
 def history():
-    """学習履歴ページ"""
-    db_manager = current_app.db_manager
+    """学習履歴ページ（最初のページだけ描画し、続きはスクロールに合わせて /api/history から取得）"""
     user_id = session.get('user_id')
+    summary = current_app.question_manager.get_question_summary()
+    stats, _ = _user_stats(user_id, summary['total_questions'])
+    rows, next_cursor = _history_page(user_id)
+    return render_template('history.html', history=rows, stats=stats, next_cursor=next_cursor)
+
+MISTAKES_PER_PAGE = 50
+
+@main_bp.route('/mistakes')
+@login_required
+def mistakes():
+    """間違えた問題（まだ正解していない問題）の一覧（user_mistakes を読むだけで回答履歴は集計しない）"""
+    user_id = session.get('user_id')
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    rows, total = current_app.db_manager.get_mistakes(
+        user_id, limit=MISTAKES_PER_PAGE, offset=(page - 1) * MISTAKES_PER_PAGE
+    )
+    questions = {q['id']: q for q in current_app.question_manager.get_questions_by_ids([row['question_id'] for row in rows])}
     
-    # ユーザーの解答履歴を取得（解説も含む）
-    # 問題が削除されている場合も考慮してINNER JOINに変更
-    if db_manager.db_type == 'mysql':
-        history_data = db_manager.execute_query('''
-            SELECT 
-                ua.id,
-                ua.question_id,
-                COALESCE(q.question_text, '（削除された問題）') as question_text,
-                COALESCE(q.genre, '不明') as genre,
-                ua.user_answer,
-                COALESCE(q.correct_answer, '不明') as correct_answer,
-                q.explanation,
-                ua.is_correct,
-                ua.answered_at
-            FROM user_answers ua
-            LEFT JOIN questions q ON ua.question_id = q.id
-            WHERE ua.user_id = %s
-            ORDER BY ua.answered_at DESC
-            LIMIT 100
-        ''', (user_id,))
-    else:
-        history_data = db_manager.execute_query('''
-            SELECT 
-                ua.id,
-                ua.question_id,
-                COALESCE(q.question_text, '（削除された問題）') as question_text,
-                COALESCE(q.genre, '不明') as genre,
-                ua.user_answer,
-                COALESCE(q.correct_answer, '不明') as correct_answer,
-                q.explanation,
-                ua.is_correct,
-                ua.answered_at
-            FROM user_answers ua
-            LEFT JOIN questions q ON ua.question_id = q.id
-            WHERE ua.user_id = ?
-            ORDER BY ua.answered_at DESC
-            LIMIT 100
-        ''', (user_id,))
+    items = []
+    for row in rows:
+        question = questions.get(row['question_id'])
+        if question is None:
+            continue
+        text = question['question_text'] or ''
+        items.append({
+            'question_id': row['question_id'],
+            'question_code': question.get('question_id'),
+            'question_text': text[:HISTORY_TEXT_LENGTH],
+            'truncated': len(text) > HISTORY_TEXT_LENGTH,
+            'genre': question.get('genre') or '不明',
+            'miss_count': row['miss_count'],
+            'missed_at': _format_answered_at(row['missed_at'])
+        })
+    total_pages = max((total + MISTAKES_PER_PAGE - 1) // MISTAKES_PER_PAGE, 1)
+    return render_template('mistakes.html', mistakes=items, total=total, page=page, total_pages=total_pages)
+
+@main_bp.route('/api/history')
+@login_required
+def api_history():
+    """学習履歴（JSON。cursor で次のページを取得）"""
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        rows, next_cursor = _history_page(session.get('user_id'), request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({'error': '不正なパラメータです'}), 400
+    return jsonify({'items': rows, 'next_cursor': next_cursor})
+
+@main_bp.route('/api/history/<int:answer_id>/explanation')
+@login_required
+def api_history_explanation(answer_id):
+    """履歴の1件の問題文全文と解説（表示するときにだけ取得する）"""
+    answers = current_app.db_manager.execute_query(
+        'SELECT question_id FROM user_answers WHERE id = ? AND user_id = ?',
+        (answer_id, session.get('user_id'))
+    )
+    if not answers:
+        return jsonify({'error': '履歴が見つかりません'}), 404
+    question = current_app.question_manager.get_question(answers[0]['question_id'])
+    if not question:
+        return jsonify({'error': '問題が見つかりません'}), 404
+    return jsonify({
+        'question_text': question['question_text'],
+        'explanation': question.get('explanation') or ''
+    })
+
+@main_bp.route('/history/export')
+@login_required
+def export_history():
+    """自分の全解答履歴のダウンロード（?format=csv|ndjson。DBから読みながら送る）"""
+    from app.services import history_export
     
-    # Noneチェックとdatetime変換
-    safe_history = []
-    for item in history_data:
-        safe_item = dict(item)
-        if safe_item['question_text'] is None:
-            safe_item['question_text'] = '（削除された問題）'
-        if safe_item['genre'] is None:
-            safe_item['genre'] = '不明'
-        if safe_item['correct_answer'] is None:
-            safe_item['correct_answer'] = '不明'
-        
-        # datetime を文字列に変換
-        if safe_item.get('answered_at'):
-            if hasattr(safe_item['answered_at'], 'strftime'):
-                safe_item['answered_at'] = safe_item['answered_at'].strftime('%Y-%m-%d %H:%M')
-            elif isinstance(safe_item['answered_at'], str):
-                # MySQLから文字列として返される場合は最初の16文字を取得
-                safe_item['answered_at'] = safe_item['answered_at'][:16]
-        else:
-            safe_item['answered_at'] = None
-            
-        safe_history.append(safe_item)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in history_export.FORMATS:
+        return jsonify({'error': '形式は csv または ndjson を指定してください'}), 400
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'ユーザーとしてログインしてください'}), 400
     
-    return render_template('history.html', history=safe_history)
+    rows = history_export.iter_user_answers(current_app.db_manager, user_id)
+    response = current_app.response_class(
+        stream_with_context(history_export.render(rows, fmt, history_export.USER_COLUMNS)),
+        mimetype=history_export.FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=answer_history_{user_id}.{fmt}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ランキングの集計期間（キー: (表示名, 今日を含む日数。Noneは全期間)）
+RANKING_PERIODS = {
+    'all': ('全期間', None),
+    'week': ('直近7日', 7),
+    'month': ('直近30日', 30),
+}
+
+
+def _format_ranking_row(row):
+    entry = dict(row)
+    entry['accuracy_rate'] = float(entry.get('accuracy_rate') or 0)
+    if entry.get('last_answered_at') is not None:
+        entry['last_answered_at'] = str(entry['last_answered_at'])[:10]
+    return entry
+
 
 @main_bp.route('/ranking')
 @login_required
 def ranking():
-    """ユーザーランキングページ"""
+    """
+    ユーザーランキングページ
+
+    全期間・全ジャンルはワーカー内のリーダーボードから、期間・ジャンルを指定した場合は
+    日別・ジャンル別の集計（user_daily_stats）の範囲集計から上位と自分の順位を取得する。
+    """
     db_manager = current_app.db_manager
     user_id = session.get('user_id')
-
-    ranking_rows = db_manager.get_user_rankings(limit=50) or []
-    ranking_data = []
-    for idx, row in enumerate(ranking_rows, start=1):
-        entry = dict(row)
-        entry['rank'] = idx
-        if entry.get('last_answered_at'):
-            if hasattr(entry['last_answered_at'], 'strftime'):
-                entry['last_answered_at'] = entry['last_answered_at'].strftime('%Y-%m-%d %H:%M')
-            elif isinstance(entry['last_answered_at'], str):
-                entry['last_answered_at'] = entry['last_answered_at'][:16]
-        ranking_data.append(entry)
-
-    current_user_stat = db_manager.get_user_stat(user_id) if user_id else None
-    current_user_rank = None
-    if current_user_stat and current_user_stat.get('total_answers', 0) > 0:
-        if current_user_stat.get('last_answered_at'):
-            if hasattr(current_user_stat['last_answered_at'], 'strftime'):
-                current_user_stat['last_answered_at'] = current_user_stat['last_answered_at'].strftime('%Y-%m-%d %H:%M')
-            elif isinstance(current_user_stat['last_answered_at'], str):
-                current_user_stat['last_answered_at'] = current_user_stat['last_answered_at'][:16]
-        current_user_rank = db_manager.get_user_rank(user_id)
-
+    period = request.args.get('period', 'all')
+    if period not in RANKING_PERIODS:
+        period = 'all'
+    genre = request.args.get('genre') or None
+    days = RANKING_PERIODS[period][1]
+    
+    if days is None and genre is None:
+        leaderboard = current_app.leaderboard
+        leaderboard.sync(db_manager)
+        ranking_data = leaderboard.top(50)
+        current_user_stat = leaderboard.entry(user_id) if user_id else None
+        current_user_rank = leaderboard.rank(user_id) if current_user_stat else None
+    else:
+        since = date.today() - timedelta(days=days - 1) if days else None
+        rows, current_user_stat = db_manager.get_period_rankings(since=since, genre=genre, limit=50, user_id=user_id)
+        ranking_data = [_format_ranking_row(row) for row in rows]
+        current_user_rank = current_user_stat['rank'] if current_user_stat else None
+        if current_user_stat:
+            current_user_stat = _format_ranking_row(current_user_stat)
+    
     return render_template(
         'ranking.html',
         ranking=ranking_data,
         current_user=current_user_stat,
-        current_user_rank=current_user_rank
+        current_user_rank=current_user_rank,
+        periods=RANKING_PERIODS,
+        period=period,
+        genre=genre,
+        genres=current_app.question_manager.get_all_genres()
     )
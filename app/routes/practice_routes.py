@@ -3,8 +3,10 @@
 """
 from flask import Blueprint, render_template, request, jsonify, session, current_app
 from app.core.auth import login_required
+from app.services import coverage, genre_stats, spaced_repetition
 import json
 import random
+from datetime import datetime
 
 practice_bp = Blueprint('practice', __name__)
 
@@ -16,12 +18,46 @@ def get_question_manager():
     """QuestionManagerを取得"""
     return current_app.question_manager
 
+def _draw_weighted(genre=None):
+    """
+    苦手分野・苦手な問題を重視して1問選ぶ
+
+    重み付き出題が無効、または候補が無い場合はNone（呼び出し側で一様に選ぶ）
+    """
+    sampler = current_app.question_sampler
+    user_id = session.get('user_id')
+    if sampler is None or not user_id:
+        return None
+    try:
+        question_id = sampler.draw(user_id, genre)
+    except Exception as e:
+        current_app.logger.warning(f"重み付き出題に失敗しました: {e}")
+        return None
+    return get_question_manager().get_question(question_id) if question_id is not None else None
+
+def _draw_unseen(genre=None):
+    """
+    まだ解答していない問題から一様に1問選ぶ（解答済みビットセットとジャンルのマスクを使う）
+
+    すべて解答済み、または候補が無い場合はNone
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    pool = get_question_manager().get_question_pool()
+    mask = pool['masks'].get(genre)
+    if not mask:
+        return None
+    slot = coverage.pick_unseen(get_db_manager().get_coverage(user_id), mask)
+    question_id = pool['slot_ids'].get(slot) if slot is not None else None
+    return get_question_manager().get_question(question_id) if question_id is not None else None
+
 @practice_bp.route('/practice/random')
 @login_required
 def random_practice():
-    """ランダム問題練習"""
+    """ランダム問題練習（苦手な分野・問題ほど出やすい。重み付き出題が無効ならまだ解いていない問題から）"""
     question_manager = get_question_manager()
-    question = question_manager.get_random_question()
+    question = _draw_weighted() or _draw_unseen() or question_manager.get_random_question()
     
     if not question:
         return render_template('error.html', 
@@ -33,32 +69,87 @@ def random_practice():
 @practice_bp.route('/practice/genre')
 @login_required
 def genre_practice():
-    """ジャンル別演習のトップページ"""
+    """ジャンル別演習のトップページ（ジャンルごとの正答率・解答済みの問題数と苦手分野を表示）"""
     question_manager = get_question_manager()
     
     # ジャンル一覧を取得
     genres = question_manager.get_all_genres()
     
-    return render_template('genre_practice.html', genres=genres)
+    # ユーザーのジャンル別集計（user_genre_stats を主キーで引くだけ）
+    user_id = session.get('user_id')
+    rows = get_db_manager().get_genre_stats(user_id) if user_id else []
+    bits = get_db_manager().get_coverage(user_id) if user_id else b''
+    covered = coverage.count_by_genre(bits, question_manager.get_question_pool()['masks'])
+    progress = genre_stats.summarize(rows, genres, covered)
+    
+    return render_template('genre_practice.html', genres=progress['genres'], weak_areas=progress['weak_areas'])
 
 @practice_bp.route('/practice/genre/<genre>')
 @login_required
 def practice_by_genre(genre):
-    """ジャンル別問題演習"""
+    """ジャンル別問題演習（ジャンル内で苦手な問題ほど出やすい。重み付き出題が無効ならまだ解いていない問題から）"""
     question_manager = get_question_manager()
     
-    # 指定されたジャンルの問題を取得
-    questions = question_manager.get_questions_by_genre(genre)
+    question = _draw_weighted(genre) or _draw_unseen(genre)
+    if question is None:
+        # 指定されたジャンルの問題を取得
+        questions = question_manager.get_questions_by_genre(genre)
+        
+        if not questions:
+            return render_template('error.html',
+                                 message=f'{genre}の問題が見つかりません',
+                                 detail='このジャンルの問題が登録されていません')
+        
+        # 毎回ランダムに出題（連続で同じ問題にならないようサンプリング）
+        question = random.choice(questions)
     
-    if not questions:
-        return render_template('error.html',
-                             message=f'{genre}の問題が見つかりません',
-                             detail='このジャンルの問題が登録されていません')
+    return render_template('question.html', question=question, mode='genre', genre=genre)
+
+@practice_bp.route('/practice/review')
+@login_required
+def review_practice():
+    """復習モード（間違えた問題を SM-2 のスケジュールで期限の来た順に出題）"""
+    user_id = session.get('user_id')
+    now = datetime.now().strftime(spaced_repetition.DATETIME_FORMAT)
+    queue = get_db_manager().get_review_queue(user_id, now)
     
-    # 毎回ランダムに出題（連続で同じ問題にならないようサンプリング）
-    question = random.choice(questions) if questions else None
+    question = None
+    if queue['next'] is not None:
+        question = get_question_manager().get_question(queue['next']['question_id'])
+    if question is None:
+        message = '今復習する問題はありません'
+        if queue['next_due_at']:
+            message += f"（次の復習は {str(queue['next_due_at'])[:16]} 以降）"
+        return render_template('error.html', message=message,
+                             detail='間違えた問題がここに追加され、忘れかけた頃に再び出題されます')
     
-    return render_template('question.html', question=question, mode='genre', genre=genre)
+    return render_template('question.html', question=question, mode='review', due_count=queue['due_count'])
+
+@practice_bp.route('/practice/mistakes')
+@practice_bp.route('/practice/mistakes/<int:question_id>')
+@login_required
+def retry_mistake(question_id=None):
+    """
+    間違えた問題の解き直し
+
+    question_id を指定しなければ、間違えた問題の一覧から最も前に間違えた問題を出題する
+    （間違え直した問題は末尾に回り、正解した問題は一覧から外れる）。
+    """
+    question = None
+    if question_id is None:
+        rows, _ = get_db_manager().get_mistakes(session.get('user_id'), limit=1, oldest_first=True)
+        if rows:
+            question = get_question_manager().get_question(rows[0]['question_id'])
+        if question is None:
+            return render_template('error.html', message='間違えた問題はありません',
+                                 detail='間違えた問題はここから解き直せます')
+    else:
+        question = get_question_manager().get_question(question_id)
+        if question is None:
+            return render_template('error.html', message='問題が見つかりません',
+                                 detail='この問題は削除された可能性があります')
+    
+    return render_template('question.html', question=question, mode='mistakes')
 
 @practice_bp.route('/questions/<int:question_id>/answer', methods=['POST'])
 @login_required
@@ -87,5 +178,15 @@ def submit_answer(question_id):
             result['is_correct'],
             user_id
         )
+        # 問題の正答率・選択率（メモリ上のスナップショットから。解答数が少なければNone）
+        result['stats'] = question_manager.get_item_stats(question_id)
+        # 次の出題の重みに反映する（他のワーカーは重みの読み直しで取り込む）
+        if current_app.question_sampler is not None:
+            current_app.question_sampler.record(user_id, question_id, result['is_correct'])
+        # このワーカーのランキングにすぐ反映する（他のワーカーは sync で取り込む）
+        try:
+            current_app.leaderboard.refresh_user(current_app.db_manager, user_id)
+        except Exception as e:
+            current_app.logger.warning(f"ランキングの更新に失敗しました: {e}")
     
     return jsonify(result)
@@ -1,19 +1,44 @@
 """
 問題データアップロード機能
 """
+import io
 import os
 import json
+import shutil
 import zipfile
 from datetime import datetime
-from flask import Blueprint, request, render_template, redirect, url_for, flash, current_app
+from flask import Blueprint, request, render_template, redirect, url_for, flash, current_app, jsonify
 from werkzeug.utils import secure_filename
 from app.core.auth import login_required, admin_required
+from app.routes.exam_routes import parse_filename_info
+from app.utils.json_stream import iter_json_array, NotJSONArrayError
 
 upload_bp = Blueprint('upload', __name__)
 
 ALLOWED_EXTENSIONS = {'json', 'zip'}
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+# 画像ディレクトリごとの (更新時刻, 画像数)
+_image_counts = {}
+
+def _count_images(images_dir):
+    """
+    画像ファイル数（ディレクトリの更新時刻が変わっていなければ前回の結果を返す）
+
+    ファイルの追加・削除・名前の変更でディレクトリの更新時刻が変わるので、
+    通常は stat 1回で済み、変更があったときだけ listdir する。
+    """
+    try:
+        mtime = os.stat(images_dir).st_mtime_ns
+    except OSError:
+        return 0
+    cached = _image_counts.get(images_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    count = sum(1 for f in os.listdir(images_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')))
+    _image_counts[images_dir] = (mtime, count)
+    return count
+
 def allowed_file(filename, extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
 
@@ -22,20 +47,13 @@ def allowed_file(filename, extensions):
 def upload_page():
     """データアップロードページ"""
     # 統計情報を取得
-    db_manager = current_app.db_manager
-    
-    # 問題数統計
-    total_questions = db_manager.execute_query("SELECT COUNT(*) as count FROM questions")[0]['count']
+    # 問題数・ジャンル数は問題カタログ（またはそのキャッシュ）から取得
+    summary = current_app.question_manager.get_question_summary()
+    total_questions = summary['total_questions']
+    genres_count = len([genre for genre in summary['genres'] if genre['name']])
     
-    # ジャンル数統計  
-    genres_result = db_manager.execute_query("SELECT COUNT(DISTINCT genre) as count FROM questions WHERE genre IS NOT NULL AND genre != ''")
-    genres_count = genres_result[0]['count'] if genres_result else 0
-    
-    # 画像ファイル数統計
-    images_dir = os.path.join(current_app.config['PROTECTED_IMAGES_DIR'], 'questions')
-    images_count = 0
-    if os.path.exists(images_dir):
-        images_count = len([f for f in os.listdir(images_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))])
+    # 画像ファイル数統計（ディレクトリが変更されたときだけ数え直す）
+    images_count = _count_images(os.path.join(current_app.config['PROTECTED_IMAGES_DIR'], 'questions'))
     
     stats = {
         'total_questions': total_questions,
@@ -43,12 +61,15 @@ def upload_page():
         'images_count': images_count
     }
     
-    return render_template('admin/upload.html', stats=stats)
+    return render_template('admin/upload.html',
+                         stats=stats,
+                         job_id=request.args.get('job'),
+                         recent_jobs=current_app.import_jobs.recent(limit=5))
 
 @upload_bp.route('/admin/upload/questions', methods=['POST'])
 @admin_required
 def upload_questions():
-    """JSON問題データのアップロード処理"""
+    """JSON問題データのアップロード受付（取り込みはバックグラウンドジョブで実行）"""
     if 'file' not in request.files:
         flash('ファイルが選択されていません。', 'error')
         return redirect(url_for('upload.upload_page'))
@@ -63,9 +84,9 @@ def upload_questions():
         return redirect(url_for('upload.upload_page'))
     
     try:
-        filename = secure_filename(file.filename)
+        original_filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
+        filename = f"{timestamp}_{original_filename}"
         
         # 一時保存ディレクトリの作成
         upload_dir = os.path.join(current_app.root_path, 'uploads', 'temp')
@@ -74,25 +95,43 @@ def upload_questions():
         filepath = os.path.join(upload_dir, filename)
         file.save(filepath)
         
-        # ファイル形式に応じて処理
-        if filename.lower().endswith('.zip'):
-            result = _process_zip_file(filepath)
-        else:
-            result = _process_json_file(filepath)
+        overwrite_images = bool(request.form.get('overwrite_images'))
+        is_zip = filename.lower().endswith('.zip')
         
-        # 一時ファイルを削除
-        os.remove(filepath)
+        def task(progress):
+            try:
+                # ファイル形式に応じて処理
+                if is_zip:
+                    return _process_zip_file(filepath, overwrite_images=overwrite_images, progress_callback=progress)
+                return _process_json_file(filepath, progress_callback=progress)
+            finally:
+                # 一時ファイルを削除
+                if os.path.exists(filepath):
+                    os.remove(filepath)
         
-        if result['success']:
-            flash(f'問題データを正常にアップロードしました。登録件数: {result["count"]}件', 'success')
-        else:
-            flash(f'アップロードエラー: {result["error"]}', 'error')
+        job_id = current_app.import_jobs.submit(
+            current_app._get_current_object(),
+            original_filename,
+            _exam_key_for(original_filename),
+            task
+        )
+        flash('問題データの取り込みを開始しました。進捗はこのページに表示されます。', 'info')
+        return redirect(url_for('upload.upload_page', job=job_id))
             
     except Exception as e:
         flash(f'アップロード処理中にエラーが発生しました: {str(e)}', 'error')
     
     return redirect(url_for('upload.upload_page'))
 
+@upload_bp.route('/admin/upload/jobs/<job_id>')
+@admin_required
+def import_job_status(job_id):
+    """取り込みジョブの進捗（ポーリング用JSON）"""
+    job = current_app.import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return jsonify(job)
+
 @upload_bp.route('/admin/upload/images', methods=['POST'])
 @admin_required
 def upload_images():
@@ -141,121 +180,160 @@ def upload_images():
     
     return redirect(url_for('upload.upload_page'))
 
-def _process_json_file(filepath):
-    """JSONファイルの処理"""
+def _exam_key_for(filename):
+    """同じ試験の取り込みを直列化するためのキー（年度_期、判別できなければファイル名）"""
+    info = parse_filename_info(filename)
+    return info['exam_code'] if info else filename
+
+def _process_json_file(filepath, progress_callback=None):
+    """JSONファイルの処理（配列要素を逐次読み込み、チャンク単位で保存）"""
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # データ形式の検証
-        if not isinstance(data, list):
-            return {'success': False, 'error': 'JSONファイルは配列形式である必要があります。'}
-        
-        count = 0
-        db_manager = current_app.db_manager
-        
-        for item in data:
-            if _validate_question_data(item):
-                _save_question_to_db(item, db_manager)
-                count += 1
-        
-        return {'success': True, 'count': count}
-        
+            return _import_question_stream(iter_json_array(f), progress_callback)
+    except NotJSONArrayError:
+        return {'success': False, 'error': 'JSONファイルは配列形式である必要があります。'}
     except json.JSONDecodeError:
         return {'success': False, 'error': 'JSONファイルの形式が正しくありません。'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def _process_zip_file(filepath):
-    """ZIPファイルの処理"""
+def _import_question_stream(items, progress_callback=None):
+    """
+    問題データのイテラブルを IMPORT_CHUNK_SIZE 件ずつ検証し、差分を保存する
+
+    検証とハッシュ計算は IMPORT_PROCESSES 個のプロセスで並列に行い、
+    内容ハッシュが一致する問題は書き込まず、新規・変更分のみを保存する。
+    progress_callback(rows, count) には読み込んだ行数と書き込み件数が渡される。
+    """
+    # プロセスプール関連のモジュールは起動を遅くするので取り込み時に読み込む
+    from app.services.question_pipeline import QuestionImportPipeline
+    
+    pipeline = QuestionImportPipeline(
+        current_app.question_manager,
+        processes=current_app.config['IMPORT_PROCESSES'],
+        chunk_size=current_app.config['IMPORT_CHUNK_SIZE']
+    )
+    logger = current_app.logger
+    
+    def report_progress(rows, count):
+        logger.info(f"問題データ取り込み中: {rows}行処理 / {count}件書き込み")
+        if progress_callback:
+            progress_callback(rows, count)
+    
+    result = pipeline.run(items, progress_callback=report_progress)
+    result['success'] = True
+    return result
+
+def _process_zip_file(filepath, overwrite_images=False, progress_callback=None):
+    """
+    ZIPファイルの処理（展開せずにメンバーを直接ストリーム処理）
+
+    JSONメンバーは逐次パースしてDBへ、画像メンバーは保護画像ディレクトリへ
+    1回の走査で取り込む。
+    """
     try:
         with zipfile.ZipFile(filepath, 'r') as zip_ref:
-            # ZIPファイルの内容を確認
-            file_list = zip_ref.namelist()
-            json_files = [f for f in file_list if f.endswith('.json')]
+            members = [info for info in zip_ref.infolist() if not info.is_dir()]
             
-            if not json_files:
-                return {'success': False, 'error': 'ZIPファイル内にJSONファイルが見つかりません。'}
+            error = _check_zip_limits(members)
+            if error:
+                return {'success': False, 'error': error}
             
-            # 一時展開ディレクトリ
-            extract_dir = filepath + '_extract'
-            zip_ref.extractall(extract_dir)
+            json_members = [info for info in members if info.filename.lower().endswith('.json')]
+            image_members = [info for info in members if allowed_file(info.filename, ALLOWED_IMAGE_EXTENSIONS)]
+            
+            if not json_members:
+                return {'success': False, 'error': 'ZIPファイル内にJSONファイルが見つかりません。'}
             
             total_count = 0
-            db_manager = current_app.db_manager
+            total_rows = 0
+            total_unchanged = 0
+            errors = []
             
-            # 各JSONファイルを処理
-            for json_file in json_files:
-                json_path = os.path.join(extract_dir, json_file)
-                result = _process_json_file(json_path)
-                if result['success']:
+            # 各JSONファイルを展開せずに逐次処理
+            for info in json_members:
+                # 進捗はZIP全体での累計行数として通知する
+                def member_progress(rows, count, base_rows=total_rows, base_count=total_count):
+                    if progress_callback:
+                        progress_callback(base_rows + rows, base_count + count)
+                
+                try:
+                    with zip_ref.open(info) as raw:
+                        text = io.TextIOWrapper(raw, encoding='utf-8')
+                        result = _import_question_stream(iter_json_array(text), member_progress)
                     total_count += result['count']
+                    total_rows += result['rows']
+                    total_unchanged += result['unchanged']
+                    errors.extend(f'{info.filename}: {error}' for error in result['errors'])
+                except (NotJSONArrayError, json.JSONDecodeError, UnicodeDecodeError) as e:
+                    errors.append(f'{info.filename}: {e}')
             
-            # 一時ディレクトリを削除
-            import shutil
-            shutil.rmtree(extract_dir)
+            images_count = _import_zip_images(zip_ref, image_members, overwrite_images)
             
-            return {'success': True, 'count': total_count}
+            return {
+                'success': True,
+                'count': total_count,
+                'rows': total_rows,
+                'unchanged': total_unchanged,
+                'images': images_count,
+                'errors': errors
+            }
             
+    except zipfile.BadZipFile:
+        return {'success': False, 'error': 'ZIPファイルの形式が正しくありません。'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def _validate_question_data(data):
-    """問題データの検証"""
-    required_fields = ['question_id', 'question_text', 'choices', 'correct_answer']
+def _check_zip_limits(members):
+    """ZIPのエントリ数・展開後サイズ・圧縮率を検証し、問題があればエラーメッセージを返す"""
+    config = current_app.config
     
-    for field in required_fields:
-        if field not in data:
-            return False
+    if len(members) > config['ZIP_MAX_ENTRIES']:
+        return f'ZIPファイル内のファイル数が多すぎます（上限 {config["ZIP_MAX_ENTRIES"]} 件）。'
     
-    # 選択肢の検証
-    if not isinstance(data['choices'], (list, dict)):
-        return False
+    total_size = 0
+    for info in members:
+        # 展開後サイズはヘッダーの申告値。zipfile は申告値を超えて展開しないため上限として使える
+        if info.file_size > config['ZIP_MAX_MEMBER_SIZE']:
+            return f'{info.filename} のサイズが大きすぎます。'
+        if info.compress_size and info.file_size / info.compress_size > config['ZIP_MAX_COMPRESSION_RATIO']:
+            return f'{info.filename} の圧縮率が異常です。'
+        total_size += info.file_size
     
-    return True
+    if total_size > config['ZIP_MAX_TOTAL_SIZE']:
+        return 'ZIPファイルの展開後サイズが大きすぎます。'
+    
+    return None
 
-def _save_question_to_db(data, db_manager):
-    """問題データをデータベースに保存"""
-    # 選択肢をJSON文字列に変換（SQLiteの場合）
-    choices_json = json.dumps(data['choices'], ensure_ascii=False)
-    choice_images_json = json.dumps(data.get('choice_images', {}), ensure_ascii=False) if data.get('choice_images') else None
+def _import_zip_images(zip_ref, image_members, overwrite=False):
+    """ZIP内の画像を保護画像ディレクトリへ直接書き込み、保存件数を返す"""
+    if not image_members:
+        return 0
     
-    # 重複チェック（question_idで）
-    existing = db_manager.execute_query(
-        "SELECT id FROM questions WHERE question_id = ?",
-        (data['question_id'],)
-    )
+    images_dir = os.path.join(current_app.config['PROTECTED_IMAGES_DIR'], 'questions')
+    os.makedirs(images_dir, exist_ok=True)
+    
+    saved = 0
+    for info in image_members:
+        # ディレクトリ構造は無視してファイル名のみ使用（パストラバーサル対策）
+        filename = secure_filename(os.path.basename(info.filename))
+        if not filename:
+            continue
+        
+        filepath = os.path.join(images_dir, filename)
+        if os.path.exists(filepath) and not overwrite:
+            continue
+        
+        # 一時ファイルに書き込んでから置き換え、配信中の画像が壊れないようにする
+        tmp_path = filepath + '.uploading'
+        try:
+            with zip_ref.open(info) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, filepath)
+            saved += 1
+        except Exception as e:
+            current_app.logger.warning(f"ZIP内画像 {info.filename} の保存に失敗: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
-    if existing:
-        # 更新
-        db_manager.execute_query("""
-            UPDATE questions 
-            SET question_text = ?, choices = ?, correct_answer = ?, 
-                explanation = ?, genre = ?, image_url = ?, choice_images = ?
-            WHERE question_id = ?
-        """, (
-            data['question_text'],
-            choices_json,
-            data['correct_answer'],
-            data.get('explanation', ''),
-            data.get('genre', ''),
-            data.get('image_url', ''),
-            choice_images_json,
-            data['question_id']
-        ))
-    else:
-        # 新規登録
-        db_manager.execute_query("""
-            INSERT INTO questions 
-            (question_id, question_text, choices, correct_answer, explanation, genre, image_url, choice_images)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data['question_id'],
-            data['question_text'],
-            choices_json,
-            data['correct_answer'],
-            data.get('explanation', ''),
-            data.get('genre', ''),
-            data.get('image_url', ''),
-            choice_images_json
-        ))
\ No newline at end of file
+    return saved
@@ -0,0 +1,82 @@
+"""
+問題カタログ
+全問題を正規化済みの読み取り専用データとしてメモリに保持し、
+出題・ジャンル一覧・問題数の取得をDBアクセスなしで返す。
+
+本番（gunicorn の preload_app）ではマスタープロセスでフォーク前に1度だけ構築し、
+gc.freeze() でGCの走査対象から外すことで、各ワーカーがコピーオンライトで
+同じページを共有する（gunicorn.conf.py を参照）。
+"""
+
+import random
+
+
+def _copy_question(question):
+    """呼び出し側が書き換えてもカタログに影響しないようにコピーを返す"""
+    copied = dict(question)
+    copied['choices'] = dict(question['choices'])
+    if isinstance(question.get('choice_images'), dict):
+        copied['choice_images'] = dict(question['choice_images'])
+    return copied
+
+
+class QuestionCatalog:
+    """正規化済み問題の読み取り専用スナップショット"""
+
+    def __init__(self, version, questions):
+        self.version = version
+        self._questions = tuple(questions)
+        self._by_id = {question['id']: question for question in self._questions}
+
+        by_genre = {}
+        for question in sorted(self._questions, key=lambda q: q.get('question_id') or ''):
+            if question.get('genre') is not None:
+                by_genre.setdefault(question['genre'], []).append(question)
+        self._by_genre = {genre: tuple(items) for genre, items in by_genre.items()}
+        self._genre_counts = tuple((genre, len(self._by_genre[genre])) for genre in sorted(self._by_genre))
+
+    @classmethod
+    def build(cls, question_manager):
+        """DBの全問題からカタログを構築"""
+        db_manager = question_manager.db_manager
+        # 先にバージョンを読むことで、構築中に書き換えがあっても次の確認で作り直される
+        version = db_manager.get_catalog_version()
+        rows = db_manager.execute_query('SELECT * FROM questions ORDER BY id') or []
+        return cls(version, [question_manager.prepare_question(row) for row in rows])
+
+    def __len__(self):
+        return len(self._questions)
+
+    def __iter__(self):
+        """保持している問題（読み取り専用。スナップショットの書き出し用）"""
+        return iter(self._questions)
+
+    def get(self, question_id):
+        """指定されたIDの問題（存在しない場合はNone）"""
+        question = self._by_id.get(question_id)
+        return _copy_question(question) if question else None
+
+    def by_ids(self, question_ids):
+        """指定されたIDの問題を指定順で返す（存在しないIDは除外）"""
+        return [_copy_question(self._by_id[qid]) for qid in question_ids if qid in self._by_id]
+
+    def by_genre(self, genre):
+        """ジャンル別の問題（question_id順）"""
+        return [_copy_question(question) for question in self._by_genre.get(genre, ())]
+
+    def genres(self):
+        """ジャンル一覧と問題数（ジャンル名順）"""
+        return [{'name': genre, 'count': count} for genre, count in self._genre_counts]
+
+    def random_question(self, exclude_id=None):
+        """ランダムに1問（exclude_id 以外から選ぶ。他に問題が無い場合はその問題）"""
+        if not self._questions:
+            return None
+        question = random.choice(self._questions)
+        if question['id'] == exclude_id and len(self._questions) > 1:
+            # 除外対象を引いた場合は残りから選び直す
+            index = random.randrange(len(self._questions) - 1)
+            if self._questions[index]['id'] == exclude_id:
+                index = len(self._questions) - 1
+            question = self._questions[index]
+        return _copy_question(question)
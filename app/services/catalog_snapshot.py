@@ -0,0 +1,241 @@
+"""
+問題カタログのスナップショットファイル
+正規化済みのカタログを1つのバイナリファイルに書き出し、mmap で読み込む。
+
+読み込み時にはパースもDBアクセスも行わず、レコードは参照されたときにだけ
+デコードする。ファイルはOSのページキャッシュ経由で全ワーカーに共有される。
+
+ファイル構成（リトルエンディアン）:
+    ヘッダー     HEADER
+    ID配列       uint32 × 問題数（昇順。二分探索に使う）
+    レコード     RECORD × 問題数（ID配列と同じ順）
+    ジャンル表   GENRE × ジャンル数（ジャンル名順）
+    ジャンル索引 uint32 × 所属問題数（レコード番号。ジャンルごとに question_id 順）
+    文字列表     UTF-8 文字列を連結したもの（レコード・ジャンル表から (位置, 長さ) で参照）
+"""
+
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+MAGIC = b'FECATLG1'
+
+# magic, catalog_epoch, catalog_version, 問題数, ジャンル数, ジャンル索引の要素数, 文字列表のサイズ
+HEADER = struct.Struct('<8sQQIIIQ4x')
+
+# レコードに保存する列（順番はファイル形式の一部）
+FIELDS = (
+    'question_id', 'question_text', 'choices', 'correct_answer', 'explanation',
+    'genre', 'image_url', 'choice_images', 'content_hash', 'created_at'
+)
+JSON_FIELDS = ('choices', 'choice_images')
+
+# has_image_choices, 各列の (文字列表での位置, 長さ)
+RECORD = struct.Struct('<B3x' + 'II' * len(FIELDS))
+# ジャンル名の (位置, 長さ), ジャンル索引での開始位置, 件数
+GENRE = struct.Struct('<IIII')
+
+# 長さがこの値の列は None
+NULL_LENGTH = 0xFFFFFFFF
+
+
+class SnapshotError(Exception):
+    """スナップショットが壊れている・形式が異なる"""
+
+
+def _encode_field(name, value):
+    if value is None:
+        return None
+    if name in JSON_FIELDS:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    return str(value)
+
+
+def write_snapshot(path, catalog, epoch):
+    """
+    カタログをスナップショットファイルに書き出す
+
+    一時ファイルに書いてから置き換えるので、読み込み中のワーカーは
+    古いファイルのマッピングをそのまま使い続けられる。
+
+    Args:
+        path: 出力先
+        catalog: QuestionCatalog
+        epoch: DBごとの識別子（app_meta.catalog_epoch）
+    """
+    questions = sorted(catalog, key=lambda q: q['id'])
+
+    strings = bytearray()
+    string_refs = {}
+
+    def ref(text):
+        if text is None:
+            return 0, NULL_LENGTH
+        if text not in string_refs:
+            data = text.encode('utf-8')
+            string_refs[text] = (len(strings), len(data))
+            strings.extend(data)
+        return string_refs[text]
+
+    ids = array('I', (q['id'] for q in questions))
+    records = bytearray()
+    for question in questions:
+        refs = []
+        for name in FIELDS:
+            refs.extend(ref(_encode_field(name, question.get(name))))
+        records.extend(RECORD.pack(1 if question.get('has_image_choices') else 0, *refs))
+
+    index_of = {q['id']: i for i, q in enumerate(questions)}
+    genre_table = bytearray()
+    members = array('I')
+    for genre in catalog.genres():
+        indexes = [index_of[q['id']] for q in catalog.by_genre(genre['name'])]
+        genre_table.extend(GENRE.pack(*ref(genre['name']), len(members), len(indexes)))
+        members.extend(indexes)
+
+    if sys.byteorder != 'little':
+        ids.byteswap()
+        members.byteswap()
+
+    header = HEADER.pack(MAGIC, epoch, catalog.version, len(questions),
+                         len(genre_table) // GENRE.size, len(members), len(strings))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for part in (header, ids.tobytes(), records, genre_table, members.tobytes(), strings):
+            f.write(part)
+    os.replace(tmp_path, path)
+
+
+def open_snapshot(path, epoch, version):
+    """
+    スナップショットを読み込む
+
+    ファイルが無い・壊れている・DBの catalog_epoch / catalog_version と
+    一致しない場合は None を返す（呼び出し側でDBから構築し直す）。
+    """
+    try:
+        snapshot = MappedCatalog(path)
+    except (OSError, ValueError, SnapshotError):
+        return None
+    if snapshot.epoch != epoch or snapshot.version != version:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+class MappedCatalog:
+    """スナップショットファイルを mmap した読み取り専用カタログ（QuestionCatalog と同じインターフェース）"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (magic, self.epoch, self.version, self._count, genre_count,
+             member_count, strings_size) = HEADER.unpack_from(self._mm, 0)
+        except struct.error as e:
+            self._mm.close()
+            raise SnapshotError(str(e))
+
+        self._ids_offset = HEADER.size
+        self._records_offset = self._ids_offset + 4 * self._count
+        genres_offset = self._records_offset + RECORD.size * self._count
+        members_offset = genres_offset + GENRE.size * genre_count
+        self._strings_offset = members_offset + 4 * member_count
+
+        if magic != MAGIC or len(self._mm) != self._strings_offset + strings_size:
+            self._mm.close()
+            raise SnapshotError('invalid catalog snapshot')
+
+        view = memoryview(self._mm)
+        if sys.byteorder == 'little':
+            # ID配列・ジャンル索引はコピーせずにファイルの領域をそのまま参照する
+            self._ids = view[self._ids_offset:self._records_offset].cast('I')
+            self._members = view[members_offset:self._strings_offset].cast('I')
+        else:
+            self._ids = self._read_uint32_array(self._ids_offset, self._count)
+            self._members = self._read_uint32_array(members_offset, member_count)
+
+        genres = []
+        for i in range(genre_count):
+            name_offset, name_length, start, count = GENRE.unpack_from(self._mm, genres_offset + GENRE.size * i)
+            genres.append((self._string(name_offset, name_length), start, count))
+        self._genres = tuple(genres)
+        self._genre_index = {name: (start, count) for name, start, count in genres}
+
+    def _read_uint32_array(self, offset, count):
+        values = array('I', self._mm[offset:offset + 4 * count])
+        values.byteswap()
+        return values
+
+    def _string(self, offset, length):
+        if length == NULL_LENGTH:
+            return None
+        start = self._strings_offset + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _record(self, index):
+        """レコード番号の問題をデコードする"""
+        values = RECORD.unpack_from(self._mm, self._records_offset + RECORD.size * index)
+        question = {'id': self._ids[index]}
+        for i, name in enumerate(FIELDS):
+            value = self._string(values[1 + 2 * i], values[2 + 2 * i])
+            question[name] = json.loads(value) if value is not None and name in JSON_FIELDS else value
+        question['has_image_choices'] = bool(values[0])
+        return question
+
+    def _index_of(self, question_id):
+        index = bisect.bisect_left(self._ids, question_id)
+        if index < self._count and self._ids[index] == question_id:
+            return index
+        return None
+
+    def close(self):
+        """マッピングを解放"""
+        for view in (getattr(self, '_ids', None), getattr(self, '_members', None)):
+            if isinstance(view, memoryview):
+                view.release()
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (self._record(i) for i in range(self._count))
+
+    def get(self, question_id):
+        """指定されたIDの問題（存在しない場合はNone）"""
+        index = self._index_of(question_id)
+        return self._record(index) if index is not None else None
+
+    def by_ids(self, question_ids):
+        """指定されたIDの問題を指定順で返す（存在しないIDは除外）"""
+        indexes = (self._index_of(qid) for qid in question_ids)
+        return [self._record(index) for index in indexes if index is not None]
+
+    def by_genre(self, genre):
+        """ジャンル別の問題（question_id順）"""
+        start, count = self._genre_index.get(genre, (0, 0))
+        return [self._record(self._members[i]) for i in range(start, start + count)]
+
+    def genres(self):
+        """ジャンル一覧と問題数（ジャンル名順）"""
+        return [{'name': name, 'count': count} for name, _, count in self._genres]
+
+    def random_question(self, exclude_id=None):
+        """ランダムに1問（exclude_id 以外から選ぶ。他に問題が無い場合はその問題）"""
+        if not self._count:
+            return None
+        index = random.randrange(self._count)
+        if self._ids[index] == exclude_id and self._count > 1:
+            index = random.randrange(self._count - 1)
+            if self._ids[index] == exclude_id:
+                index = self._count - 1
+        return self._record(index)
@@ -0,0 +1,109 @@
+"""
+解答済みの問題のビットセット
+ユーザーごとに「1度でも解答した問題」を、問題の位置（questions.coverage_slot）のビットを立てた
+1問1ビットのビット列として user_coverage に保存する（1,200問なら約150バイト）。
+
+位置は問題IDとは別に 0 から詰めて振る番号で、削除・再取り込みで問題IDが増えてもビット列は
+問題数程度の長さに収まる。新しい問題には使ったことの無い位置を振り（削除された問題の位置は
+再利用しない）、空いた位置はメンテナンス処理（rebuild_coverage）で詰める。
+
+ビット列は little-endian の整数として扱い、ジャンルごとのマスクとの AND と
+int.bit_count() で「このジャンルで解いた問題数」を求める（C実装で64ビットずつ処理される）。
+削除された問題のビットが残っていても、マスクに含まれないので数えられない。
+"""
+
+import random
+
+# ビット列を読むときの単位（バイト）
+_WORD_BYTES = 8
+
+
+def set_bit(bits, index):
+    """
+    index 番目のビットを立てたビット列を返す
+
+    Returns:
+        新しいビット列（既に立っていた場合はNone）
+    """
+    bits = bits or b''
+    byte, bit = divmod(index, 8)
+    if byte < len(bits) and bits[byte] & (1 << bit):
+        return None
+    buffer = bytearray(bits)
+    if byte >= len(buffer):
+        buffer.extend(b'\x00' * (byte + 1 - len(buffer)))
+    buffer[byte] |= 1 << bit
+    return bytes(buffer)
+
+
+def from_indexes(indexes):
+    """位置の一覧からビット列を作る"""
+    buffer = bytearray()
+    for index in indexes:
+        byte, bit = divmod(index, 8)
+        if byte >= len(buffer):
+            buffer.extend(b'\x00' * (byte + 1 - len(buffer)))
+        buffer[byte] |= 1 << bit
+    return bytes(buffer)
+
+
+def to_int(bits):
+    """ビット列を整数にする（未保存ならすべて0）"""
+    return int.from_bytes(bits or b'', 'little')
+
+
+def build_masks(slots, genres):
+    """
+    ジャンルごとのマスク（出題候補の問題の位置のビットを立てた整数）
+
+    Returns:
+        {ジャンル: マスク}（キー None は全問題。ジャンル未設定の問題は全問題のマスクにだけ含める）
+    """
+    positions = {None: list(slots)}
+    for slot, genre in zip(slots, genres):
+        if genre:
+            positions.setdefault(genre, []).append(slot)
+    return {genre: to_int(from_indexes(indexes)) for genre, indexes in positions.items()}
+
+
+def is_set(bits, index):
+    """index 番目のビットが立っているか（bits は to_int 済みの整数）"""
+    return bool(bits >> index & 1)
+
+
+def count(bits, mask):
+    """マスクの中で解答済みの問題数（bits は to_int 済みの整数）"""
+    return (bits & mask).bit_count()
+
+
+def count_by_genre(bits, masks):
+    """ジャンルごとの解答済みの問題数（キー None は全問題）"""
+    bits = to_int(bits) if isinstance(bits, (bytes, bytearray)) else bits
+    return {genre: count(bits, mask) for genre, mask in masks.items()}
+
+
+def pick_unseen(bits, mask, rng=random):
+    """
+    マスクの中でまだ解答していない問題の位置を一様に1つ選ぶ
+
+    Returns:
+        問題の位置（すべて解答済みならNone）
+    """
+    bits = to_int(bits) if isinstance(bits, (bytes, bytearray)) else bits
+    unseen = mask & ~bits
+    remaining = unseen.bit_count()
+    if not remaining:
+        return None
+    k = rng.randrange(remaining)
+    # k 番目に立っているビットを 64ビットずつ数えながら探す
+    data = unseen.to_bytes((unseen.bit_length() + 7) // 8, 'little')
+    for offset in range(0, len(data), _WORD_BYTES):
+        word = int.from_bytes(data[offset:offset + _WORD_BYTES], 'little')
+        ones = word.bit_count()
+        if k >= ones:
+            k -= ones
+            continue
+        for _ in range(k):
+            word &= word - 1
+        return offset * 8 + (word & -word).bit_length() - 1
+    return None
@@ -0,0 +1,64 @@
+"""
+分野別の正答率と苦手分野
+user_genre_stats の行（1ユーザー分）を問題カタログのジャンル一覧と突き合わせ、
+ダッシュボード・ジャンル別演習の表示用に整える。
+"""
+
+# この回数以上解答したジャンルだけを苦手分野の判定に使う
+WEAK_MIN_ATTEMPTS = 5
+# 正答率がこの値（%）未満のジャンルを苦手分野とする
+WEAK_ACCURACY = 60.0
+# 苦手分野として強調する最大件数
+WEAK_LIMIT = 3
+
+
+def _accuracy(correct, attempts):
+    return round(correct * 100.0 / attempts, 1) if attempts else 0.0
+
+
+def summarize(rows, genres, covered=None):
+    """
+    ジャンル別の集計と全体の集計を作る
+
+    Args:
+        rows: get_genre_stats の結果
+        genres: 問題カタログのジャンル一覧（{'name', 'count'} のリスト）
+        covered: ジャンルごとの解答済みの問題数（coverage.count_by_genre。キー None は全問題）
+
+    Returns:
+        {
+            'genres': [{'name', 'count', 'covered', 'attempts', 'correct_answers', 'accuracy_rate', 'is_weak'}, ...],
+            'weak_areas': 正答率の低い順の苦手分野（最大 WEAK_LIMIT 件）,
+            'total_answers', 'correct_answers', 'accuracy_rate': 全ジャンルの合計,
+            'covered_questions': 解答済みの問題数（covered を渡さなければNone）,
+        }
+    """
+    by_genre = {row['genre']: row for row in rows}
+    total_answers = sum(int(row['attempts'] or 0) for row in rows)
+    correct_answers = sum(int(row['correct_answers'] or 0) for row in rows)
+
+    progress = []
+    for genre in genres:
+        row = by_genre.get(genre['name'])
+        attempts = int(row['attempts'] or 0) if row else 0
+        correct = int(row['correct_answers'] or 0) if row else 0
+        accuracy = _accuracy(correct, attempts)
+        progress.append({
+            'name': genre['name'],
+            'count': genre['count'],
+            'covered': min(covered.get(genre['name'], 0), genre['count']) if covered is not None else None,
+            'attempts': attempts,
+            'correct_answers': correct,
+            'accuracy_rate': accuracy,
+            'is_weak': attempts >= WEAK_MIN_ATTEMPTS and accuracy < WEAK_ACCURACY,
+        })
+
+    weak_areas = sorted((g for g in progress if g['is_weak']), key=lambda g: (g['accuracy_rate'], -g['attempts']))
+    return {
+        'genres': progress,
+        'weak_areas': weak_areas[:WEAK_LIMIT],
+        'total_answers': total_answers,
+        'correct_answers': correct_answers,
+        'accuracy_rate': _accuracy(correct_answers, total_answers),
+        'covered_questions': covered.get(None, 0) if covered is not None else None,
+    }
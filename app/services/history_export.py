@@ -0,0 +1,121 @@
+"""
+解答履歴のエクスポート
+回答を問題の情報と結合して CSV / NDJSON の文字列として少しずつ返す。
+行はDBから順に読みながら書き出すので、件数に関わらずメモリ使用量は一定。
+"""
+
+import csv
+import io
+import json
+
+# ユーザー自身のエクスポートの列
+USER_COLUMNS = (
+    'answer_id', 'question_id', 'question_code', 'genre',
+    'user_answer', 'correct_answer', 'is_correct', 'answered_at'
+)
+# 管理者による全ユーザーのエクスポートの列
+ALL_USERS_COLUMNS = ('user_id', 'username') + USER_COLUMNS
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# 1回に書き出す行数（小さすぎるとレスポンスの断片が増え、大きすぎるとメモリを使う）
+FLUSH_ROWS = 500
+
+_SELECT = """
+    SELECT
+        ua.id AS answer_id,
+        ua.user_id,
+        u.username,
+        ua.question_id,
+        q.question_id AS question_code,
+        q.genre,
+        ua.user_answer,
+        q.correct_answer,
+        ua.is_correct,
+        ua.answered_at
+    FROM user_answers ua
+    LEFT JOIN users u ON u.id = ua.user_id
+    LEFT JOIN questions q ON q.id = ua.question_id
+"""
+
+
+def iter_user_answers(db_manager, user_id, batch_size=FLUSH_ROWS):
+    """1ユーザーの全解答（古い順。サーバーサイドカーソルで1本のクエリを読み進める）"""
+    return db_manager.iter_query(
+        _SELECT + " WHERE ua.user_id = ? ORDER BY ua.answered_at, ua.id",
+        (user_id,),
+        batch_size=batch_size
+    )
+
+
+def iter_all_answers(db_manager, chunk_size=5000):
+    """
+    全ユーザーの全解答（id順）
+
+    件数が多いので1本のクエリで長時間接続を占有せず、
+    主キーのキーセットで chunk_size 件ずつ別のクエリとして読む。
+    """
+    last_id = 0
+    while True:
+        rows = db_manager.execute_query(
+            _SELECT + " WHERE ua.id > ? ORDER BY ua.id LIMIT ?",
+            (last_id, int(chunk_size))
+        ) or []
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['answer_id']
+
+
+def _normalize(row, columns):
+    values = {}
+    for column in columns:
+        value = row.get(column)
+        if column == 'is_correct':
+            value = bool(value)
+        elif column == 'answered_at' and value is not None:
+            value = str(value)
+        values[column] = value
+    return values
+
+
+def to_csv(rows, columns):
+    """行を CSV の文字列の断片として返す（Excel で文字化けしないよう先頭にBOMを付ける）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        values = _normalize(row, columns)
+        values['is_correct'] = int(values['is_correct'])
+        writer.writerow(values[column] for column in columns)
+        pending += 1
+        if pending >= FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def to_ndjson(rows, columns):
+    """行を NDJSON（1行1オブジェクト）の文字列の断片として返す"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(_normalize(row, columns), ensure_ascii=False))
+        if len(lines) >= FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def render(rows, fmt, columns):
+    """指定形式の文字列の断片を返すジェネレーター"""
+    if fmt == 'ndjson':
+        return to_ndjson(rows, columns)
+    return to_csv(rows, columns)
@@ -0,0 +1,302 @@
+"""
+問題データ取り込みジョブ管理
+アップロードされたファイルの取り込みをバックグラウンドのスレッドプールで実行し、
+進捗（状態・行数・エラー・所要時間）を import_jobs テーブルに記録する
+
+各ジョブには投入したワーカー（owner）を記録し、ワーカーは自分の未完了のジョブの
+heartbeat_at を定期的に更新する。ワーカーが停止して heartbeat_at が古くなったジョブは
+起動時・次の投入時に失敗として回収し、同じ試験の取り込みを妨げないようにする。
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# 停止したワーカーのジョブを回収するときのエラー
+ABANDONED_ERROR = '取り込みを実行していたワーカーが停止したため中断されました。もう一度アップロードしてください'
+
+
+def _to_datetime(value):
+    """DBから取得した日時（datetime または文字列）を datetime に変換"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class ImportJobManager:
+    """
+    取り込みジョブの投入・実行・進捗参照
+
+    ジョブの状態はDBに保存するため、複数ワーカープロセス構成でも
+    どのプロセスからでも進捗を参照できる。同じ試験（exam_key）の取り込みは
+    DB上で「実行中」を1件だけ確保できるようにして直列化する。
+    """
+
+    def __init__(self, db_manager, max_workers=2, poll_interval=0.5,
+                 heartbeat_interval=10.0, stale_seconds=60, retention_days=7):
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval  # 未完了のジョブの生存確認を更新する間隔（秒）
+        self.stale_seconds = stale_seconds  # 生存確認がこれより古い未完了のジョブは、ワーカーが停止したとみなす
+        self.retention_days = retention_days
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        self._done = {}  # このプロセスで投入したジョブの完了通知
+        self.owner = uuid.uuid4().hex  # このワーカー（プロセス）の識別子
+        self._heartbeat = None
+        self._heartbeat_lock = threading.Lock()
+
+    def reset_after_fork(self):
+        """
+        フォーク後の子プロセスでスレッドプールを作り直す
+
+        スレッドはフォークで引き継がれないため、親で作成したプールの状態を
+        そのまま使うとジョブが実行されないことがある。
+        """
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='import-job')
+        self._done = {}
+        self.owner = uuid.uuid4().hex
+        self._heartbeat = None
+        self._heartbeat_lock = threading.Lock()
+
+    def recover_abandoned(self):
+        """
+        停止したワーカーの未完了のジョブ（生存確認が stale_seconds より古いもの）を失敗にする
+
+        アップロードされたデータはワーカーのメモリにしか無いので再実行はできない。
+        ワーカーの起動時と、ジョブの投入時に呼ぶ。
+
+        Returns:
+            失敗にしたジョブの数
+        """
+        now = datetime.now()
+        return self.db_manager.execute_query(
+            '''UPDATE import_jobs SET state = ?, errors = ?, finished_at = ?
+               WHERE state IN (?, ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)''',
+            (JOB_FAILED, json.dumps([ABANDONED_ERROR], ensure_ascii=False), now,
+             JOB_QUEUED, JOB_RUNNING, now - timedelta(seconds=self.stale_seconds))
+        ) or 0
+
+    def _start_heartbeat(self):
+        """このワーカーの未完了のジョブの生存確認を更新するスレッドを（まだなければ）起動する"""
+        with self._heartbeat_lock:
+            if self._heartbeat is not None and self._heartbeat.is_alive():
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='import-job-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            if not self._done:
+                continue
+            try:
+                self.db_manager.execute_query(
+                    'UPDATE import_jobs SET heartbeat_at = ? WHERE owner = ? AND state IN (?, ?)',
+                    (datetime.now(), self.owner, JOB_QUEUED, JOB_RUNNING)
+                )
+            except Exception as e:
+                logger.warning(f"Import job heartbeat failed: {e}")
+
+    def submit(self, app, filename, exam_key, task):
+        """
+        取り込みジョブを登録してバックグラウンドで実行する
+
+        Args:
+            app: Flaskアプリ（ワーカースレッドでアプリコンテキストを張るため）
+            filename: 表示用のファイル名
+            exam_key: 直列化の単位（年度・期など）
+            task: task(progress) を受け取る関数。progress(rows, count) で進捗を通知し、
+                  {'success', 'count', 'rows', 'images', 'errors', 'error'} を返す
+
+        Returns:
+            ジョブID
+        """
+        self._purge_old_jobs()
+        try:
+            self.recover_abandoned()
+        except Exception as e:
+            logger.warning(f"Import job recovery skipped: {e}")
+
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+        self.db_manager.execute_query(
+            '''INSERT INTO import_jobs (id, filename, exam_key, state, created_at, owner, heartbeat_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (job_id, filename, exam_key, JOB_QUEUED, now, self.owner, now)
+        )
+        self._done[job_id] = threading.Event()
+        self._start_heartbeat()
+        self._executor.submit(self._run, app, job_id, exam_key, task)
+        return job_id
+
+    def get(self, job_id):
+        """ジョブの進捗を取得（存在しない場合はNone）"""
+        rows = self.db_manager.execute_query('SELECT * FROM import_jobs WHERE id = ?', (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def recent(self, limit=10):
+        """最近のジョブ一覧を取得"""
+        rows = self.db_manager.execute_query(
+            'SELECT * FROM import_jobs ORDER BY created_at DESC LIMIT ?', (int(limit),)
+        ) or []
+        return [self._to_dict(row) for row in rows]
+
+    def wait(self, job_id, timeout=None):
+        """このプロセスで実行中のジョブの完了を待ち、最終状態を返す"""
+        done = self._done.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+        return self.get(job_id)
+
+    def _run(self, app, job_id, exam_key, task):
+        """ワーカースレッドでジョブを実行"""
+        with app.app_context():
+            try:
+                if not self._try_acquire(job_id, exam_key):
+                    job = self.get(job_id)
+                    if job is None or job['state'] != JOB_QUEUED:
+                        # 待機中に回収された（失敗にされた）ジョブは実行しない
+                        done = self._done.pop(job_id, None)
+                        if done is not None:
+                            done.set()
+                        return
+                    # 同じ試験の取り込みが実行中。待機でスレッドを占有しないよう、少し後に再投入する
+                    timer = threading.Timer(self.poll_interval, self._requeue, args=(app, job_id, exam_key, task))
+                    timer.daemon = True
+                    timer.start()
+                    return
+
+                def progress(rows, count):
+                    self.db_manager.execute_query(
+                        'UPDATE import_jobs SET rows_processed = ?, saved_count = ? WHERE id = ?',
+                        (rows, count, job_id)
+                    )
+
+                result = task(progress)
+                errors = list(result.get('errors') or [])
+                if not result.get('success'):
+                    errors.insert(0, result.get('error') or '取り込みに失敗しました')
+
+                self.db_manager.execute_query(
+                    '''UPDATE import_jobs
+                       SET state = ?, rows_processed = ?, saved_count = ?, unchanged_count = ?,
+                           images_count = ?, errors = ?, finished_at = ?
+                       WHERE id = ?''',
+                    (
+                        JOB_SUCCEEDED if result.get('success') else JOB_FAILED,
+                        result.get('rows', 0),
+                        result.get('count', 0),
+                        result.get('unchanged', 0),
+                        result.get('images', 0),
+                        json.dumps(errors, ensure_ascii=False),
+                        datetime.now(),
+                        job_id
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Import job {job_id} failed: {e}")
+                self.db_manager.execute_query(
+                    'UPDATE import_jobs SET state = ?, errors = ?, finished_at = ? WHERE id = ?',
+                    (JOB_FAILED, json.dumps([str(e)], ensure_ascii=False), datetime.now(), job_id)
+                )
+            done = self._done.pop(job_id, None)
+            if done is not None:
+                done.set()
+
+    def _requeue(self, app, job_id, exam_key, task):
+        """待機中のジョブを再度スレッドプールに投入"""
+        try:
+            self._executor.submit(self._run, app, job_id, exam_key, task)
+        except RuntimeError:
+            # シャットダウン中は投入できない（ジョブは queued のまま残る）
+            logger.warning(f"Import job {job_id} could not be requeued")
+
+    def _try_acquire(self, job_id, exam_key):
+        """
+        同じ exam_key の実行中ジョブ（生存確認が新しいもの）が無ければ実行中に遷移する
+
+        exam_key ごとのロック行（import_job_locks）を先にロックしてから確認・更新するので、
+        複数のワーカーが同時に確保しようとしても実行中になるのは1件だけ
+        （MySQL では SELECT ... FOR UPDATE、SQLite では書き込みがDB全体で直列化される）。
+        """
+        if exam_key is not None:
+            ignore = 'INSERT IGNORE' if self.db_manager.db_type == 'mysql' else 'INSERT OR IGNORE'
+            self.db_manager.execute_query(f'{ignore} INTO import_job_locks (exam_key) VALUES (?)', (exam_key,))
+        now = datetime.now()
+        with self.db_manager.transaction() as tx:
+            if exam_key is not None and self.db_manager.db_type == 'mysql':
+                tx.execute('SELECT exam_key FROM import_job_locks WHERE exam_key = ? FOR UPDATE', (exam_key,))
+            # MySQLは更新対象テーブルを直接サブクエリに書けないため派生テーブルで包む
+            claimed = tx.execute(
+                '''UPDATE import_jobs SET state = ?, started_at = ?, heartbeat_at = ?
+                   WHERE id = ? AND state = ? AND NOT EXISTS (
+                       SELECT 1 FROM (
+                           SELECT id FROM import_jobs
+                           WHERE exam_key = ? AND state = ? AND heartbeat_at > ?
+                       ) running_jobs
+                   )''',
+                (JOB_RUNNING, now, now, job_id, JOB_QUEUED, exam_key, JOB_RUNNING,
+                 now - timedelta(seconds=self.stale_seconds))
+            )
+        return bool(claimed)
+
+    def _purge_old_jobs(self):
+        """保持期間を過ぎた完了ジョブを削除"""
+        try:
+            self.db_manager.execute_query(
+                'DELETE FROM import_jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                (datetime.now() - timedelta(days=self.retention_days),)
+            )
+        except Exception as e:
+            logger.warning(f"Import job cleanup skipped: {e}")
+
+    def _to_dict(self, row):
+        """APIレスポンス用に整形"""
+        job = dict(row)
+        created_at = _to_datetime(job.get('created_at'))
+        started_at = _to_datetime(job.get('started_at'))
+        finished_at = _to_datetime(job.get('finished_at'))
+
+        elapsed = None
+        if started_at:
+            elapsed = round(((finished_at or datetime.now()) - started_at).total_seconds(), 2)
+
+        try:
+            errors = json.loads(job['errors']) if job.get('errors') else []
+        except (TypeError, ValueError):
+            errors = []
+
+        return {
+            'id': job['id'],
+            'filename': job.get('filename'),
+            'exam_key': job.get('exam_key'),
+            'state': job.get('state'),
+            'finished': job.get('state') in FINISHED_STATES,
+            'rows_processed': job.get('rows_processed') or 0,
+            'saved_count': job.get('saved_count') or 0,
+            'unchanged_count': job.get('unchanged_count') or 0,
+            'images_count': job.get('images_count') or 0,
+            'errors': errors,
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None,
+            'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S') if started_at else None,
+            'finished_at': finished_at.strftime('%Y-%m-%d %H:%M:%S') if finished_at else None,
+            'elapsed_seconds': elapsed
+        }
@@ -0,0 +1,89 @@
+"""
+問題データ取り込みのワーカー処理
+プロセスプールの子プロセスで実行する、チャンク単位の検証・正規化・ハッシュ計算。
+
+子プロセスは spawn / forkserver で起動し、このモジュールと標準ライブラリだけで書かれた
+app.utils.question_normalize だけを読み込む。Flask・DB・スレッドを持つモジュール
+（app.core.question_manager など）は import しないこと。
+"""
+
+import json
+
+from app.utils.question_normalize import build_question_row as build_normalized_row
+from app.utils.question_normalize import question_content_hash
+
+
+def validate_question_data(data):
+    """アップロードされた問題データの検証"""
+    if not isinstance(data, dict):
+        return False
+
+    required_fields = ['question_id', 'question_text', 'choices', 'correct_answer']
+
+    for field in required_fields:
+        if field not in data:
+            return False
+
+    # 選択肢の検証
+    if not isinstance(data['choices'], (list, dict)):
+        return False
+
+    return True
+
+
+def build_question_row(data):
+    """アップロードされた問題データをDB書き込み用のタプルに変換"""
+    # 選択肢をJSON文字列に変換（SQLiteの場合）
+    choices_json = json.dumps(data['choices'], ensure_ascii=False)
+    choice_images_json = json.dumps(data.get('choice_images', {}), ensure_ascii=False) if data.get('choice_images') else None
+
+    return (
+        data['question_id'],
+        data['question_text'],
+        choices_json,
+        data['correct_answer'],
+        data.get('explanation', ''),
+        data.get('genre', ''),
+        data.get('image_url', ''),
+        choice_images_json
+    )
+
+
+def prepare_chunk(items, start_index=0, source_file='', normalize=False):
+    """
+    チャンク内の問題を検証・正規化し、内容ハッシュを計算する（プロセスプールで実行）
+
+    Args:
+        items: 問題データ（dict）のリスト
+        start_index: ファイル全体でのチャンク先頭の位置（エラー表示・ID採番用）
+        source_file: 元ファイル名（question_id が無い場合の採番に使用）
+        normalize: True なら question_normalize の正規化（初期データ読み込み）、
+                   False ならアップロード時の検証のみでそのまま保存する
+
+    Returns:
+        (rows, hashes, errors)
+    """
+    rows = []
+    hashes = []
+    errors = []
+
+    for offset, item in enumerate(items):
+        index = start_index + offset
+        try:
+            if normalize:
+                row = build_normalized_row(item, index, source_file)
+            else:
+                row = build_question_row(item) if validate_question_data(item) else None
+        except Exception as e:
+            qid = item.get('question_id', f'Q{index+1}') if isinstance(item, dict) else f'Q{index+1}'
+            errors.append(f"問題保存エラー {qid}: {e}")
+            continue
+
+        if row is None:
+            errors.append(f"問題 {index+1}: 必須フィールドが不足しています")
+            continue
+
+        rows.append(row)
+        hashes.append(question_content_hash(row))
+
+    return rows, hashes, errors
@@ -0,0 +1,229 @@
+"""
+項目反応理論（IRT）による問題パラメータとユーザーの能力値の推定
+回答履歴から問題ごとの難易度（b）・識別力（a）とユーザーごとの能力値（θ）を求め、
+question_irt / user_ability に保存する（python app.py --calibrate-irt で実行するオフライン処理）。
+
+user_answers はサーバーサイドカーソルで読みながら (ユーザー, 問題, 正誤) の配列に詰め、
+ユーザー×問題の疎な反応行列（COO形式）として扱う。同じ問題への2回目以降の解答は
+学習の影響を受けるので、各ユーザーの最初の解答だけを使う。
+
+推定は 1PL / 2PL ロジスティックモデル P(正解) = 1 / (1 + exp(-a(θ - b))) の同時事後確率最大化で、
+能力値の一括ニュートン法と問題パラメータの一括ニュートン法（問題ごとの 2x2 を閉じた式で解く）を交互に行う。
+各ステップの勾配・ヘッセ行列は np.bincount で全回答を1度に集計するので、Python のループは反復回数だけ。
+能力値には N(0, 1)、難易度・識別力には弱い事前分布を置き、全問正解・全問不正解でも発散しない。
+
+NumPy は推定を行う環境にだけ必要（pip install -r requirements-irt.txt。Docker イメージには既定で入る）。
+Webアプリの実行には不要。
+"""
+
+import time
+
+# 1回に配列へ詰める回答数
+CHUNK_ROWS = 100000
+# 推定に使う最小の回答数（これ未満の問題・ユーザーは保存しない）
+MIN_RESPONSES = 5
+# 反復の上限と収束判定（パラメータの変化の最大値）
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-4
+# 事前分布: θ ~ N(0, 1)、b ~ N(0, PRIOR_B_SD^2)、a ~ N(1, PRIOR_A_SD^2)
+PRIOR_B_SD = 2.0
+PRIOR_A_SD = 0.5
+# 識別力の範囲と1回の更新幅の上限
+A_MIN, A_MAX = 0.2, 4.0
+MAX_STEP = 1.0
+
+MODELS = ('1pl', '2pl')
+
+_numpy = None
+
+
+def _load_numpy():
+    """
+    NumPy を初回使用時に読み込む（Webアプリの起動時には読み込まない）
+
+    Returns:
+        numpyモジュール（利用できない場合はNone）
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def _require_numpy():
+    np = _load_numpy()
+    if np is None:
+        raise RuntimeError('IRT の推定には NumPy が必要です（pip install -r requirements-irt.txt）')
+    return np
+
+
+class Responses:
+    """疎な反応行列（COO形式。各ユーザーの各問題への最初の解答だけ）"""
+
+    def __init__(self, user_ids, question_ids, users, items, correct):
+        self.user_ids = user_ids          # 行 -> users.id
+        self.question_ids = question_ids  # 列 -> questions.id
+        self.users = users                # 回答ごとの行番号
+        self.items = items                # 回答ごとの列番号
+        self.correct = correct            # 回答ごとの正誤（0.0 / 1.0）
+
+    def __len__(self):
+        return len(self.correct)
+
+
+def build_responses(user_ids, question_ids, correct):
+    """
+    回答（解答日時順）の配列から反応行列を作る
+
+    同じ (ユーザー, 問題) の回答は最初の1件だけを残す。
+    """
+    np = _require_numpy()
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    question_ids = np.asarray(question_ids, dtype=np.int64)
+    correct = np.asarray(correct, dtype=np.float64)
+    row_ids, users = np.unique(user_ids, return_inverse=True)
+    column_ids, items = np.unique(question_ids, return_inverse=True)
+    # np.unique の return_index は各値が最初に現れた位置
+    _, first = np.unique(users.astype(np.int64) * len(column_ids) + items, return_index=True)
+    first.sort()
+    return Responses(row_ids, column_ids, users[first], items[first], correct[first])
+
+
+def stream_responses(db_manager, chunk_rows=CHUNK_ROWS):
+    """user_answers を解答日時順に読みながら配列に詰め、反応行列を作る"""
+    np = _require_numpy()
+    rows = db_manager.iter_query(
+        """
+        SELECT ua.user_id, ua.question_id, ua.is_correct
+        FROM user_answers ua
+        JOIN users u ON u.id = ua.user_id
+        JOIN questions q ON q.id = ua.question_id
+        ORDER BY ua.answered_at, ua.id
+        """,
+        batch_size=min(chunk_rows, 5000)
+    )
+    chunks = []
+    buffer = np.empty((chunk_rows, 3), dtype=np.int64)
+    filled = 0
+    for row in rows:
+        buffer[filled] = (row['user_id'], row['question_id'], 1 if row['is_correct'] else 0)
+        filled += 1
+        if filled == chunk_rows:
+            chunks.append(buffer)
+            buffer = np.empty((chunk_rows, 3), dtype=np.int64)
+            filled = 0
+    chunks.append(buffer[:filled])
+    data = np.concatenate(chunks)
+    return build_responses(data[:, 0], data[:, 1], data[:, 2])
+
+
+def _sigmoid(np, z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30.0, 30.0)))
+
+
+def fit(responses, model='2pl', max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    1PL / 2PL モデルを当てはめる
+
+    Returns:
+        {'ability', 'difficulty', 'discrimination': 配列, 'iterations': 反復回数, 'converged': bool}
+    """
+    if model not in MODELS:
+        raise ValueError(f'未対応のモデルです: {model}')
+    np = _require_numpy()
+    users, items, y = responses.users, responses.items, responses.correct
+    n_users, n_items = len(responses.user_ids), len(responses.question_ids)
+
+    theta = np.zeros(n_users)
+    a = np.ones(n_items)
+    # 切片 c = -a*b を問題ごとの正答率から初期化
+    attempts = np.bincount(items, minlength=n_items)
+    accuracy = (np.bincount(items, weights=y, minlength=n_items) + 0.5) / (attempts + 1.0)
+    c = np.log(accuracy / (1.0 - accuracy))
+
+    iterations, converged = 0, False
+    for iterations in range(1, max_iterations + 1):
+        # 能力値: 全ユーザーを同時にニュートン法で1歩
+        a_i = a[items]
+        p = _sigmoid(np, a_i * theta[users] + c[items])
+        gradient = np.bincount(users, weights=a_i * (y - p), minlength=n_users) - theta
+        hessian = np.bincount(users, weights=a_i * a_i * p * (1.0 - p), minlength=n_users) + 1.0
+        step_theta = np.clip(gradient / hessian, -MAX_STEP, MAX_STEP)
+        theta += step_theta
+
+        # 問題パラメータ: 全問題を同時にニュートン法で1歩（c の事前分布は b ~ N(0, PRIOR_B_SD^2) の近似）
+        t = theta[users]
+        p = _sigmoid(np, a[items] * t + c[items])
+        residual, weight = y - p, p * (1.0 - p)
+        g_c = np.bincount(items, weights=residual, minlength=n_items) - c / (PRIOR_B_SD * a) ** 2
+        h_cc = np.bincount(items, weights=weight, minlength=n_items) + 1.0 / (PRIOR_B_SD * a) ** 2
+        if model == '2pl':
+            g_a = np.bincount(items, weights=residual * t, minlength=n_items) - (a - 1.0) / PRIOR_A_SD ** 2
+            h_aa = np.bincount(items, weights=weight * t * t, minlength=n_items) + 1.0 / PRIOR_A_SD ** 2
+            h_ac = np.bincount(items, weights=weight * t, minlength=n_items)
+            det = h_aa * h_cc - h_ac * h_ac
+            step_a = np.clip((h_cc * g_a - h_ac * g_c) / det, -MAX_STEP, MAX_STEP)
+            step_c = np.clip((h_aa * g_c - h_ac * g_a) / det, -MAX_STEP, MAX_STEP)
+            a = np.clip(a + step_a, A_MIN, A_MAX)
+        else:
+            step_a = np.zeros(n_items)
+            step_c = np.clip(g_c / h_cc, -MAX_STEP, MAX_STEP)
+        c += step_c
+
+        change = max(np.abs(step_theta).max(initial=0.0), np.abs(step_a).max(initial=0.0),
+                     np.abs(step_c).max(initial=0.0))
+        if change < tolerance:
+            converged = True
+            break
+
+    return {
+        'ability': theta,
+        'difficulty': -c / a,
+        'discrimination': a,
+        'iterations': iterations,
+        'converged': converged,
+    }
+
+
+def calibrate(db_manager, model='2pl', min_responses=MIN_RESPONSES):
+    """
+    回答履歴を読み、推定したパラメータを question_irt / user_ability に保存する
+
+    Returns:
+        {'responses', 'questions', 'users', 'iterations', 'converged', 'seconds'}
+    """
+    np = _require_numpy()
+    started = time.perf_counter()
+    responses = stream_responses(db_manager)
+    if not len(responses):
+        return {'responses': 0, 'questions': 0, 'users': 0, 'iterations': 0, 'converged': True,
+                'seconds': time.perf_counter() - started}
+    result = fit(responses, model=model)
+
+    item_counts = np.bincount(responses.items, minlength=len(responses.question_ids))
+    user_counts = np.bincount(responses.users, minlength=len(responses.user_ids))
+    calibrated_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    items = [
+        (int(question_id), round(float(b), 4), round(float(a), 4), int(count))
+        for question_id, b, a, count in zip(responses.question_ids, result['difficulty'],
+                                            result['discrimination'], item_counts)
+        if count >= min_responses
+    ]
+    users = [
+        (int(user_id), round(float(theta), 4), int(count))
+        for user_id, theta, count in zip(responses.user_ids, result['ability'], user_counts)
+        if count >= min_responses
+    ]
+    db_manager.save_irt_calibration(items, users, model, calibrated_at)
+    return {
+        'responses': len(responses),
+        'questions': len(items),
+        'users': len(users),
+        'iterations': result['iterations'],
+        'converged': result['converged'],
+        'seconds': time.perf_counter() - started,
+    }
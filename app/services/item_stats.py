@@ -0,0 +1,142 @@
+"""
+問題ごとの解答統計（正答率・選択肢ごとの選択率）
+question_stats / question_choice_stats（解答の保存と同じトランザクションで更新）を
+ワーカーのメモリに載せ、解答直後のレスポンスに DB を読まずに統計を添える。
+
+自分のワーカーでの解答はすぐにメモリ上の値に加え、他のワーカーでの解答は
+reload_interval 秒ごとに、前回の読み込み以降に更新された問題（question_stats.updated_at）
+だけを読み直して取り込む。読み直しはワーカーごとに同時に1つだけ、バックグラウンドのスレッドで行い、
+解答のリクエストは読み直しを待たない（読み込みが終わるまでは前回のスナップショットを返す）。
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 選択率を表示する最小の解答数（少なすぎる統計は出さない）
+MIN_ATTEMPTS = 5
+# 差分の読み直しで前回の読み込みの開始時刻より前に遡る秒数
+# （読み込み中にコミットされた解答やワーカー間の時計のずれで更新を取りこぼさないようにする）
+RELOAD_OVERLAP_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+
+class ItemStats:
+    """全問題の解答統計のスナップショット"""
+
+    def __init__(self, reload_interval=60.0, background=True):
+        self.reload_interval = reload_interval  # 他のワーカーでの解答を取り込む間隔（秒）
+        self.background = background  # 読み直しをバックグラウンドのスレッドで行う
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._loaded_at = None  # 読み込みが終わった時刻（None ならまだ読み込んでいない）
+        self._loaded_since = None  # 前回の読み込みの開始時刻（差分の読み直しの起点）
+        self._checked_at = None  # 前回読み直しを始めた時刻（失敗しても reload_interval までは再試行しない）
+        self._generation = 0  # reset のたびに進める（reset 前に始めた読み込みの結果は捨てる）
+        self._refreshing = False
+
+    def _ensure_loaded(self, db_manager):
+        """読み直しの時期なら読み直す（同時に1つだけ。バックグラウンドなら待たない）"""
+        with self._lock:
+            if self._refreshing:
+                return
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.reload_interval:
+                return
+            self._refreshing = True
+        if self.background:
+            threading.Thread(target=self._refresh, args=(db_manager,), name='item-stats-refresh', daemon=True).start()
+        else:
+            self._refresh(db_manager)
+
+    def refresh(self, db_manager):
+        """
+        DBから読み直す（初回と reset の後は全件、それ以降は前回の読み込み以降に更新された問題だけ）
+
+        起動時にワーカーのフォーク前に呼び、最初の解答からスナップショットを使えるようにする。
+
+        Returns:
+            読み直したか（他のスレッドが読み直し中ならFalse）
+        """
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        self._refresh(db_manager)
+        return True
+
+    def _refresh(self, db_manager):
+        # 呼び出し側で _refreshing を立ててから呼ぶ
+        try:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                generation = self._generation
+                since = None if self._loaded_at is None else self._loaded_since - timedelta(seconds=RELOAD_OVERLAP_SECONDS)
+            started = datetime.now()
+            stats = db_manager.get_item_stats(since=since)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                if since is None:
+                    self._stats = stats
+                else:
+                    self._stats.update(stats)
+                self._loaded_since = started
+                self._loaded_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"item stats reload failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def record(self, question_id, choice, is_correct):
+        """このワーカーで保存した解答をメモリ上の統計に加える（まだ読み込んでいなければ何もしない）"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            entry = self._stats.setdefault(question_id, {'attempts': 0, 'correct_answers': 0, 'choices': {}})
+            entry['attempts'] += 1
+            entry['correct_answers'] += 1 if is_correct else 0
+            if choice is not None:
+                entry['choices'][choice] = entry['choices'].get(choice, 0) + 1
+
+    def get(self, db_manager, question_id):
+        """
+        問題の統計（解答数が MIN_ATTEMPTS 未満、またはまだ読み込んでいなければNone）
+
+        Returns:
+            {'attempts', 'accuracy_rate', 'choice_rates': {選択肢: 選択率(%)}, 'most_chosen'}
+        """
+        self._ensure_loaded(db_manager)
+        with self._lock:
+            entry = self._stats.get(question_id)
+            if entry is None:
+                return None
+            return summarize(entry['attempts'], entry['correct_answers'], dict(entry['choices']))
+
+    def reset(self):
+        """次の参照時に全件を読み直させる"""
+        with self._lock:
+            self._stats = {}
+            self._loaded_at = None
+            self._loaded_since = None
+            self._checked_at = None
+            self._generation += 1
+
+    def reset_after_fork(self):
+        """フォーク後の子プロセスでロックを作り直す（親で読み直し中だった場合に備える）"""
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+
+def summarize(attempts, correct_answers, choices):
+    """解答数・正解数・選択肢ごとの解答数から表示用の統計を作る（解答数が MIN_ATTEMPTS 未満ならNone）"""
+    if attempts < MIN_ATTEMPTS:
+        return None
+    return {
+        'attempts': attempts,
+        'accuracy_rate': round(correct_answers * 100.0 / attempts, 1),
+        'choice_rates': {choice: round(count * 100.0 / attempts, 1) for choice, count in sorted(choices.items())},
+        'most_chosen': max(sorted(choices), key=choices.get) if choices else None,
+    }
@@ -0,0 +1,292 @@
+"""
+ランキング（リーダーボード）
+解答済みのユーザーを 正答率 → 解答数 → 最終解答日時 の順に並べた順序統計つきスキップリストで保持し、
+上位N件と任意のユーザーの順位を O(log n) で返す。
+
+各ワーカーが自分のリーダーボードを持つ。自分のワーカーでの解答はすぐに反映し、
+他のワーカーでの解答は sync() で user_stats の last_answered_at
+（インデックスあり）が前回の確認以降の行だけを読み直して取り込む。
+ユーザーの削除など順位が減る変更は app_meta の leaderboard_epoch を上げ、全件を読み直させる。
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # width[level]: この節点から next[level] までに進む要素数
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    順序統計つきスキップリスト（キーは互いに比較可能で重複しないこと）
+
+    各リンクに飛ばす要素数を持たせることで、挿入・削除に加えて
+    「キーより小さい要素の数」と「i番目の要素」を O(log n) で求める。
+    """
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVELS and random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self._random_level()
+        new = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def count_less(self, key):
+        """key より小さい要素の数"""
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def __getitem__(self, index):
+        """index 番目（0始まり）の要素"""
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        remaining = index + 1
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.key
+
+    def first(self, n):
+        """先頭から n 件"""
+        keys = []
+        node = self._head.next[0]
+        while node is not None and len(keys) < n:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+def _timestamp(value):
+    """最終解答日時を比較用の数値に変換（不明な場合は0）"""
+    if not value:
+        return 0.0
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _format_datetime(value):
+    if not value:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d %H:%M')
+    return str(value)[:16]
+
+
+class Leaderboard:
+    """user_stats から作るランキング"""
+
+    _SELECT = """
+        SELECT u.id, u.username, us.total_answers, us.correct_answers, us.accuracy_rate, us.last_answered_at
+        FROM user_stats us
+        JOIN users u ON u.id = us.user_id
+    """
+
+    def __init__(self, sync_interval=5.0, overlap_seconds=60):
+        self.sync_interval = sync_interval  # 他のワーカーでの変更を確認する間隔（秒）
+        self.overlap_seconds = overlap_seconds  # コミットの遅れを見込んで読み直す幅（秒）
+        self._lock = threading.RLock()
+        self._clear()
+        self._loaded = False
+        self._epoch = None
+        self._watermark = None  # 取り込み済みの last_answered_at の最大値
+        self._synced_at = float('-inf')
+
+    def _clear(self):
+        self._ranks = IndexableSkipList()
+        self._entries = {}  # user_id -> (並べ替えキー, 表示用のdict)
+
+    @staticmethod
+    def _sort_key(user_id, accuracy_rate, total_answers, last_answered_at):
+        # 小さいほど上位（正答率・解答数・最終解答日時の降順、同じならユーザーID順）
+        return (-float(accuracy_rate or 0), -int(total_answers or 0), -_timestamp(last_answered_at), user_id)
+
+    def update(self, row):
+        """1ユーザーの統計を反映（row: id, username, total_answers, correct_answers, accuracy_rate, last_answered_at）"""
+        user_id = row['id']
+        with self._lock:
+            self._discard(user_id)
+            if not row.get('total_answers'):
+                return
+            key = self._sort_key(user_id, row['accuracy_rate'], row['total_answers'], row['last_answered_at'])
+            entry = {
+                'id': user_id,
+                'username': row['username'],
+                'total_answers': int(row['total_answers']),
+                'correct_answers': int(row['correct_answers'] or 0),
+                'accuracy_rate': float(row['accuracy_rate'] or 0),
+                'last_answered_at': _format_datetime(row['last_answered_at']),
+            }
+            self._ranks.insert(key)
+            self._entries[user_id] = (key, entry)
+            self._advance_watermark(row['last_answered_at'])
+
+    def _discard(self, user_id):
+        current = self._entries.pop(user_id, None)
+        if current is not None:
+            self._ranks.remove(current[0])
+
+    def remove(self, user_id):
+        """ユーザーをランキングから外す"""
+        with self._lock:
+            self._discard(user_id)
+
+    def _advance_watermark(self, last_answered_at):
+        if last_answered_at and (self._watermark is None or str(last_answered_at) > str(self._watermark)):
+            self._watermark = last_answered_at
+
+    def __len__(self):
+        return len(self._ranks)
+
+    def top(self, n=50):
+        """上位 n 件（順位 rank 付き。rank と同じく、並べ替えのキーが同じユーザーは同じ順位）"""
+        with self._lock:
+            keys = self._ranks.first(n)
+            entries, rank, previous = [], 0, None
+            for index, key in enumerate(keys, start=1):
+                if key[:-1] != previous:
+                    rank, previous = index, key[:-1]
+                entries.append(dict(self._entries[key[-1]][1], rank=rank))
+            return entries
+
+    def entry(self, user_id):
+        """ユーザーの統計（ランキング対象外ならNone）"""
+        with self._lock:
+            current = self._entries.get(user_id)
+            return dict(current[1]) if current else None
+
+    def rank(self, user_id):
+        """
+        ユーザーの順位（ランキング対象外ならNone）
+
+        正答率・解答数・最終解答日時がすべて同じユーザーは同じ順位になる。
+        """
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is None:
+                return None
+            return self._ranks.count_less(current[0][:-1]) + 1
+
+    def rebuild(self, db_manager):
+        """user_stats の全件から作り直す"""
+        rows = db_manager.execute_query(self._SELECT + " WHERE us.total_answers > 0") or []
+        epoch = db_manager.get_meta('leaderboard_epoch')
+        with self._lock:
+            self._clear()
+            self._watermark = None
+            for row in rows:
+                self.update(row)
+            self._epoch = epoch
+            self._loaded = True
+            self._synced_at = time.monotonic()
+
+    def refresh_user(self, db_manager, user_id):
+        """1ユーザーの統計をDBから読み直して反映（このワーカーでの解答直後に呼ぶ）"""
+        rows = db_manager.execute_query(self._SELECT + " WHERE us.user_id = ?", (user_id,))
+        if rows:
+            self.update(rows[0])
+        else:
+            self.remove(user_id)
+
+    def sync(self, db_manager, force=False):
+        """
+        他のワーカーでの変更を取り込む（sync_interval 秒に1回まで）
+
+        初回と leaderboard_epoch が変わったときは全件を読み直し、それ以外は
+        last_answered_at が前回の確認時点（から overlap_seconds 前）以降の行だけを読む。
+        """
+        if not force and self._loaded and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if not force and self._loaded and time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            if not self._loaded or db_manager.get_meta('leaderboard_epoch') != self._epoch:
+                self.rebuild(db_manager)
+                return
+
+            since = self._watermark
+            if since is not None:
+                since_ts = _timestamp(since) - self.overlap_seconds
+                since = datetime.fromtimestamp(since_ts).strftime('%Y-%m-%d %H:%M:%S')
+                rows = db_manager.execute_query(self._SELECT + " WHERE us.last_answered_at >= ?", (since,)) or []
+            else:
+                rows = db_manager.execute_query(self._SELECT + " WHERE us.total_answers > 0") or []
+            for row in rows:
+                self.update(row)
+            self._synced_at = time.monotonic()
@@ -0,0 +1,206 @@
+"""
+ログインの流量制御
+IPアドレス・ユーザー名ごとのトークンバケットで試行回数を制限し、
+パスワード検証（PBKDF2などCPUを使う処理）は上限付きのスレッドプールで実行する。
+待ち行列が一杯のときは検証を行わずにすぐ 429 を返し、
+ログインの集中で演習などのリクエストが処理できなくなるのを防ぐ。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class LoginBusy(Exception):
+    """パスワード検証の待ち行列が一杯"""
+
+
+class MemoryBucketStore:
+    """プロセス内のトークンバケット（ワーカーごとに独立）"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys  # キー数の上限（超えたら最も古いものから捨てる）
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """
+        トークンを1つ消費する
+
+        Returns:
+            0（許可）または次にトークンが貯まるまでの秒数
+        """
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            # 末尾に入れ直すことで dict の順序が最終アクセス順になる
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                del self._buckets[next(iter(self._buckets))]
+            return wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBucketStore:
+    """
+    DB上のトークンバケット（rate_limit_buckets テーブル。全ワーカーで共有）
+
+    補充と消費を1つの条件付きUPDATEで行うので、同時に呼ばれても
+    トークン数を超えて許可することはない。
+    """
+
+    # この回数の呼び出しごとに長時間使われていないバケットを削除する
+    PURGE_EVERY = 500
+    PURGE_AFTER_SECONDS = 3600
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._calls = 0
+
+    def take(self, key, capacity, rate, now):
+        """トークンを1つ消費する（MemoryBucketStore.take と同じ）"""
+        self._purge_if_due(now)
+
+        least = 'LEAST' if self.db_manager.db_type == 'mysql' else 'MIN'
+        refilled = f'{least}(?, tokens + (? - updated_at) * ?)'
+        for _ in range(2):
+            claimed = self.db_manager.execute_query(
+                f'''UPDATE rate_limit_buckets
+                    SET tokens = {refilled} - 1, updated_at = ?
+                    WHERE bucket_key = ? AND {refilled} >= 1''',
+                (capacity, now, rate, now, key, capacity, now, rate)
+            )
+            if claimed:
+                return 0.0
+
+            ignore = 'INSERT IGNORE' if self.db_manager.db_type == 'mysql' else 'INSERT OR IGNORE'
+            inserted = self.db_manager.execute_query(
+                f'{ignore} INTO rate_limit_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, capacity - 1, now)
+            )
+            if inserted:
+                return 0.0
+
+            rows = self.db_manager.execute_query(
+                'SELECT tokens, updated_at FROM rate_limit_buckets WHERE bucket_key = ?', (key,)
+            )
+            if rows:
+                tokens = min(capacity, float(rows[0]['tokens']) + (now - float(rows[0]['updated_at'])) * rate)
+                if tokens < 1:
+                    return (1 - tokens) / rate
+            # 他のワーカーと同時に作成・補充された場合はもう一度UPDATEを試す
+        return 1 / rate
+
+    def _purge_if_due(self, now):
+        self._calls += 1
+        if self._calls % self.PURGE_EVERY:
+            return
+        try:
+            self.db_manager.execute_query(
+                'DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.PURGE_AFTER_SECONDS,)
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit bucket cleanup skipped: {e}")
+
+    def reset(self):
+        pass
+
+
+class LoginGuard:
+    """ログイン試行の流量制御とパスワード検証の実行"""
+
+    def __init__(self, store, ip_burst=30, ip_per_minute=60, user_burst=5, user_per_minute=5,
+                 verify_workers=2, verify_queue=8, verify_timeout=10.0):
+        self.store = store
+        self.ip_limit = (ip_burst, ip_per_minute / 60.0)
+        self.user_limit = (user_burst, user_per_minute / 60.0)
+        self.verify_workers = verify_workers
+        self.verify_queue = verify_queue
+        self.verify_timeout = verify_timeout
+        self._start_executor()
+
+    @classmethod
+    def from_config(cls, config, db_manager):
+        """アプリ設定から生成（LOGIN_RATE_LIMIT_BACKEND が database ならDBで共有する）"""
+        if config.get('LOGIN_RATE_LIMIT_BACKEND') == 'database':
+            store = DatabaseBucketStore(db_manager)
+        else:
+            store = MemoryBucketStore()
+        return cls(
+            store,
+            ip_burst=config.get('LOGIN_IP_BURST', 30),
+            ip_per_minute=config.get('LOGIN_IP_PER_MINUTE', 60),
+            user_burst=config.get('LOGIN_USER_BURST', 5),
+            user_per_minute=config.get('LOGIN_USER_PER_MINUTE', 5),
+            verify_workers=config.get('PASSWORD_CHECK_WORKERS', 2),
+            verify_queue=config.get('PASSWORD_CHECK_QUEUE', 8),
+            verify_timeout=config.get('PASSWORD_CHECK_TIMEOUT', 10.0),
+        )
+
+    def _start_executor(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.verify_workers, thread_name_prefix='password-check')
+        # 実行中 + 待機中の検証数の上限
+        self._slots = threading.BoundedSemaphore(self.verify_workers + self.verify_queue)
+
+    def reset_after_fork(self):
+        """フォーク後の子プロセスでスレッドプールとプロセス内のバケットを作り直す"""
+        self._start_executor()
+        self.store.reset()
+
+    def check_rate(self, ip, username):
+        """
+        ログイン試行を1回分消費する
+
+        Returns:
+            0（許可）または再試行までの秒数
+        """
+        now = time.time()
+        waits = []
+        if ip:
+            waits.append(self.store.take(f'login:ip:{ip}', *self.ip_limit, now))
+        if username:
+            waits.append(self.store.take(f'login:user:{username.lower()}', *self.user_limit, now))
+        return max(waits, default=0.0)
+
+    def verify_password(self, password_hash, password):
+        """
+        パスワードを検証する（上限付きスレッドプールで実行）
+
+        Raises:
+            LoginBusy: 待ち行列が一杯、または verify_timeout 以内に終わらない場合
+        """
+        return self.run(check_password_hash, password_hash, password)
+
+    def run(self, func, *args):
+        """
+        パスワードのハッシュ化・検証などCPUを使う処理を上限付きスレッドプールで実行する
+
+        Raises:
+            LoginBusy: 待ち行列が一杯、または verify_timeout 以内に終わらない場合
+        """
+        if not self._slots.acquire(blocking=False):
+            raise LoginBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.verify_timeout)
+        except FutureTimeoutError:
+            raise LoginBusy()
@@ -0,0 +1,112 @@
+"""
+問題データ取り込みパイプライン
+パース済みの問題をチャンク単位でプロセスプールに分配して検証・正規化・ハッシュ計算
+（import_worker.prepare_chunk）を行い、結果を元の順番どおりに1つのバッチ書き込み
+（QuestionManager.write_question_rows）へ流す
+"""
+
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.import_worker import prepare_chunk
+from app.utils.json_stream import iter_chunks
+
+
+def _mp_context():
+    """
+    プロセスプールの起動方式
+
+    取り込みはスレッド（取り込みジョブ・gunicorn の gthread）から呼ばれるため、
+    他のスレッドが持つロックや DB 接続を引き継ぐ fork は使わない。
+    forkserver（無い環境では spawn）で起動した子プロセスは import_worker だけを読み込む。
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class QuestionImportPipeline:
+    """検証・正規化・ハッシュ計算（並列） → 差分書き込み（直列・バッチ）のパイプライン"""
+
+    # ジョブ結果に保存するエラーメッセージの上限
+    MAX_ERRORS = 100
+
+    def __init__(self, question_manager, processes=1, chunk_size=500):
+        self.question_manager = question_manager
+        self.processes = max(1, int(processes or 1))
+        self.chunk_size = chunk_size
+
+    def run(self, items, source_file='', normalize=False, progress_callback=None):
+        """
+        問題データのイテラブルを取り込む
+
+        progress_callback(rows, count) にはチャンクを書き込むたびに
+        読み込んだ行数と書き込み件数が渡される。変更があった場合のみ
+        カタログのバージョンを進める。
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        rows_read = 0
+        errors = []
+        error_total = 0
+
+        try:
+            for chunk_len, (rows, hashes, chunk_errors) in self._prepared_chunks(items, source_file, normalize):
+                rows_read += chunk_len
+                written = self.question_manager.write_question_rows(rows, hashes)
+                for key in counts:
+                    counts[key] += written[key]
+
+                error_total += len(chunk_errors)
+                errors.extend(chunk_errors[:self.MAX_ERRORS - len(errors)])
+
+                if progress_callback:
+                    progress_callback(rows_read, counts['inserted'] + counts['updated'])
+        finally:
+            # 途中でエラーになっても、書き込み済みの変更があればカタログのバージョンを進める
+            if counts['inserted'] or counts['updated']:
+                self.question_manager.db_manager.bump_catalog_version()
+                self.question_manager.invalidate_catalog()
+
+        if error_total > len(errors):
+            errors.append(f"ほか {error_total - len(errors)} 件のエラー")
+
+        return {
+            'rows': rows_read,
+            'count': counts['inserted'] + counts['updated'],
+            'inserted': counts['inserted'],
+            'updated': counts['updated'],
+            'unchanged': counts['unchanged'],
+            'errors': errors
+        }
+
+    def _prepared_chunks(self, items, source_file, normalize):
+        """(チャンク行数, prepare_chunk の結果) を元の順番で返す"""
+        chunks = iter_chunks(items, self.chunk_size)
+
+        # 1チャンクに収まる小さな入力はプロセス起動の方が高くつくので同じプロセスで処理する
+        head = list(itertools.islice(chunks, 2))
+        if self.processes <= 1 or len(head) < 2:
+            start = 0
+            for chunk in itertools.chain(head, chunks):
+                yield len(chunk), prepare_chunk(chunk, start, source_file, normalize)
+                start += len(chunk)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=_mp_context()) as pool:
+            # 先読みするチャンク数を制限してメモリ使用量を一定に保つ
+            max_in_flight = self.processes * 2
+            pending = deque()
+            start = 0
+            for chunk in itertools.chain(head, chunks):
+                future = pool.submit(prepare_chunk, chunk, start, source_file, normalize)
+                pending.append((len(chunk), future))
+                start += len(chunk)
+                if len(pending) >= max_in_flight:
+                    chunk_len, future = pending.popleft()
+                    yield chunk_len, future.result()
+
+            while pending:
+                chunk_len, future = pending.popleft()
+                yield chunk_len, future.result()
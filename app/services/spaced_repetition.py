@@ -0,0 +1,123 @@
+"""
+間隔反復（SM-2）による復習
+間違えた問題を復習対象（review_items）に加え、その後の解答の正誤から
+次に出題する日時（due_at）を SM-2 の規則で決める。
+
+状態の更新は解答の保存と同じトランザクションで行い、復習モードは
+(user_id, due_at) のインデックスから期限の来た問題を古い順に1件ずつ取り出す。
+"""
+
+from datetime import datetime, timedelta
+
+# SM-2 の易しさ係数（初期値と下限）
+EASE_DEFAULT = 2.5
+EASE_MIN = 1.3
+# 正誤を SM-2 の評価（0〜5）に置き換えた値
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+# 間違えた問題を再び出題するまでの時間（分）。SM-2 の「翌日」より早く復習させる
+RELEARN_MINUTES = 10
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def schedule(item, is_correct, now):
+    """
+    1回の解答後の復習状態を求める
+
+    Args:
+        item: 現在の状態（repetitions, interval_days, ease_factor）。未登録ならNone
+        is_correct: 正解したか
+        now: 解答日時
+
+    Returns:
+        {'repetitions', 'interval_days', 'ease_factor', 'due_at'}
+    """
+    repetitions = int(item['repetitions']) if item else 0
+    interval = float(item['interval_days']) if item else 0.0
+    ease = float(item['ease_factor']) if item else EASE_DEFAULT
+
+    quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG
+    ease = max(EASE_MIN, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if is_correct:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = round(interval * ease, 1)
+        due_at = now + timedelta(days=interval)
+    else:
+        repetitions = 0
+        interval = 0.0
+        due_at = now + timedelta(minutes=RELEARN_MINUTES)
+
+    return {
+        'repetitions': repetitions,
+        'interval_days': interval,
+        'ease_factor': round(ease, 2),
+        'due_at': due_at.strftime(DATETIME_FORMAT),
+    }
+
+
+def record_answer(db_manager, user_id, question_id, is_correct, now, tx=None):
+    """
+    解答を復習状態に反映する（tx を渡すとそのトランザクションの中で行う）
+
+    間違えた問題は復習対象に加え、復習対象の問題は正誤に応じて次の出題日時を進める。
+    まだ復習対象でない問題に正解した場合は何もしない。
+    """
+    item = db_manager.get_review_item(user_id, question_id, tx=tx)
+    if item is None and is_correct:
+        return None
+    state = schedule(item, is_correct, now)
+    db_manager.save_review_item(user_id, question_id, state, now.strftime(DATETIME_FORMAT), tx=tx)
+    return state
+
+
+def rebuild(db_manager, batch_size=1000):
+    """
+    既存の回答履歴を古い順に再生して review_items を作り直す
+
+    削除・読み込み・書き込みを1つのトランザクションで行う。先に review_items を削除して
+    ロックを取るので、再構築中に保存された解答の復習状態の更新は再構築のコミットを待ち、
+    再構築した状態の上に加えられる（読み込んだ後の解答が失われない）。
+    """
+    with db_manager.transaction() as tx:
+        tx.execute("DELETE FROM review_items")
+        rows = tx.iter_query(
+            """
+            SELECT ua.user_id, ua.question_id, ua.is_correct, ua.answered_at
+            FROM user_answers ua
+            JOIN users u ON u.id = ua.user_id
+            JOIN questions q ON q.id = ua.question_id
+            WHERE ua.answered_at IS NOT NULL
+            ORDER BY ua.user_id, ua.question_id, ua.answered_at, ua.id
+            """,
+            batch_size=batch_size
+        )
+        items = []
+        current_key, item, last_at = None, None, None
+        for row in rows:
+            key = (row['user_id'], row['question_id'])
+            if key != current_key:
+                if item is not None:
+                    items.append(current_key + (item, last_at))
+                current_key, item = key, None
+            answered_at = _parse_datetime(row['answered_at'])
+            if item is not None or not row['is_correct']:
+                item = schedule(item, bool(row['is_correct']), answered_at)
+                last_at = answered_at.strftime(DATETIME_FORMAT)
+        if item is not None:
+            items.append(current_key + (item, last_at))
+
+        for user_id, question_id, state, reviewed_at in items:
+            db_manager.save_review_item(user_id, question_id, state, reviewed_at, tx=tx)
+    return len(items)
@@ -0,0 +1,217 @@
+"""
+苦手分野を重視した出題
+ユーザーのジャンル別の正答率（user_genre_stats）と問題ごとの誤答回数（user_question_stats）から
+問題ごとの重みを作り、間違えやすい問題・分野ほど出やすくする。
+
+まだ解答していない問題（解答済みの問題のビットセット user_coverage でビットが立っていない問題）は
+UNSEEN_BOOST 倍にして、苦手な問題の復習と並行して未解答の問題にも進めるようにする。
+
+重みはユーザーごとにメモリに保持して解答のたびに該当する問題・ジャンルの分だけ更新し、
+エイリアス法の表は次の出題時に作り直す（出題そのものは問題数に関わらず O(1)）。
+他のワーカーでの解答は ttl 秒ごとにDBから読み直して取り込む。
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from app.services import coverage
+
+# ジャンルの正答率が0%のときの重みの倍率（100%なら1倍）
+GENRE_BOOST = 2.0
+# 問題の重み = QUESTION_FLOOR + QUESTION_BOOST * 誤答率（未解答は事前分布の50%として扱う）
+QUESTION_FLOOR = 0.2
+QUESTION_BOOST = 3.0
+# まだ解答していない問題の重みの倍率
+UNSEEN_BOOST = 1.5
+
+
+class AliasTable:
+    """
+    Vose のエイリアス法による重み付き抽選表
+
+    構築は O(n)、1回の抽選は一様乱数2つで O(1)。
+    """
+
+    def __init__(self, weights):
+        n = len(weights)
+        self._prob = [0.0] * n
+        self._alias = list(range(n))
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            self._prob = [1.0] * n
+            return
+
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # 浮動小数点の誤差で残ったものは確率1
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def __len__(self):
+        return len(self._prob)
+
+    def sample(self, rng=random):
+        """重みに比例した確率で添字を1つ返す"""
+        i = int(rng.random() * len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+def genre_factor(attempts, correct):
+    """ジャンルの重みの倍率（正答率の低いジャンルほど大きい）"""
+    accuracy = (correct + 1) / (attempts + 2)
+    return 1.0 + GENRE_BOOST * (1.0 - accuracy)
+
+
+def question_factor(attempts, wrong):
+    """問題の重み（誤答率の高い問題ほど大きい）"""
+    error_rate = (wrong + 1) / (attempts + 2)
+    return QUESTION_FLOOR + QUESTION_BOOST * error_rate
+
+
+class _UserWeights:
+    """1ユーザー分の重みと抽選表"""
+
+    def __init__(self, pool, genre_rows, question_rows, bits=b''):
+        self.version = pool['version']
+        self.loaded_at = time.monotonic()
+        self.ids = pool['ids']
+        self.genres = pool['genres']
+        self.position = {question_id: i for i, question_id in enumerate(self.ids)}
+        self.by_genre = {}
+        for i, genre in enumerate(self.genres):
+            self.by_genre.setdefault(genre, []).append(i)
+
+        self.genre_counts = {row['genre']: [int(row['attempts'] or 0), int(row['correct_answers'] or 0)]
+                             for row in genre_rows}
+        self.question_counts = {}
+        self.question_weights = [question_factor(0, 0)] * len(self.ids)
+        for row in question_rows:
+            i = self.position.get(row['question_id'])
+            if i is not None:
+                counts = [int(row['attempts'] or 0), int(row['wrong_answers'] or 0)]
+                self.question_counts[i] = counts
+                self.question_weights[i] = question_factor(*counts)
+        self.genre_weights = {genre: genre_factor(*self.genre_counts.get(genre or '', (0, 0)))
+                              for genre in self.by_genre}
+        # まだ解答していない問題の添字（位置が振られていない問題は対象外）
+        seen = coverage.to_int(bits)
+        self.unseen = {i for i, slot in enumerate(pool.get('slots') or ())
+                       if slot is not None and not coverage.is_set(seen, slot)}
+        self.tables = {}  # ジャンル（Noneは全問題） -> (添字のリスト, AliasTable)
+        self.last_question_id = None
+
+    def record(self, question_id, is_correct):
+        """1回答分だけ重みを更新し、影響する抽選表を捨てる"""
+        i = self.position.get(question_id)
+        if i is None:
+            return
+        genre = self.genres[i]
+        counts = self.genre_counts.setdefault(genre or '', [0, 0])
+        counts[0] += 1
+        counts[1] += 1 if is_correct else 0
+        self.genre_weights[genre] = genre_factor(*counts)
+
+        counts = self.question_counts.setdefault(i, [0, 0])
+        counts[0] += 1
+        counts[1] += 0 if is_correct else 1
+        self.question_weights[i] = question_factor(*counts)
+        self.unseen.discard(i)
+
+        self.tables.pop(None, None)
+        self.tables.pop(genre, None)
+
+    def draw(self, genre=None, rng=random):
+        """重みに従って問題IDを1つ選ぶ（直前の問題は他に候補があれば避ける）"""
+        table = self.tables.get(genre)
+        if table is None:
+            indexes = self.by_genre.get(genre, []) if genre is not None else range(len(self.ids))
+            indexes = list(indexes)
+            if not indexes:
+                return None
+            weights = [self.question_weights[i] * self.genre_weights[self.genres[i]]
+                       * (UNSEEN_BOOST if i in self.unseen else 1.0) for i in indexes]
+            table = (indexes, AliasTable(weights))
+            self.tables[genre] = table
+
+        indexes, alias = table
+        question_id = self.ids[indexes[alias.sample(rng)]]
+        # 直前と同じ問題を引いた場合は引き直す（重みはすべて正なのでまず数回で外れる）
+        for _ in range(20):
+            if question_id != self.last_question_id or len(indexes) == 1:
+                break
+            question_id = self.ids[indexes[alias.sample(rng)]]
+        self.last_question_id = question_id
+        return question_id
+
+
+class WeakAreaSampler:
+    """ユーザーごとの重み付き出題（ワーカー内で直近のユーザーの重みを保持する）"""
+
+    def __init__(self, db_manager, question_manager, max_users=1000, ttl=300.0):
+        self.db_manager = db_manager
+        self.question_manager = question_manager
+        self.max_users = max_users  # 重みを保持するユーザー数の上限（超えたら最も古いものから捨てる）
+        self.ttl = ttl  # 他のワーカーでの解答を取り込むためにDBから読み直す間隔（秒）
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id, pool):
+        return _UserWeights(
+            pool,
+            self.db_manager.get_genre_stats(user_id),
+            self.db_manager.get_question_stats(user_id),
+            self.db_manager.get_coverage(user_id)
+        )
+
+    def _weights(self, user_id):
+        pool = self.question_manager.get_question_pool()
+        with self._lock:
+            weights = self._users.get(user_id)
+            if weights is not None:
+                self._users.move_to_end(user_id)
+        if (weights is None or weights.version != pool['version']
+                or time.monotonic() - weights.loaded_at >= self.ttl):
+            last_question_id = weights.last_question_id if weights else None
+            weights = self._load(user_id, pool)
+            weights.last_question_id = last_question_id
+            with self._lock:
+                self._users[user_id] = weights
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return weights
+
+    def draw(self, user_id, genre=None):
+        """
+        出題する問題IDを選ぶ
+
+        Args:
+            genre: このジャンルから選ぶ（Noneなら全問題から）
+
+        Returns:
+            問題ID（候補が無い場合はNone）
+        """
+        weights = self._weights(user_id)
+        with self._lock:
+            return weights.draw(genre)
+
+    def record(self, user_id, question_id, is_correct):
+        """解答を重みに反映する（重みを保持していないユーザーは次の出題時にDBから読む）"""
+        with self._lock:
+            weights = self._users.get(user_id)
+            if weights is not None:
+                weights.record(question_id, is_correct)
+
+    def reset(self):
+        """保持している重みをすべて捨てる"""
+        with self._lock:
+            self._users.clear()
@@ -0,0 +1,119 @@
+"""
+JSON配列の逐次パーサー
+巨大な問題データJSONを丸ごと読み込まずに、配列の要素を1件ずつ取り出す
+"""
+
+import json
+
+# 1回の読み込みサイズ（文字数）
+DEFAULT_READ_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+class NotJSONArrayError(ValueError):
+    """トップレベルが配列ではないJSONが渡された"""
+
+
+def iter_json_array(fp, read_size=DEFAULT_READ_SIZE):
+    """
+    トップレベルがJSON配列のファイルから要素を逐次取り出す
+
+    保持するのは「現在の要素 + 未処理の読み込みバッファ」のみなので、
+    ファイルサイズに関係なくメモリ使用量はほぼ一定になる。
+
+    Args:
+        fp: テキストモードで開いたファイルオブジェクト
+        read_size: 1回に読み込む文字数
+
+    Yields:
+        配列の各要素（dict など）
+
+    Raises:
+        NotJSONArrayError: トップレベルが配列ではない場合
+        json.JSONDecodeError: JSONの形式が正しくない場合
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def read_more(min_size):
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        data = fp.read(min_size)
+        if not data:
+            eof = True
+            return False
+        # 処理済みの部分を捨ててからバッファに追加する
+        buf = buf[pos:] + data
+        pos = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or not read_more(read_size):
+                return
+
+    # 先頭の BOM と空白を読み飛ばして '[' を確認
+    read_more(read_size)
+    if buf.startswith('\ufeff'):
+        pos = 1
+    skip_whitespace()
+    if pos >= len(buf):
+        raise json.JSONDecodeError('Expecting value', buf, pos)
+    if buf[pos] != '[':
+        raise NotJSONArrayError('JSONファイルは配列形式である必要があります。')
+    pos += 1
+
+    expect_value = True
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise json.JSONDecodeError('Unterminated array', buf, pos)
+
+        if buf[pos] == ']' and (first or not expect_value):
+            return
+
+        if not expect_value:
+            if buf[pos] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect_value = True
+            continue
+
+        # 要素の終端がバッファ内に収まるまで読み足す。
+        # 読み足す量を倍々にすることで巨大な要素でも再パースは線形で済む
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if read_more(max(read_size, len(buf) - pos)):
+                    continue
+                raise
+            # 数値などはバッファ末尾で途切れている可能性があるので確定させる
+            if end >= len(buf) and read_more(read_size):
+                continue
+            break
+
+        pos = end
+        first = False
+        expect_value = False
+        yield item
+
+
+def iter_chunks(iterable, size):
+    """イテラブルを最大 size 件ずつのリストに分割する"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,154 @@
+"""
+問題データの正規化と内容ハッシュ
+問題文・画像パス・選択肢の正規化と、保存する行の内容ハッシュの計算。
+
+QuestionManager と取り込みのワーカープロセス（app.services.import_worker）の両方から使うので、
+標準ライブラリ以外は import しない（Flask・DB・スレッドを持つモジュールを読み込まない）。
+"""
+
+import hashlib
+import json
+import re
+
+
+def is_image_url(text):
+    """テキストが画像URLかどうかを判定"""
+    if not text or not isinstance(text, str):
+        return False
+
+    # 画像URLのパターン
+    image_patterns = [
+        r'/static/images/',
+        r'\.png$',
+        r'\.jpg$',
+        r'\.jpeg$',
+        r'\.gif$',
+        r'\.svg$',
+        r'\.webp$'
+    ]
+
+    text_lower = text.lower()
+    return any(re.search(pattern, text_lower) for pattern in image_patterns)
+
+
+def normalize_media_value(val):
+    """Normalize image path/URL; return None when empty."""
+    if not val or not isinstance(val, str):
+        return None
+    cleaned = val.strip()
+    if not cleaned:
+        return None
+    cleaned = cleaned.replace('\\', '/')
+
+    if 'protected_images/questions/' in cleaned:
+        fname = cleaned.split('/')[-1]
+        return f'/images/questions/{fname}'
+
+    if cleaned.startswith('/images/questions/'):
+        return cleaned
+    if cleaned.startswith('images/questions/'):
+        return '/' + cleaned
+    if cleaned.startswith('/static/'):
+        return cleaned
+    if cleaned.startswith('static/'):
+        return '/' + cleaned
+
+    # If it looks like just a filename, map to protected route
+    if '/' not in cleaned:
+        return f'/images/questions/{cleaned}'
+
+    return cleaned
+
+
+def sanitize_question_text(text):
+    """Remove stray image path fragments from question text."""
+    if not text or not isinstance(text, str):
+        return text
+    patterns = [
+        r'/image\\?s?/question[s]?/[^\s]+',
+        r'images?/questions?/[^\s]+',
+        r'protected_images/questions/[^\s]+'
+    ]
+    cleaned = text
+    for p in patterns:
+        cleaned = re.sub(p, '', cleaned, flags=re.IGNORECASE)
+    return cleaned.strip()
+
+
+def normalize_choice_value(val):
+    """Normalize choice text or image path, dropping noisy JSON blobs."""
+    if val is None:
+        return None
+    if not isinstance(val, str):
+        val = str(val)
+    s = val.strip()
+    if not s:
+        return None
+
+    lower = s.lower()
+    if re.search(r'(\.png|\.jpg|\.jpeg|\.gif|\.svg|\.webp)$', lower) or '/image' in lower or 'protected_images/questions/' in lower:
+        return normalize_media_value(s) or s
+
+    if (s.startswith('{') and s.endswith('}')) or (s.startswith('[') and s.endswith(']')):
+        try:
+            decoded = json.loads(s)
+            if isinstance(decoded, str):
+                s = decoded.strip()
+            else:
+                return None
+        except Exception:
+            return None
+
+    s = sanitize_question_text(s)
+    return s if s else None
+
+
+def build_question_row(question, index, source_file=''):
+    """問題データを正規化して書き込み用のタプルに変換（必須フィールド不足時はNone）"""
+    # 必須フィールドの確認
+    required_fields = ['question_text', 'choices', 'correct_answer']
+    if not isinstance(question, dict) or not all(key in question for key in required_fields):
+        return None
+
+    cleaned_choices = {}
+    if isinstance(question.get('choices'), dict):
+        for ck, cv in question['choices'].items():
+            cleaned_val = normalize_choice_value(cv)
+            if cleaned_val:
+                cleaned_choices[ck] = cleaned_val
+    choices_json = json.dumps(cleaned_choices, ensure_ascii=False)
+
+    # question_idの取得
+    question_id = question.get('question_id', f"Q{index+1:03d}_{source_file}")
+
+    # image_urlの処理（正規化して格納）
+    image_url = normalize_media_value(question.get('image_url'))
+
+    # choice_images（後方互換性のため保持）
+    choice_images = question.get('choice_images')
+    choice_images_json = None
+    if choice_images and isinstance(choice_images, dict):
+        valid_choice_images = {}
+        for key, url in choice_images.items():
+            if url and url not in ['null', 'None', 'undefined', '']:
+                valid_choice_images[key] = url
+
+        if valid_choice_images:
+            choice_images_json = json.dumps(valid_choice_images, ensure_ascii=False)
+
+    return (
+        question_id,
+        sanitize_question_text(question.get('question_text')),
+        choices_json,
+        question['correct_answer'],
+        question.get('explanation', ''),
+        question.get('genre', 'その他'),
+        image_url,
+        choice_images_json
+    )
+
+
+def question_content_hash(row):
+    """保存する列の値（question_idを除く）から内容ハッシュを計算"""
+    payload = json.dumps(list(row[1:]), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,41 @@
+"""
+起動時間の計測
+create_app() の各段階の所要時間を記録し、python app.py --profile-startup で一覧表示する
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """起動処理の段階ごとの所要時間"""
+
+    def __init__(self):
+        self.phases = []  # (段階名, 秒)
+
+    @contextmanager
+    def phase(self, name):
+        """with ブロック内の処理時間を name として記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def add(self, name, seconds):
+        """計測済みの時間を記録（モジュール読み込みなど with で囲めない処理用）"""
+        self.phases.append((name, seconds))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def report(self):
+        """段階ごとの所要時間と割合の表"""
+        total = self.total or 1e-9
+        width = max([len(name) for name, _ in self.phases] + [5])
+        lines = [f"{'phase':<{width}} {'ms':>9} {'%':>6}"]
+        for name, seconds in self.phases:
+            lines.append(f"{name:<{width}} {seconds * 1000:>9.1f} {seconds / total * 100:>5.1f}%")
+        lines.append(f"{'total':<{width}} {self.total * 1000:>9.1f}")
+        return '\n'.join(lines)
@@ -0,0 +1,87 @@
+"""
+問題カタログの読み込み時間ベンチマーク
+
+DBの全件読み込みからカタログを構築する場合と、スナップショットファイルを
+mmap する場合の所要時間、および1問あたりの取得時間を比較する。
+
+使い方:
+    python benchmarks/bench_catalog_snapshot.py --questions 20000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import DatabaseManager  # noqa: E402
+from app.core.question_manager import QuestionManager  # noqa: E402
+from app.services.catalog import QuestionCatalog  # noqa: E402
+from app.services.catalog_snapshot import open_snapshot, write_snapshot  # noqa: E402
+
+GENRES = ['ネットワーク', 'データベース', 'セキュリティ', 'アルゴリズム']
+
+
+class _SQLiteConfig:
+    DATABASE_TYPE = 'sqlite'
+
+    def __init__(self, path):
+        self.DATABASE = path
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_catalog_')
+    try:
+        db = DatabaseManager(_SQLiteConfig(os.path.join(workdir, 'bench.db')))
+        db.init_database()
+        qm = QuestionManager(db, import_processes=1)
+        qm.save_questions(
+            {
+                'question_id': f'2099_spring_q{i}',
+                'question_text': f'問題{i}: 次の記述のうち適切なものはどれか。',
+                'choices': {'ア': f'選択肢ア{i}', 'イ': f'選択肢イ{i}', 'ウ': f'選択肢ウ{i}', 'エ': f'選択肢エ{i}'},
+                'correct_answer': 'ア',
+                'explanation': f'解説{i}。' + '計算量に関する解説です。' * 20,
+                'genre': GENRES[i % len(GENRES)],
+            }
+            for i in range(args.questions)
+        )
+
+        catalog, build_ms = timed(lambda: QuestionCatalog.build(qm))
+        path = os.path.join(workdir, 'catalog.bin')
+        epoch = db.get_meta('catalog_epoch')
+        _, write_ms = timed(lambda: write_snapshot(path, catalog, epoch))
+        snapshot, open_ms = timed(lambda: open_snapshot(path, epoch, catalog.version))
+
+        ids = [random.randint(1, args.questions) for _ in range(args.lookups)]
+        _, catalog_get_ms = timed(lambda: [catalog.get(i) for i in ids])
+        _, snapshot_get_ms = timed(lambda: [snapshot.get(i) for i in ids])
+
+        print(f"questions={args.questions} snapshot_size={os.path.getsize(path) / 1024 / 1024:.1f}MB")
+        print(f"{'build from DB':<24} {build_ms:>10.1f} ms")
+        print(f"{'write snapshot':<24} {write_ms:>10.1f} ms")
+        print(f"{'open snapshot (mmap)':<24} {open_ms:>10.1f} ms")
+        print(f"{'get(): in-memory':<24} {catalog_get_ms * 1000 / args.lookups:>10.2f} us")
+        print(f"{'get(): snapshot':<24} {snapshot_get_ms * 1000 / args.lookups:>10.2f} us")
+        snapshot.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+問題取り込みパイプラインのベンチマーク
+
+検証・正規化・ハッシュ計算ステージをプロセス数を変えて実行し、
+コア数に対するスケーリングを計測する。--with-db を付けると
+一時SQLiteへの差分書き込みまで含めたエンドツーエンドの時間も計測する。
+
+使い方:
+    python benchmarks/bench_import_pipeline.py --questions 50000
+    python benchmarks/bench_import_pipeline.py --questions 50000 --processes 1,2,4,8 --with-db
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import DatabaseManager  # noqa: E402
+from app.core.question_manager import QuestionManager  # noqa: E402
+from app.services.question_pipeline import QuestionImportPipeline  # noqa: E402
+
+
+class _SQLiteConfig:
+    DATABASE_TYPE = 'sqlite'
+
+    def __init__(self, path):
+        self.DATABASE = path
+
+
+def make_questions(n):
+    """本番データに近い長さの問題文・解説・画像パスを含む問題を生成"""
+    explanation = 'この問題はアルゴリズムの計算量に関する問題です。' * 20
+    for i in range(n):
+        yield {
+            'question_id': f'2099_s_q{i}',
+            'question_text': f'問題{i}: 次の記述のうち適切なものはどれか。 images/questions/2099_s_q{i}.png',
+            'choices': {
+                'ア': f'選択肢ア{i}',
+                'イ': f'/images/questions/2099_s_q{i}_b.png',
+                'ウ': '"引用された選択肢"',
+                'エ': f'protected_images/questions/2099_s_q{i}_d.png',
+            },
+            'correct_answer': 'ア',
+            'explanation': explanation,
+            'genre': 'アルゴリズム',
+            'image_url': f'protected_images/questions/2099_s_q{i}.png',
+        }
+
+
+def bench(n, processes, chunk_size, with_db):
+    """1回分の取り込みを実行して経過秒数を返す"""
+    if with_db:
+        tmpdir = tempfile.mkdtemp(prefix='bench_import_')
+        db = DatabaseManager(_SQLiteConfig(os.path.join(tmpdir, 'bench.db')))
+        db.init_database()
+        pipeline = QuestionImportPipeline(QuestionManager(db), processes=processes, chunk_size=chunk_size)
+        start = time.perf_counter()
+        rows = pipeline.run(make_questions(n), normalize=True)['rows']
+    else:
+        # 並列ステージのみ（書き込みなし）
+        pipeline = QuestionImportPipeline(None, processes=processes, chunk_size=chunk_size)
+        start = time.perf_counter()
+        rows = sum(chunk_len for chunk_len, _ in pipeline._prepared_chunks(make_questions(n), '', True))
+    elapsed = time.perf_counter() - start
+    assert rows == n
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--processes', default=None,
+                        help='カンマ区切りのプロセス数（既定: 1,2,4,... CPU数まで）')
+    parser.add_argument('--with-db', action='store_true', help='一時SQLiteへの書き込みまで含めて計測')
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    if args.processes:
+        process_counts = [int(p) for p in args.processes.split(',')]
+    else:
+        process_counts = [1]
+        while process_counts[-1] * 2 <= cpu_count:
+            process_counts.append(process_counts[-1] * 2)
+        if process_counts[-1] != cpu_count:
+            process_counts.append(cpu_count)
+
+    print(f"questions={args.questions} chunk_size={args.chunk_size} cpu_count={cpu_count} "
+          f"stage={'validate+normalize+hash+sqlite' if args.with_db else 'validate+normalize+hash'}")
+    print(f"{'processes':>9} {'seconds':>9} {'rows/s':>10} {'speedup':>8}")
+
+    baseline = None
+    for processes in process_counts:
+        elapsed = bench(args.questions, processes, args.chunk_size, args.with_db)
+        baseline = baseline or elapsed
+        print(f"{processes:>9} {elapsed:>9.2f} {args.questions / elapsed:>10.0f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+IRT の推定（python app.py --calibrate-irt）の所要時間ベンチマーク
+
+2PL モデルに従う疑似的な回答を SQLite に入れ、user_answers の読み込み（反応行列の構築）と
+1PL / 2PL の当てはめの所要時間、および真のパラメータとの相関を計測する（NumPy が必要）。
+
+使い方:
+    python benchmarks/bench_irt.py --users 20000 --questions 1200 --responses 1000000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np  # noqa: E402
+
+from app.core.database import DatabaseManager  # noqa: E402
+from app.services import irt  # noqa: E402
+
+
+class _SQLiteConfig:
+    DATABASE_TYPE = 'sqlite'
+
+    def __init__(self, path):
+        self.DATABASE = path
+
+
+def populate(db, users, questions, responses, seed):
+    """真のパラメータを返し、それに従う回答を user_answers に入れる"""
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(size=users)
+    b = rng.normal(size=questions)
+    a = rng.lognormal(0.0, 0.3, size=questions)
+    conn = db.get_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')",
+            ((i + 1, f'bench{i}') for i in range(users))
+        )
+        conn.executemany(
+            "INSERT INTO questions (id, question_id, question_text, choices, correct_answer) VALUES (?, ?, 'q', '{}', 'ア')",
+            ((i + 1, f'Q{i}') for i in range(questions))
+        )
+        u = rng.integers(0, users, responses)
+        i = rng.integers(0, questions, responses)
+        correct = rng.random(responses) < 1.0 / (1.0 + np.exp(-a[i] * (theta[u] - b[i])))
+        conn.executemany(
+            "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+            "VALUES (?, ?, 'ア', ?, '2026-01-01 00:00:00')",
+            zip((u + 1).tolist(), (i + 1).tolist(), correct.astype(int).tolist())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return theta, b, a
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--questions', type=int, default=1200)
+    parser.add_argument('--responses', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_irt_')
+    try:
+        db = DatabaseManager(_SQLiteConfig(os.path.join(workdir, 'bench.db')))
+        db.init_database()
+        theta, b, a = populate(db, args.users, args.questions, args.responses, args.seed)
+
+        start = time.perf_counter()
+        responses = irt.stream_responses(db)
+        stream_s = time.perf_counter() - start
+        print(f"users={args.users} questions={args.questions} responses={args.responses} "
+              f"(first attempts={len(responses)})")
+        print(f"{'stream user_answers':<22} {stream_s:>8.2f} s")
+        for model in irt.MODELS:
+            start = time.perf_counter()
+            result = irt.fit(responses, model=model)
+            fit_s = time.perf_counter() - start
+            r_b = np.corrcoef(result['difficulty'], b[responses.question_ids - 1])[0, 1]
+            r_theta = np.corrcoef(result['ability'], theta[responses.user_ids - 1])[0, 1]
+            line = f"{'fit ' + model:<22} {fit_s:>8.2f} s  iterations={result['iterations']} r(b)={r_b:.3f} r(θ)={r_theta:.3f}"
+            if model == '2pl':
+                line += f" r(a)={np.corrcoef(result['discrimination'], a[responses.question_ids - 1])[0, 1]:.3f}"
+            print(line)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+パスワードハッシュのコストとログイン処理能力のベンチマーク
+
+ハッシュ方式ごとに、PASSWORD_CHECK_WORKERS と同じ数のスレッドで
+パスワード検証を繰り返し、1秒あたり・1コアあたりのログイン数と
+検証時間の p50 / p99 を計測する。p99 がログインの応答時間の予算に収まり、
+想定するピーク時のログイン数を捌ける範囲で最もコストの高い方式を
+PASSWORD_HASH_METHOD に設定する。
+
+使い方:
+    python benchmarks/bench_password_hash.py --threads 2 --duration 3 \
+        --method pbkdf2:sha256:200000 --method pbkdf2:sha256:600000 --method scrypt:32768:8:1
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import check_password_hash  # noqa: E402
+
+from app.core.passwords import DEFAULT_METHOD, hash_password  # noqa: E402
+
+DEFAULT_METHODS = ['pbkdf2:sha256:200000', DEFAULT_METHOD, 'scrypt:32768:8:1']
+
+
+def percentile(sorted_values, ratio):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(method, threads, duration):
+    """指定した方式で duration 秒間検証を繰り返し、(件数, 経過秒, 検証時間の一覧) を返す"""
+    password_hash = hash_password('bench-password', method)
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            check_password_hash(password_hash, 'bench-password')
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(threads):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - start
+    return len(latencies), elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', action='append', help='計測するハッシュ方式（複数指定可）')
+    parser.add_argument('--threads', type=int, default=2, help='検証スレッド数（PASSWORD_CHECK_WORKERS）')
+    parser.add_argument('--duration', type=float, default=3.0, help='方式ごとの計測秒数')
+    parser.add_argument('--budget-ms', type=float, default=250.0, help='検証時間 p99 の予算（ミリ秒）')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    busy_cores = min(cores, args.threads)
+    print(f"cpu={cores} threads={args.threads} duration={args.duration}s budget(p99)={args.budget_ms:.0f}ms")
+    print(f"{'method':<26} {'logins/s':>10} {'per core':>10} {'p50 ms':>9} {'p99 ms':>9}  budget")
+    for method in args.method or DEFAULT_METHODS:
+        count, elapsed, latencies = run(method, args.threads, args.duration)
+        rate = count / elapsed if elapsed else 0.0
+        p50 = percentile(latencies, 0.50) * 1000
+        p99 = percentile(latencies, 0.99) * 1000
+        verdict = 'ok' if p99 <= args.budget_ms else 'over'
+        print(f"{method:<26} {rate:>10.1f} {rate / busy_cores:>10.1f} {p50:>9.1f} {p99:>9.1f}  {verdict}")
+
+
+if __name__ == '__main__':
+    main()
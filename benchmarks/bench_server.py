@@ -0,0 +1,223 @@
+"""
+サーバー構成ごとのスループット比較ベンチマーク
+
+一時ディレクトリのSQLiteに問題とユーザーを用意し、
+  - dev:      python app.py（Flask開発サーバー、従来のDockerfileの起動方法）
+  - gunicorn: gunicorn --config gunicorn.conf.py（preload + 問題カタログ）
+をそれぞれ起動して、ログイン済みの並列クライアントから出題系ページを叩き続け、
+リクエスト数/秒とレイテンシを比較する。
+
+使い方:
+    python benchmarks/bench_server.py
+    python benchmarks/bench_server.py --questions 5000 --duration 20 --concurrency 16 --workers 4
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app.core.database import DatabaseManager  # noqa: E402
+from app.core.question_manager import QuestionManager  # noqa: E402
+
+GENRES = ['ネットワーク', 'データベース', 'セキュリティ', 'アルゴリズム']
+USERNAME = 'bench_user'
+PASSWORD = 'bench_pass'
+
+
+class _SQLiteConfig:
+    DATABASE_TYPE = 'sqlite'
+
+    def __init__(self, path):
+        self.DATABASE = path
+
+
+def seed_database(workdir, n):
+    """ベンチマーク用の問題とユーザーを作成"""
+    db = DatabaseManager(_SQLiteConfig(os.path.join(workdir, 'fe_exam.db')))
+    db.init_database()
+    questions = [
+        {
+            'question_id': f'2099_spring_q{i}',
+            'question_text': f'問題{i}: 次の記述のうち適切なものはどれか。',
+            'choices': {'ア': f'選択肢ア{i}', 'イ': f'選択肢イ{i}', 'ウ': f'選択肢ウ{i}', 'エ': f'選択肢エ{i}'},
+            'correct_answer': 'ア',
+            'explanation': '解説です。' * 40,
+            'genre': GENRES[i % len(GENRES)],
+        }
+        for i in range(n)
+    ]
+    QuestionManager(db, import_processes=1).save_questions(questions, 'bench.json')
+    db.execute_query(
+        'INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)',
+        (USERNAME, generate_password_hash(PASSWORD), 0)
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('サーバーの起動に失敗しました')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('サーバーの起動がタイムアウトしました')
+
+
+def login(port):
+    """ログインしてセッションCookieを返す（Secure属性は無視して送り返す）"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    body = urllib.parse.urlencode({'username': USERNAME, 'password': PASSWORD})
+    conn.request('POST', '/login', body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = response.getheader('Set-Cookie', '').split(';', 1)[0]
+    if not cookie:
+        raise RuntimeError('ログインに失敗しました')
+    return cookie
+
+
+def run_clients(port, cookie, paths, concurrency, duration):
+    """並列クライアントで paths を順番に叩き、(リクエスト数, エラー数, レイテンシ一覧) を返す"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        local_errors = 0
+        i = offset
+        while time.perf_counter() < stop_at:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), errors[0], sorted(latencies)
+
+
+def bench(name, command, workdir, env, args):
+    port = free_port()
+    env = dict(env, PORT=str(port), HOST='127.0.0.1')
+    proc = subprocess.Popen(command, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, proc)
+        cookie = login(port)
+        paths = ['/practice/random', '/practice/genre', '/dashboard'] + [
+            '/practice/genre/' + urllib.parse.quote(genre) for genre in GENRES
+        ]
+        # ウォームアップ
+        run_clients(port, cookie, paths, args.concurrency, 1)
+        count, errors, latencies = run_clients(port, cookie, paths, args.concurrency, args.duration)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+    return {
+        'server': name,
+        'requests': count,
+        'errors': errors,
+        'rps': count / args.duration,
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None, help='gunicorn のワーカー数（既定: gunicorn.conf.py の値）')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_server_')
+    try:
+        seed_database(workdir, args.questions)
+        env = dict(os.environ,
+                   SECRET_KEY='bench-secret', ADMIN_PASSWORD='bench-admin',
+                   DEBUG='false', FLASK_ENV='production',
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'fe_exam.db')}",
+                   PYTHONPATH=REPO_ROOT)
+        env.pop('WEB_CONCURRENCY', None)
+        if args.workers:
+            env['WEB_CONCURRENCY'] = str(args.workers)
+
+        results = [
+            bench('dev (python app.py)', [sys.executable, os.path.join(REPO_ROOT, 'app.py')], workdir, env, args),
+            bench('gunicorn', [sys.executable, '-m', 'gunicorn', '--config',
+                               os.path.join(REPO_ROOT, 'gunicorn.conf.py')], workdir, env, args),
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"questions={args.questions} duration={args.duration}s concurrency={args.concurrency} "
+          f"cpu_count={os.cpu_count()}")
+    print(f"{'server':<22} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50(ms)':>8} {'p99(ms)':>8}")
+    for r in results:
+        print(f"{r['server']:<22} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
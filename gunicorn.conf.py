@@ -0,0 +1,52 @@
+"""
+gunicorn 設定（本番用）
+使い方: gunicorn --config gunicorn.conf.py
+
+アプリは preload_app でマスタープロセスに1度だけ読み込み（問題カタログの構築を含む）、
+フォーク直前に gc.freeze() してからワーカーを起動する。読み込み済みのオブジェクトは
+GCの走査対象から外れるので、ワーカーはそのページをコピーオンライトで共有し続けられる。
+"""
+
+import gc
+import os
+
+_cpu_count = os.cpu_count() or 1
+
+wsgi_app = 'wsgi:create_app()'
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5002')}"
+
+# ワーカー数: CPU数 × 2 + 1（DB待ちの間も他のワーカーがCPUを使えるように）
+workers = int(os.environ.get('WEB_CONCURRENCY', _cpu_count * 2 + 1))
+# ワーカーごとのスレッド数（DB待ちのリクエストを重ねる）
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# ワーカーのハートビートをディスクではなくメモリ上に書く（コンテナ向け）
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+# アプリ読み込み中に世代別GCが走って共有予定のオブジェクトに触れないようにする
+gc.disable()
+
+
+def pre_fork(server, worker):
+    """フォーク直前: 読み込み済みのオブジェクトを永続世代に移してGCの走査対象から外す"""
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """フォーク直後のワーカー: GCを再開し、プロセス固有の状態を作り直す"""
+    gc.enable()
+
+    from wsgi import reset_after_fork
+    reset_after_fork(worker.app.wsgi())
@@ -17,3 +17,49 @@ def test_create_app_with_temp_db(tmp_path, monkeypatch):
     assert flask_app is not None
     assert flask_app.config.get("DATABASE_URL") == f"sqlite:///{db_path}"
     assert flask_app.secret_key
+
+
+def test_wsgi_entry_point_builds_catalog(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'wsgi.db'}")
+    monkeypatch.setenv("SECRET_KEY", "test-secret-key")
+    monkeypatch.setenv("ADMIN_PASSWORD", "test-admin-password")
+    monkeypatch.setenv("QUESTION_CATALOG", "true")
+    monkeypatch.setenv("CATALOG_SNAPSHOT_PATH", str(tmp_path / "catalog.bin"))
+    import importlib
+
+    from app.core import config as config_module
+
+    importlib.reload(config_module)
+    import wsgi
+
+    flask_app = wsgi.create_app()
+
+    assert flask_app.question_manager.catalog is not None
+    # 新しいDBでも初期問題データを読み込んでから起動する（--maintenance を待たない）
+    assert len(flask_app.question_manager.catalog) > 0
+    assert (tmp_path / "catalog.bin").exists()
+    assert flask_app.jinja_loader.searchpath[0].endswith("app/templates")
+
+    # フォーク後のワーカーではスレッドプールが作り直される
+    executor = flask_app.import_jobs._executor
+    wsgi.reset_after_fork(flask_app)
+    assert flask_app.import_jobs._executor is not executor
+
+
+def test_importing_app_module_does_not_create_app(monkeypatch):
+    monkeypatch.setenv("SECRET_KEY", "test-secret-key")
+    monkeypatch.setenv("ADMIN_PASSWORD", "test-admin-password")
+    import importlib.util
+    import pathlib
+
+    app_path = pathlib.Path(__file__).resolve().parents[1] / "app.py"
+    spec = importlib.util.spec_from_file_location("app_lazy", app_path)
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+
+    assert "app" not in vars(app_module)
+
+    flask_app = app_module.create_app()
+    phases = [name for name, _ in flask_app.startup_profile.phases]
+    assert phases[:3] == ["imports", "flask", "security"]
+    assert "database" in flask_app.startup_profile.report()
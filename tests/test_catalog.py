@@ -0,0 +1,145 @@
+from app.core.database import DatabaseManager
+from app.core.question_manager import QuestionManager
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def make_question_manager(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "catalog.db"))
+    db.init_database()
+    qm = QuestionManager(db)
+    qm.save_questions(
+        [
+            {
+                "question_id": f"2031_s_q{i}",
+                "question_text": f"問題{i}",
+                "choices": {"ア": f"選択肢{i}", "イ": "q.png"},
+                "correct_answer": "ア",
+                "genre": "ネットワーク" if i % 2 else "データベース",
+            }
+            for i in range(1, 5)
+        ]
+    )
+    return qm
+
+
+def test_catalog_matches_database_reads(tmp_path):
+    qm = make_question_manager(tmp_path)
+    expected = {
+        "question": qm.get_question(1),
+        "genre": qm.get_questions_by_genre("ネットワーク"),
+        "genres": qm.get_all_genres(),
+        "total": qm.get_total_questions(),
+        "ids": qm.get_questions_by_ids([3, 1, 99]),
+    }
+
+    catalog = qm.enable_catalog(check_interval=60)
+
+    assert len(catalog) == 4
+    assert qm.get_question(1) == expected["question"]
+    assert qm.get_questions_by_genre("ネットワーク") == expected["genre"]
+    assert qm.get_all_genres() == expected["genres"]
+    assert qm.get_total_questions() == expected["total"]
+    assert qm.get_questions_by_ids([3, 1, 99]) == expected["ids"]
+    assert [q["id"] for q in expected["ids"]] == [3, 1]
+
+
+def test_catalog_returns_copies(tmp_path):
+    qm = make_question_manager(tmp_path)
+    qm.enable_catalog(check_interval=60)
+
+    question = qm.get_question(1)
+    question["choices"]["ア"] = "書き換え"
+    question["question_text"] = "書き換え"
+
+    assert qm.get_question(1)["choices"]["ア"] == "選択肢1"
+    assert qm.get_question(1)["question_text"] == "問題1"
+
+
+def test_random_question_avoids_previous(tmp_path):
+    qm = make_question_manager(tmp_path)
+    qm.enable_catalog(check_interval=60)
+
+    previous = qm.get_random_question()["id"]
+    for _ in range(50):
+        current = qm.get_random_question()["id"]
+        assert current != previous
+        previous = current
+
+
+def test_catalog_rebuilds_when_version_changes(tmp_path):
+    qm = make_question_manager(tmp_path)
+    qm.enable_catalog(check_interval=60)
+    db = qm.db_manager
+
+    # 他プロセスでの書き換えは確認間隔が過ぎるまで反映されない
+    db.execute_query("DELETE FROM questions WHERE question_id = ?", ("2031_s_q1",))
+    db.bump_catalog_version()
+    assert qm.get_total_questions() == 4
+
+    qm.catalog_check_interval = 0
+    assert qm.get_total_questions() == 3
+    assert qm.get_question(1) is None
+
+    # このプロセスでの削除はすぐに反映される
+    qm.catalog_check_interval = 60
+    qm.delete_all_questions()
+    assert qm.get_total_questions() == 0
+
+
+def test_snapshot_matches_in_memory_catalog(tmp_path):
+    from app.services.catalog import QuestionCatalog
+    from app.services.catalog_snapshot import open_snapshot, write_snapshot
+
+    qm = make_question_manager(tmp_path)
+    qm.db_manager.execute_query("UPDATE questions SET choice_images = ? WHERE id = 2", ('{"ア": "a.png"}',))
+    catalog = QuestionCatalog.build(qm)
+    path = tmp_path / "catalog.bin"
+    write_snapshot(path, catalog, epoch=7)
+
+    snapshot = open_snapshot(path, 7, catalog.version)
+
+    assert len(snapshot) == len(catalog)
+    for question in catalog:
+        assert snapshot.get(question["id"]) == catalog.get(question["id"])
+    assert snapshot.get(999) is None
+    assert snapshot.by_ids([3, 999, 1]) == catalog.by_ids([3, 999, 1])
+    assert snapshot.genres() == catalog.genres()
+    assert snapshot.by_genre("ネットワーク") == catalog.by_genre("ネットワーク")
+    assert snapshot.by_genre("なし") == []
+    assert snapshot.random_question(exclude_id=1)["id"] != 1
+
+    # 別のDB・古いバージョン・壊れたファイルは使わない
+    assert open_snapshot(path, 8, catalog.version) is None
+    assert open_snapshot(path, 7, catalog.version + 1) is None
+    path.write_bytes(path.read_bytes()[:-1])
+    assert open_snapshot(path, 7, catalog.version) is None
+
+
+def test_enable_catalog_reuses_snapshot(tmp_path):
+    from app.services.catalog_snapshot import MappedCatalog
+
+    qm = make_question_manager(tmp_path)
+    path = tmp_path / "catalog.bin"
+
+    # 初回はDBから構築してスナップショットを書き出す
+    assert isinstance(qm.enable_catalog(snapshot_path=str(path)), MappedCatalog)
+    assert path.exists()
+
+    # 2回目はDBの問題を読まずにスナップショットを使う
+    other = QuestionManager(qm.db_manager)
+    other.prepare_question = None  # DBから構築すると失敗する
+    catalog = other.enable_catalog(snapshot_path=str(path))
+    assert len(catalog) == 4
+    assert catalog.get(1)["question_text"] == "問題1"
+
+    # 問題が変わるとスナップショットも作り直される
+    qm.catalog_check_interval = 0
+    qm.delete_all_questions()
+    assert qm.get_total_questions() == 0
+    assert len(QuestionManager(qm.db_manager).enable_catalog(snapshot_path=str(path))) == 0
@@ -0,0 +1,36 @@
+import random
+from collections import Counter
+
+from app.services import coverage
+
+
+def test_set_bit_grows_and_reports_new_bits():
+    bits = coverage.set_bit(b"", 10)
+    assert bits == b"\x00\x04"
+    assert coverage.set_bit(bits, 10) is None
+    bits = coverage.set_bit(bits, 1)
+    assert coverage.to_int(bits) == (1 << 10) | (1 << 1)
+    assert coverage.from_indexes([1, 10, 10]) == bits
+
+
+def test_count_by_genre_uses_masks():
+    ids = (1, 2, 3, 5, 8)
+    genres = ("ネットワーク", "ネットワーク", "データベース", None, "データベース")
+    masks = coverage.build_masks(ids, genres)
+    bits = coverage.from_indexes([2, 3, 5, 7])  # 7 は削除済みの問題
+
+    assert coverage.count_by_genre(bits, masks) == {None: 3, "ネットワーク": 1, "データベース": 1}
+
+
+def test_pick_unseen_draws_uniformly_from_unattempted():
+    ids = list(range(1, 200))
+    masks = coverage.build_masks(ids, ["g"] * len(ids))
+    seen = [i for i in ids if i % 3]
+    bits = coverage.from_indexes(seen)
+    rng = random.Random(1)
+
+    draws = Counter(coverage.pick_unseen(bits, masks["g"], rng) for _ in range(20000))
+    unseen = [i for i in ids if i % 3 == 0]
+    assert set(draws) == set(unseen)
+    assert max(draws.values()) < 2 * min(draws.values())
+    assert coverage.pick_unseen(coverage.from_indexes(ids), masks["g"]) is None
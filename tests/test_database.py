@@ -0,0 +1,451 @@
+from datetime import datetime
+import subprocess
+import sys
+import threading
+
+from app.core.database import DatabaseManager
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+class CountingDB(DatabaseManager):
+    def __init__(self, config):
+        super().__init__(config)
+        self.queries = []
+
+    def execute_query(self, query, params=None):
+        self.queries.append(query)
+        return super().execute_query(query, params)
+
+
+def test_schema_is_verified_once_per_version(tmp_path):
+    db = CountingDB(SQLiteConfig(tmp_path / "schema.db"))
+    assert db.init_database() is True
+    assert db.get_schema_version() == DatabaseManager.SCHEMA_VERSION
+
+    # スキーマが最新なら2回目以降はバージョン確認のみ
+    db.queries.clear()
+    assert db.init_database() is False
+    assert not any("CREATE" in q or "user_stats" in q for q in db.queries)
+    assert len(db.queries) == 2
+
+    # バージョンが変わると再実行される
+    db.set_meta("schema_version", 0)
+    assert db.init_database() is True
+
+
+def test_rebuild_user_stats_in_one_statement(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "stats.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x'), ('b', 'x')")
+    db.execute_query(
+        "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES "
+        "(1, 1, 'ア', 1, '2026-01-01 10:00:00'), (1, 2, 'イ', 0, '2026-01-02 10:00:00'), "
+        "(1, 3, 'ア', 1, '2026-01-03 10:00:00')"
+    )
+    db.execute_query("UPDATE user_stats SET total_answers = 99")
+
+    db.rebuild_user_stats()
+
+    stats = {row["user_id"]: row for row in db.execute_query("SELECT * FROM user_stats")}
+    assert (stats[1]["total_answers"], stats[1]["correct_answers"], stats[1]["accuracy_rate"]) == (3, 2, 66.7)
+    assert stats[1]["last_answered_at"] == "2026-01-03 10:00:00"
+    assert (stats[2]["total_answers"], stats[2]["accuracy_rate"]) == (0, 0)
+
+
+def test_sqlite_startup_does_not_import_pymysql():
+    code = (
+        "import sys; from app.core.database import DatabaseManager; "
+        "print('pymysql' in sys.modules)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_iter_query_streams_rows(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "stream.db"))
+    db.init_database()
+    db.execute_many("INSERT INTO app_meta (meta_key, meta_value) VALUES (?, ?)", [(f"k{i}", i) for i in range(7)])
+
+    rows = db.iter_query("SELECT meta_key, meta_value FROM app_meta WHERE meta_key LIKE 'k%' ORDER BY meta_value", batch_size=3)
+    assert next(rows) == {"meta_key": "k0", "meta_value": 0}
+    assert [row["meta_value"] for row in rows] == [1, 2, 3, 4, 5, 6]
+
+
+def test_users_page_sorts_searches_and_paginates(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "users.db"))
+    db.init_database()
+    for name in ["alice", "alfred", "al_x", "bob", "albert"]:
+        db.execute_query("INSERT INTO users (username, password_hash) VALUES (?, ?)", (name, "x"))
+    ids = {row["username"]: row["id"] for row in db.execute_query("SELECT id, username FROM users")}
+    for name, answers, correct in [("alice", 10, 9), ("alfred", 4, 1), ("bob", 7, 7)]:
+        db.execute_query(
+            "INSERT INTO user_stats (user_id, total_answers, correct_answers, accuracy_rate) VALUES (?, ?, ?, ?)",
+            (ids[name], answers, correct, round(correct * 100 / answers, 1)),
+        )
+    db.ensure_user_stats_row(ids["albert"])
+    db.ensure_user_stats_row(ids["albert"])
+
+    rows, total = db.get_users_page(sort="username", descending=False, limit=2)
+    assert total == 5
+    assert [r["username"] for r in rows] == ["al_x", "albert"]
+    rows, _ = db.get_users_page(sort="username", descending=False, limit=2, offset=4)
+    assert [r["username"] for r in rows] == ["bob"]
+
+    rows, total = db.get_users_page(prefix="al", sort="total_answers")
+    assert total == 4
+    assert [r["username"] for r in rows][:3] == ["alice", "alfred", "albert"]
+
+    # ワイルドカード文字はそのまま前方一致として扱う
+    rows, total = db.get_users_page(prefix="al_")
+    assert (total, [r["username"] for r in rows]) == (1, ["al_x"])
+
+    rows, _ = db.get_users_page(sort="accuracy_rate")
+    assert [r["username"] for r in rows][:2] == ["bob", "alice"]
+
+
+def test_counters_follow_transactions_and_recount(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "counters.db"))
+    db.execute_query("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT, password_hash TEXT)")
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('existing', 'x')")
+    db.init_database()
+    assert db.get_counters() == {"users": 1, "answers": 0, "active_users": 0}
+
+    with db.transaction() as tx:
+        tx.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("new", "x"))
+        db.increment_counter("users", 1, tx=tx)
+    assert db.get_counters()["users"] == 2
+
+    # ロールバックされたらカウンターも戻る
+    try:
+        with db.transaction() as tx:
+            db.increment_counter("users", 1, tx=tx)
+            tx.execute("INSERT INTO no_such_table VALUES (1)")
+    except Exception:
+        pass
+    assert db.get_counters()["users"] == 2
+
+    # 読むときは件数を数えず、取りこぼしはメンテナンス処理の再集計で補正される
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('bypass', 'x')")
+    assert db.get_counters()["users"] == 2
+    db.recount_counters()
+    assert db.get_counters()["users"] == 3
+
+
+def test_daily_stats_match_rebuild_and_power_period_rankings(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "daily.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x'), ('b', 'x'), ('c', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{}', 'ア', 'ネットワーク'), ('Q2', 'q', '{}', 'ア', 'データベース')"
+    )
+    answers = [
+        # (user_id, question_id, is_correct, answered_at, genre)
+        (1, 1, 1, "2026-01-01 10:00:00", "ネットワーク"),
+        (1, 2, 0, "2026-01-08 09:00:00", "データベース"),
+        (1, 2, 1, "2026-01-08 21:00:00", "データベース"),
+        (2, 1, 1, "2026-01-07 10:00:00", "ネットワーク"),
+        (2, 2, 1, "2026-01-08 10:00:00", "データベース"),
+        (3, 1, 0, "2026-01-08 11:00:00", "ネットワーク"),
+    ]
+    for user_id, question_id, is_correct, answered_at, genre in answers:
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (?, ?, 'ア', ?, ?)",
+                (user_id, question_id, is_correct, answered_at),
+            )
+            db.record_daily_answer(user_id, genre, is_correct, answered_at[:10], tx=tx)
+
+    # 解答ごとの増分と全件からの再構築が一致する
+    query = "SELECT user_id, stat_date, genre, attempts, correct_answers FROM user_daily_stats ORDER BY user_id, stat_date, genre"
+    incremental = db.execute_query(query)
+    db.rebuild_daily_stats()
+    assert db.execute_query(query) == incremental
+    assert len(incremental) == 5
+
+    # 期間で絞ると古い解答は含まれない
+    week, _ = db.get_period_rankings(since="2026-01-02")
+    assert [(row["username"], row["total_answers"], row["accuracy_rate"]) for row in week] == [
+        ("b", 2, 100.0), ("a", 2, 50.0), ("c", 1, 0.0)
+    ]
+    everything, _ = db.get_period_rankings()
+    assert (everything[1]["username"], everything[1]["total_answers"]) == ("a", 3)
+
+    network, current = db.get_period_rankings(genre="ネットワーク", user_id=3)
+    assert [row["username"] for row in network] == ["b", "a", "c"]
+    assert current["rank"] == 3
+    assert db.get_period_rankings(since="2026-01-02", user_id=1)[1]["rank"] == 2
+    assert db.get_period_rankings(since="2026-02-01", user_id=1) == ([], None)
+
+    # 上位に入らないユーザーの順位も同じクエリで返る
+    top, current = db.get_period_rankings(since="2026-01-02", limit=1, user_id=3)
+    assert [row["username"] for row in top] == ["b"]
+    assert (current["username"], current["rank"]) == ("c", 3)
+
+    # 同点のユーザーは一覧でも自分の順位でも同じ順位（RANK）
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('d', 'x')")
+    with db.transaction() as tx:
+        db.record_daily_answer(4, "ネットワーク", True, "2026-01-08", tx=tx)
+        db.record_daily_answer(4, "データベース", True, "2026-01-08", tx=tx)
+    tied, current = db.get_period_rankings(since="2026-01-02", user_id=4)
+    assert [(row["username"], row["rank"]) for row in tied] == [("b", 1), ("d", 1), ("a", 3), ("c", 4)]
+    assert current["rank"] == 1 and "position" not in current
+
+
+def test_genre_stats_follow_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "genre.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{}', 'ア', 'ネットワーク'), ('Q2', 'q', '{}', 'ア', NULL)"
+    )
+    for question_id, is_correct, answered_at, genre in (
+        (1, 1, "2026-01-02 10:00:00", "ネットワーク"),
+        (1, 0, "2026-01-01 10:00:00", "ネットワーク"),
+        (2, 1, "2026-01-03 10:00:00", None),
+    ):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (1, ?, 'ア', ?, ?)",
+                (question_id, is_correct, answered_at),
+            )
+            db.record_genre_answer(1, genre, is_correct, answered_at, tx=tx)
+
+    stats = {row["genre"]: row for row in db.get_genre_stats(1)}
+    assert (stats["ネットワーク"]["attempts"], stats["ネットワーク"]["correct_answers"]) == (2, 1)
+    # 古い解答が後から届いても最終解答日時は戻らない
+    assert stats["ネットワーク"]["last_answered_at"] == "2026-01-02 10:00:00"
+    assert stats[""]["attempts"] == 1
+
+    incremental = sorted(db.get_genre_stats(1), key=lambda row: row["genre"])
+    db.rebuild_genre_stats()
+    assert sorted(db.get_genre_stats(1), key=lambda row: row["genre"]) == incremental
+
+
+def test_mistakes_follow_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "mistakes.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{}', 'ア', NULL), ('Q2', 'q', '{}', 'ア', NULL), ('Q3', 'q', '{}', 'ア', NULL)"
+    )
+    for question_id, is_correct, answered_at in (
+        (1, 0, "2026-01-01 10:00:00"),
+        (1, 1, "2026-01-02 10:00:00"),
+        (1, 0, "2026-01-03 10:00:00"),
+        (2, 0, "2026-01-01 11:00:00"),
+        (2, 0, "2026-01-04 10:00:00"),
+        (3, 0, "2026-01-01 12:00:00"),
+        (3, 1, "2026-01-05 10:00:00"),
+    ):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (1, ?, 'ア', ?, ?)",
+                (question_id, is_correct, answered_at),
+            )
+            db.record_mistake(1, question_id, is_correct, answered_at, tx=tx)
+
+    rows, total = db.get_mistakes(1)
+    assert total == 2
+    # 正解した問題は外れ、正解後に間違えた回数だけを数える
+    assert [(row["question_id"], row["miss_count"]) for row in rows] == [(2, 2), (1, 1)]
+    oldest, _ = db.get_mistakes(1, limit=1, oldest_first=True)
+    assert oldest[0]["question_id"] == 1
+
+    # 削除された問題の行は一覧にも件数にも含めない（解き直しの先頭を塞がない）
+    db.execute_query("INSERT INTO user_mistakes (user_id, question_id, missed_at) VALUES (1, 99, '2026-01-01 00:00:00')")
+    oldest, total = db.get_mistakes(1, limit=1, oldest_first=True)
+    assert (oldest[0]["question_id"], total) == (1, 2)
+    db.execute_query("DELETE FROM user_mistakes WHERE question_id = 99")
+
+    incremental = [dict(row) for row in rows]
+    db.rebuild_mistakes()
+    assert [dict(row) for row in db.get_mistakes(1)[0]] == incremental
+
+
+def test_coverage_follows_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "coverage.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{}', 'ア', NULL), ('Q2', 'q', '{}', 'ア', NULL), ('Q3', 'q', '{}', 'ア', NULL)"
+    )
+    assert db.get_coverage_slots() == {1: 0, 2: 1, 3: 2}
+    assert db.get_coverage(1) == b""
+    for question_id in (3, 1, 3):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+                "VALUES (1, ?, 'ア', 1, '2026-01-01 10:00:00')",
+                (question_id,),
+            )
+            db.record_coverage(1, question_id, "2026-01-01 10:00:00", tx=tx)
+
+    incremental = db.get_coverage(1)
+    assert incremental == bytes([(1 << 0) | (1 << 2)])
+    db.rebuild_coverage()
+    assert db.get_coverage(1) == incremental
+
+
+def test_coverage_slots_stay_dense_across_reimports(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "coverage.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+
+    def import_questions():
+        db.execute_query(
+            "INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES "
+            "('Q1', 'q', '{}', 'ア'), ('Q2', 'q', '{}', 'ア')"
+        )
+        db.bump_catalog_version()
+        return sorted(db.get_coverage_slots().items())
+
+    first = import_questions()
+    with db.transaction() as tx:
+        db.record_coverage(1, first[1][0], "2026-01-01 10:00:00", tx=tx)
+    assert db.get_coverage(1) == bytes([1 << 1])
+
+    # 削除・再取り込みで問題IDが変わっても、削除された問題の位置は再利用しない
+    db.execute_query("DELETE FROM questions")
+    second = import_questions()
+    assert [slot for _, slot in second] == [2, 3]
+
+    # メンテナンスで位置を 0 から詰め直し、ビットセットも詰めた位置で作り直す
+    version = db.get_catalog_version()
+    with db.transaction() as tx:
+        tx.execute(
+            "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+            "VALUES (1, ?, 'ア', 1, '2026-01-02 10:00:00')",
+            (second[1][0],),
+        )
+        db.record_coverage(1, second[1][0], "2026-01-02 10:00:00", tx=tx)
+    db.rebuild_coverage()
+    assert [slot for _, slot in sorted(db.get_coverage_slots().items())] == [0, 1]
+    assert db.get_coverage(1) == bytes([1 << 1])
+    assert db.get_catalog_version() > version
+
+
+def test_item_stats_follow_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "items.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x'), ('b', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{\"ア\": \"1\", \"イ\": \"2\"}', 'ア', NULL)"
+    )
+    for user_id, answer in ((1, "ア"), (1, "イ"), (2, "イ"), (2, "不正な値")):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+                "VALUES (?, 1, ?, ?, '2026-01-01 10:00:00')",
+                (user_id, answer, int(answer == "ア")),
+            )
+            choice = answer if answer in ("ア", "イ") else None
+            db.record_item_answer(1, choice, answer == "ア", "2026-01-01 10:00:00", tx=tx)
+
+    incremental = db.get_item_stats()
+    assert incremental == {1: {"attempts": 4, "correct_answers": 1, "choices": {"ア": 1, "イ": 2}}}
+    rows, total = db.get_item_difficulty_page(min_attempts=1)
+    assert total == 1 and rows[0]["accuracy_rate"] == 25.0 and rows[0]["choices"] == {"ア": 1, "イ": 2}
+    db.rebuild_item_stats()
+    assert db.get_item_stats() == incremental
+
+    # ユーザーの削除時はそのユーザーの解答を差し引く
+    with db.transaction() as tx:
+        db.remove_user_item_answers(2, tx)
+        tx.execute("DELETE FROM user_answers WHERE user_id = 2")
+        tx.execute("DELETE FROM users WHERE id = 2")
+    assert db.get_item_stats() == {1: {"attempts": 2, "correct_answers": 1, "choices": {"ア": 1, "イ": 1}}}
+    assert db.get_item_difficulty_page()[0][0]["accuracy_rate"] == 50.0
+    db.rebuild_item_stats()
+    assert db.get_item_stats() == {1: {"attempts": 2, "correct_answers": 1, "choices": {"ア": 1, "イ": 1}}}
+
+
+def test_item_stats_since_reads_only_updated_questions(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "items_since.db"))
+    db.init_database()
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES "
+        "('Q1', 'q', '{\"ア\": \"1\"}', 'ア', NULL), ('Q2', 'q', '{\"ア\": \"1\"}', 'ア', NULL)"
+    )
+    db.record_item_answer(1, "ア", True, datetime(2026, 1, 1, 10, 0, 0))
+    db.record_item_answer(2, "ア", True, datetime(2026, 1, 1, 12, 0, 0, 500000))
+
+    assert set(db.get_item_stats()) == {1, 2}
+    assert db.get_item_stats(since=datetime(2026, 1, 1, 11, 0, 0)) == {
+        2: {"attempts": 1, "correct_answers": 1, "choices": {"ア": 1}}
+    }
+    assert db.get_item_stats(since=datetime(2026, 1, 1, 13, 0, 0)) == {}
+
+
+def test_answer_recorded_during_coverage_rebuild_is_not_lost(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "coverage.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES "
+        "('Q1', 'q', '{}', 'ア'), ('Q2', 'q', '{}', 'ア')"
+    )
+    db.get_coverage_slots()
+
+    def answer(question_id):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+                "VALUES (1, ?, 'ア', 1, '2026-01-01 10:00:00')",
+                (question_id,),
+            )
+            db.record_coverage(1, question_id, "2026-01-01 10:00:00", tx=tx)
+
+    answer(1)
+
+    # 再構築が回答履歴を読んでいる最中に別の解答が保存される
+    writer = []
+    iter_on = db._iter_on
+
+    def iter_and_answer(*args):
+        for row in iter_on(*args):
+            if not writer:
+                writer.append(threading.Thread(target=answer, args=(2,)))
+                writer[0].start()
+                writer[0].join(0.2)
+            yield row
+
+    db._iter_on = iter_and_answer
+    db.rebuild_coverage()
+    writer[0].join()
+
+    assert db.get_coverage(1) == bytes([(1 << 0) | (1 << 1)])
+
+
+def test_user_stats_follow_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "user_stats.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query("INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES ('Q1', 'q', '{}', 'ア')")
+    for is_correct, answered_at in ((1, "2026-01-01 10:00:00"), (0, "2026-01-01 11:00:00"), (1, "2026-01-01 12:00:00")):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (1, 1, 'ア', ?, ?)",
+                (is_correct, answered_at),
+            )
+            db.record_user_answer(1, is_correct, answered_at, tx=tx)
+
+    row = db.get_stats_row(1)
+    assert (row["total_answers"], row["correct_answers"], row["accuracy_rate"]) == (3, 2, 66.7)
+    assert str(row["last_answered_at"]) == "2026-01-01 12:00:00"
+    # 解答のたびに統計バージョンが進む（/api/stats の ETag）
+    assert row["stats_version"] == 3
+
+    db.rebuild_user_stats()
+    rebuilt = db.get_stats_row(1)
+    assert (rebuilt["total_answers"], rebuilt["correct_answers"], rebuilt["accuracy_rate"]) == (3, 2, 66.7)
@@ -100,6 +100,324 @@ def test_auth_login_logout(app_client):
     assert "ログアウト".encode() in res.data
 
 
+def test_login_attempts_are_rate_limited(monkeypatch, tmp_path):
+    monkeypatch.setenv("LOGIN_USER_BURST", "2")
+    app = make_app(monkeypatch, tmp_path)
+    with app.app_context():
+        seed_users(app.db_manager)
+    client = app.test_client()
+
+    for _ in range(2):
+        res = login_user(client, "user1", "wrong-password")
+        assert res.status_code == 200
+
+    # 上限を超えるとパスワードを検証せずに429を返す
+    res = login_user(client, "user1", "user1pass")
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) >= 1
+    assert "試行が多すぎます" in res.get_data(as_text=True)
+
+    # 別のユーザーはログインできる
+    res = login_user(client, "admin_db", "admin_db_pass")
+    assert res.status_code in (200, 302)
+
+
+def test_login_rate_limit_uses_forwarded_client_address(monkeypatch, tmp_path):
+    monkeypatch.setenv("TRUSTED_PROXIES", "1")
+    monkeypatch.setenv("LOGIN_IP_BURST", "2")
+    app = make_app(monkeypatch, tmp_path)
+    with app.app_context():
+        seed_users(app.db_manager)
+    client = app.test_client()
+
+    def login_from(client_ip, username):
+        # すべてのリクエストは同じプロキシ（REMOTE_ADDR）から届く
+        return client.post(
+            "/login",
+            data={"username": username, "password": "wrong-password"},
+            headers={"X-Forwarded-For": client_ip},
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        )
+
+    for username in ("user1", "admin_db"):
+        assert login_from("203.0.113.5", username).status_code == 200
+    assert login_from("203.0.113.5", "admin2").status_code == 429
+
+    # 別のクライアントはプロキシが同じでも制限されない
+    assert login_from("203.0.113.6", "admin2").status_code == 200
+
+
+def test_login_rehashes_password_with_configured_method(monkeypatch, tmp_path):
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+    app = make_app(monkeypatch, tmp_path)
+    with app.app_context():
+        seed_users(app.db_manager)
+    client = app.test_client()
+
+    def stored_hash():
+        return app.db_manager.execute_query(
+            "SELECT password_hash FROM users WHERE username = ?", ("user1",)
+        )[0]["password_hash"]
+
+    old_hash = stored_hash()
+    assert not old_hash.startswith("pbkdf2:sha256:1000$")
+
+    # 失敗したログインではハッシュを変更しない
+    login_user(client, "user1", "wrong-password")
+    assert stored_hash() == old_hash
+
+    res = login_user(client, "user1", "user1pass")
+    assert res.status_code == 200
+    assert stored_hash().startswith("pbkdf2:sha256:1000$")
+
+    # 新しいハッシュでもログインできる
+    client.get("/logout")
+    res = login_user(client, "user1", "user1pass")
+    assert "ようこそ" in res.get_data(as_text=True)
+
+
+def test_api_stats_etag_reads_only_stats_row(app_client, monkeypatch):
+    app, client = app_client
+    app.question_manager.enable_catalog(check_interval=3600)
+    login_user(client, "user1", "user1pass")
+
+    res = client.get("/api/stats")
+    assert res.status_code == 200
+    assert res.get_json() == {"total_questions": 1, "correct_answers": 0, "accuracy_rate": 0, "total_answers": 0}
+    etag = res.headers["ETag"]
+
+    # 変更が無ければ user_stats の1行を読むだけで304
+    calls = []
+    original = app.db_manager.execute_query
+    monkeypatch.setattr(app.db_manager, "execute_query", lambda *a, **k: calls.append(a) or original(*a, **k))
+    res = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert len(calls) == 1
+    assert "FROM user_stats" in calls[0][0]
+    monkeypatch.setattr(app.db_manager, "execute_query", original)
+
+    # 別の端末（セッション）での解答も次のポーリングで返る
+    other = app.test_client()
+    login_user(other, "user1", "user1pass")
+    question_id = app.db_manager.execute_query("SELECT id FROM questions")[0]["id"]
+    other.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+    res = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    data = res.get_json()
+    assert data["total_answers"] == 1
+    assert data["correct_answers"] == 1
+    assert data["accuracy_rate"] == 100.0
+
+
+def test_dashboard_issues_at_most_one_query(app_client, monkeypatch):
+    app, client = app_client
+    login_user(client, "user1", "user1pass")
+    question_id = app.db_manager.execute_query("SELECT id FROM questions")[0]["id"]
+    client.post(f"/questions/{question_id}/answer", json={"answer": "B"})
+    # 問題数・ジャンル一覧のキャッシュを温める（カタログ無効の構成）
+    app.question_manager.catalog_check_interval = 3600
+    assert client.get("/dashboard").status_code == 200
+
+    queries = []
+    original = app.db_manager.execute_query
+    monkeypatch.setattr(app.db_manager, "execute_query", lambda q, *a, **k: queries.append(q) or original(q, *a, **k))
+    res = client.get("/dashboard")
+    assert res.status_code == 200
+    assert len(queries) <= 1
+    assert all("user_answers" not in q for q in queries)
+    body = res.get_data(as_text=True)
+    assert 'id="stat-total-answers">1' in body.replace("\n", "").replace(" ", "")
+
+
+def test_genre_pages_show_accuracy_and_weak_areas(app_client):
+    app, client = app_client
+    db = app.db_manager
+    login_user(client, "user1", "user1pass")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    for _ in range(5):
+        client.post(f"/questions/{question_id}/answer", json={"answer": "B"})
+
+    body = client.get("/practice/genre").get_data(as_text=True)
+    assert "苦手分野" in body
+    assert "正答率 0.0%（苦手）" in body
+    body = client.get("/dashboard").get_data(as_text=True)
+    assert "ネットワーク（苦手）" in body
+
+
+def test_genre_page_counts_attempted_questions(app_client):
+    app, client = app_client
+    login_user(client, "user1", "user1pass")
+    question_id = app.db_manager.execute_query("SELECT id FROM questions")[0]["id"]
+
+    assert "解答済み 0/1問" in client.get("/practice/genre").get_data(as_text=True)
+    for answer in ("B", "A"):
+        client.post(f"/questions/{question_id}/answer", json={"answer": answer})
+    assert "解答済み 1/1問" in client.get("/practice/genre").get_data(as_text=True)
+
+
+def test_submit_answer_returns_item_stats_without_queries(app_client, monkeypatch):
+    app, client = app_client
+    db = app.db_manager
+    login_user(client, "user1", "user1pass")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    admin_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("admin_db",))[0]["id"]
+
+    for answer in ("C", "C", "A", "B"):
+        assert client.post(f"/questions/{question_id}/answer", json={"answer": answer}).get_json()["stats"] is None
+
+    queries = []
+    original = db.execute_query
+    monkeypatch.setattr(db, "execute_query", lambda q, *a, **k: queries.append(q) or original(q, *a, **k))
+    stats = client.post(f"/questions/{question_id}/answer", json={"answer": "C"}).get_json()["stats"]
+    assert stats["accuracy_rate"] == 20.0
+    assert stats["most_chosen"] == "C" and stats["choice_rates"]["C"] == 60.0
+    assert all("question_stats" not in q and "question_choice_stats" not in q for q in queries)
+    monkeypatch.undo()
+
+    with admin_session(client, admin_id):
+        body = client.get("/admin/questions/stats").get_data(as_text=True)
+    assert "Q1" in body and "20.0%" in body
+    assert "要確認" in body
+
+
+def test_review_mode_serves_missed_questions_when_due(app_client):
+    app, client = app_client
+    db = app.db_manager
+    login_user(client, "user1", "user1pass")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    user_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("user1",))[0]["id"]
+
+    body = client.get("/practice/review").get_data(as_text=True)
+    assert "今復習する問題はありません" in body
+
+    client.post(f"/questions/{question_id}/answer", json={"answer": "B"})
+    # 間違えた直後はまだ期限が来ていない
+    assert "次の復習は" in client.get("/practice/review").get_data(as_text=True)
+
+    db.execute_query("UPDATE review_items SET due_at = ? WHERE user_id = ?", ("2000-01-01 00:00:00", user_id))
+    body = client.get("/practice/review").get_data(as_text=True)
+    assert "サンプル問題" in body
+    assert "復習 モード（残り1問）" in body
+
+    client.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+    item = db.get_review_item(user_id, question_id)
+    assert item["repetitions"] == 1 and str(item["due_at"]) > "2000-01-01"
+
+
+def test_mistakes_page_lists_until_answered_correctly(app_client):
+    app, client = app_client
+    db = app.db_manager
+    login_user(client, "user1", "user1pass")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+
+    assert "まだ正解していない問題はありません" in client.get("/mistakes").get_data(as_text=True)
+    assert "間違えた問題はありません" in client.get("/practice/mistakes").get_data(as_text=True)
+
+    client.post(f"/questions/{question_id}/answer", json={"answer": "B"})
+    client.post(f"/questions/{question_id}/answer", json={"answer": "C"})
+    body = client.get("/mistakes").get_data(as_text=True)
+    assert "サンプル問題" in body
+    assert "2回" in body
+    assert f"/practice/mistakes/{question_id}" in body
+
+    body = client.get("/practice/mistakes").get_data(as_text=True)
+    assert "解き直し モード" in body
+    client.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+    assert "まだ正解していない問題はありません" in client.get("/mistakes").get_data(as_text=True)
+
+
+def test_history_api_pages_with_cursor(app_client):
+    app, client = app_client
+    db = app.db_manager
+    user1_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("user1",))[0]["id"]
+    admin_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("admin_db",))[0]["id"]
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    # 同じ時刻の回答を含めても重複・欠落しないこと
+    times = ["2024-01-01 10:00:00", "2024-01-02 10:00:00", "2024-01-02 10:00:00", "2024-01-03 10:00:00", "2024-01-04 10:00:00"]
+    for answered_at in times:
+        db.execute_query(
+            "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (?, ?, ?, ?, ?)",
+            (user1_id, question_id, "A", 1, answered_at),
+        )
+    db.execute_query(
+        "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (?, ?, ?, ?, ?)",
+        (admin_id, question_id, "B", 0, "2024-01-05 10:00:00"),
+    )
+    other_answer = db.execute_query("SELECT id FROM user_answers WHERE user_id = ?", (admin_id,))[0]["id"]
+    expected = [row["id"] for row in db.execute_query(
+        "SELECT id FROM user_answers WHERE user_id = ? ORDER BY answered_at DESC, id DESC", (user1_id,)
+    )]
+    login_user(client, "user1", "user1pass")
+
+    seen, cursor = [], None
+    while True:
+        res = client.get("/api/history", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        data = res.get_json()
+        assert len(data["items"]) <= 2
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert seen == expected
+
+    item = data["items"][-1]
+    assert item["question_text"] == "サンプル問題"
+    assert item["has_explanation"] is True
+    assert "explanation" not in item
+
+    res = client.get(f"/api/history/{item['id']}/explanation")
+    assert res.get_json() == {"question_text": "サンプル問題", "explanation": "サンプル解説"}
+    assert client.get(f"/api/history/{other_answer}/explanation").status_code == 404
+    assert client.get("/api/history", query_string={"cursor": "not-a-cursor"}).status_code == 400
+
+    res = client.get("/history")
+    assert res.status_code == 200
+    assert "サンプル問題" in res.get_data(as_text=True)
+
+
+def test_history_export_streams_csv_and_ndjson(app_client, monkeypatch):
+    app, client = app_client
+    db = app.db_manager
+    user1_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("user1",))[0]["id"]
+    admin_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("admin_db",))[0]["id"]
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    rows = [(user1_id, "A", 1, "2024-01-01 10:00:00"), (user1_id, "C", 0, "2024-01-02 10:00:00"),
+            (admin_id, "B", 0, "2024-01-03 10:00:00")]
+    db.execute_query("DELETE FROM user_answers")
+    for user_id, answer, correct, answered_at in rows:
+        db.execute_query(
+            "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, question_id, answer, correct, answered_at),
+        )
+    login_user(client, "user1", "user1pass")
+
+    res = client.get("/history/export?format=csv")
+    assert res.status_code == 200
+    assert res.is_streamed
+    lines = res.get_data(as_text=True).lstrip("\ufeff").splitlines()
+    assert lines[0] == "answer_id,question_id,question_code,genre,user_answer,correct_answer,is_correct,answered_at"
+    assert [line.split(",")[4] for line in lines[1:]] == ["A", "C"]
+    assert lines[1].endswith("Q1,ネットワーク,A,A,1,2024-01-01 10:00:00")
+
+    res = client.get("/history/export?format=ndjson")
+    records = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [r["user_answer"] for r in records] == ["A", "C"]
+    assert records[1]["is_correct"] is False
+    assert client.get("/history/export?format=xml").status_code == 400
+
+    # 一般ユーザーは全ユーザーのエクスポートを使えない
+    assert client.get("/admin/export/answers").status_code in (302, 403)
+
+    from app.services import history_export
+    monkeypatch.setattr(history_export, "FLUSH_ROWS", 1)
+    with admin_session(client, admin_id):
+        res = client.get("/admin/export/answers?format=ndjson")
+    records = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [(r["username"], r["user_answer"]) for r in records] == [("user1", "A"), ("user1", "C"), ("admin_db", "B")]
+
+
 def test_admin_toggle_and_delete_guards(app_client):
     app, client = app_client
     db = app.db_manager
@@ -129,6 +447,107 @@ def test_admin_toggle_and_delete_guards(app_client):
         assert "自分自身を削除することはできません".encode() in res.data
 
 
+def test_admin_user_list_search_and_pagination(app_client, monkeypatch):
+    app, client = app_client
+    db = app.db_manager
+    admin_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("admin_db",))[0]["id"]
+    from app.routes import admin_routes
+    monkeypatch.setattr(admin_routes, "USERS_PER_PAGE", 2)
+
+    with admin_session(client, admin_id):
+        res = client.get("/admin/users?sort=username&order=asc")
+        body = res.get_data(as_text=True)
+        assert res.status_code == 200
+        assert "admin2" in body and "admin_db" in body and "user1" not in body
+        assert "1 / 2 ページ" in body
+
+        res = client.get("/admin/users?sort=username&order=asc&page=2")
+        assert "user1" in res.get_data(as_text=True)
+
+        res = client.get("/admin/users?q=user")
+        body = res.get_data(as_text=True)
+        assert "user1" in body and "admin2" not in body
+
+        assert client.get("/admin/users?sort=bogus&page=-3").status_code == 200
+
+
+def test_admin_counters_track_registrations_answers_and_deletes(app_client):
+    app, client = app_client
+    db = app.db_manager
+    db.execute_query("DELETE FROM user_answers")
+    db.rebuild_user_stats()
+    db.recount_counters()
+    assert db.get_counters() == {"users": 3, "answers": 0, "active_users": 0}
+
+    res = client.post("/register", data={"username": "newbie", "password": "newbiepass1", "confirm_password": "newbiepass1"})
+    assert res.status_code in (200, 302)
+    assert db.get_counters()["users"] == 4
+
+    login_user(client, "newbie", "newbiepass1")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    client.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+    client.post(f"/questions/{question_id}/answer", json={"answer": "B"})
+    assert db.get_counters() == {"users": 4, "answers": 2, "active_users": 1}
+    client.get("/logout")
+
+    admin_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("admin_db",))[0]["id"]
+    newbie_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("newbie",))[0]["id"]
+    with admin_session(client, admin_id):
+        client.post(f"/admin/users/{newbie_id}/delete")
+        assert db.get_counters() == {"users": 3, "answers": 0, "active_users": 0}
+        res = client.get("/admin")
+        assert res.status_code == 200
+        # ユーザー一覧の件数もカウンターを読むだけで、user_stats を数えない
+        queries = []
+        original = db.execute_query
+        db.execute_query = lambda q, *a, **k: queries.append(q) or original(q, *a, **k)
+        try:
+            assert client.get("/admin/users").status_code == 200
+        finally:
+            del db.execute_query
+        assert not any("total_answers > 0" in q for q in queries)
+
+
+def test_ranking_reflects_answers_immediately(app_client):
+    app, client = app_client
+    db = app.db_manager
+    db.execute_query("DELETE FROM user_answers")
+    db.rebuild_user_stats()
+
+    login_user(client, "user1", "user1pass")
+    res = client.get("/ranking")
+    assert res.status_code == 200
+    assert "ランク外" not in res.get_data(as_text=True)
+
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    client.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+    # 同期間隔に関係なく、自分のワーカーでの解答はすぐに順位へ反映される
+    user1_id = db.execute_query("SELECT id FROM users WHERE username = ?", ("user1",))[0]["id"]
+    assert app.leaderboard.rank(user1_id) == 1
+    res = client.get("/ranking")
+    assert res.status_code == 200
+    assert "#1" in res.get_data(as_text=True)
+
+
+def test_ranking_by_period_and_genre(app_client):
+    app, client = app_client
+    db = app.db_manager
+    db.execute_query("DELETE FROM user_answers")
+    db.execute_query("DELETE FROM user_daily_stats")
+
+    login_user(client, "user1", "user1pass")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+    client.post(f"/questions/{question_id}/answer", json={"answer": "A"})
+
+    for query in ("period=week", "period=month&genre=ネットワーク", "genre=ネットワーク"):
+        res = client.get(f"/ranking?{query}")
+        assert res.status_code == 200
+        assert "#1" in res.get_data(as_text=True)
+    res = client.get("/ranking?period=week&genre=データベース")
+    assert res.status_code == 200
+    assert "#1" not in res.get_data(as_text=True)
+
+
 def test_main_pages_status(app_client):
     app, client = app_client
 
@@ -148,6 +567,44 @@ def test_main_pages_status(app_client):
         assert res.status_code == 200
 
 
+def test_mock_exam_submit_uses_session_question_ids(app_client):
+    app, client = app_client
+    db = app.db_manager
+    choices = json.dumps({"ア": "a", "イ": "b"})
+    for i in range(1, 4):
+        db.execute_query(
+            "INSERT INTO questions (question_id, question_text, choices, correct_answer, genre) VALUES (?, ?, ?, ?, ?)",
+            (f"2031_s_q{i}", f"問題{i}", choices, "ア", "ネットワーク"),
+        )
+
+    login_user(client, "user1", "user1pass")
+    assert client.get("/mock_exam/2031_spring").status_code == 200
+    with client.session_transaction() as sess:
+        exam_session_id = sess["exam_session_id"]
+        assert len(sess["exam_question_ids"]) == 3
+
+    # 問題はプロセス内メモリではなくセッションのIDから引き直される（別ワーカーでも採点できる）
+    res = client.post(
+        "/mock_exam/submit",
+        json={"exam_session_id": exam_session_id, "answers": {"0": "ア", "1": "イ"}},
+    )
+    assert res.status_code == 200
+    result = res.get_json()
+    assert (result["correct_count"], result["total_count"]) == (1, 3)
+    assert [d["question_id"] for d in result["details"]] == ["2031_s_q1", "2031_s_q2", "2031_s_q3"]
+
+    # 同じ試験セッションは2回採点できない
+    res = client.post("/mock_exam/submit", json={"exam_session_id": exam_session_id, "answers": {}})
+    assert res.status_code == 400
+
+    # 上限を超える試験は上限の問題数だけを出題し、その旨を表示する
+    app.config["EXAM_MAX_QUESTIONS"] = 2
+    body = client.get("/mock_exam/2031_spring").get_data(as_text=True)
+    assert "先頭の2問だけを出題します" in body
+    with client.session_transaction() as sess:
+        assert len(sess["exam_question_ids"]) == 2
+
+
 def test_mysql_random_sql_generation():
     from tests.test_question_manager import DummyDB
     from app.core.question_manager import QuestionManager
@@ -169,3 +626,142 @@ def test_mysql_random_sql_generation():
     qm = QuestionManager(db)
     qm.get_random_question()
     assert "RAND()" in db.captured_query
+
+
+def upload_and_wait(app, client, data):
+    """アップロードして取り込みジョブの完了を待ち、ジョブの進捗JSONを返す"""
+    from urllib.parse import parse_qs, urlparse
+
+    with admin_session(client, None):
+        res = client.post(
+            "/admin/upload/questions",
+            data=data,
+            content_type="multipart/form-data",
+        )
+        assert res.status_code == 302
+        job_id = parse_qs(urlparse(res.headers["Location"]).query)["job"][0]
+        app.import_jobs.wait(job_id, timeout=30)
+        res = client.get(f"/admin/upload/jobs/{job_id}")
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def test_upload_json_streams_in_chunks(app_client):
+    import io
+
+    app, client = app_client
+    db = app.db_manager
+    app.config["IMPORT_CHUNK_SIZE"] = 2
+
+    questions = [
+        {
+            "question_id": f"2030_s_q{i}",
+            "question_text": f"問題{i}",
+            "choices": {"ア": "a", "イ": "b"},
+            "correct_answer": "ア",
+            "genre": "テスト",
+        }
+        for i in range(1, 6)
+    ]
+    questions.append({"question_id": "broken"})
+    payload = json.dumps(questions, ensure_ascii=False).encode("utf-8")
+
+    job = upload_and_wait(app, client, {"file": (io.BytesIO(payload), "2030_s.json")})
+
+    assert job["state"] == "succeeded"
+    assert job["rows_processed"] == 6
+    assert job["saved_count"] == 5
+    assert job["exam_key"] == "2030_spring"
+    rows = db.execute_query("SELECT COUNT(*) AS count FROM questions WHERE genre = ?", ("テスト",))
+    assert rows[0]["count"] == 5
+
+
+def _make_zip(members):
+    import io
+    import zipfile
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_upload_zip_imports_questions_and_images(app_client, tmp_path):
+    app, client = app_client
+    app.config["PROTECTED_IMAGES_DIR"] = str(tmp_path / "protected")
+
+    questions = [{
+        "question_id": "2031_s_q1",
+        "question_text": "ZIP問題",
+        "choices": {"ア": "a", "イ": "b"},
+        "correct_answer": "イ",
+        "image_url": "2031_s_q1.png",
+    }]
+    archive = _make_zip({
+        "exam/2031_s.json": json.dumps(questions, ensure_ascii=False),
+        "exam/images/2031_s_q1.png": b"\x89PNG dummy",
+    })
+
+    job = upload_and_wait(app, client, {"file": (archive, "2031_s.zip")})
+
+    assert job["state"] == "succeeded"
+    assert job["saved_count"] == 1
+    assert job["images_count"] == 1
+    assert (tmp_path / "protected" / "questions" / "2031_s_q1.png").read_bytes() == b"\x89PNG dummy"
+    assert app.db_manager.execute_query(
+        "SELECT id FROM questions WHERE question_id = ?", ("2031_s_q1",)
+    )
+
+
+def test_upload_zip_rejects_too_many_entries(app_client, tmp_path):
+    app, client = app_client
+    app.config["PROTECTED_IMAGES_DIR"] = str(tmp_path / "protected")
+    app.config["ZIP_MAX_ENTRIES"] = 2
+
+    archive = _make_zip({f"q{i}.json": "[]" for i in range(3)})
+
+    job = upload_and_wait(app, client, {"file": (archive, "many.zip")})
+
+    assert job["state"] == "failed"
+    assert "ファイル数が多すぎます" in job["errors"][0]
+
+
+def test_reupload_only_writes_changed_questions(app_client):
+    import io
+
+    app, client = app_client
+    db = app.db_manager
+
+    questions = [
+        {
+            "question_id": f"2032_s_q{i}",
+            "question_text": f"問題{i}",
+            "choices": {"ア": "a", "イ": "b"},
+            "correct_answer": "ア",
+        }
+        for i in range(1, 4)
+    ]
+
+    def upload(payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return upload_and_wait(app, client, {"file": (io.BytesIO(data), "2032_s.json")})
+
+    job = upload(questions)
+    assert (job["saved_count"], job["unchanged_count"]) == (3, 0)
+    version = db.get_catalog_version()
+
+    # 同じ内容の再アップロードは書き込みもバージョン更新も発生しない
+    job = upload(questions)
+    assert (job["saved_count"], job["unchanged_count"]) == (0, 3)
+    assert db.get_catalog_version() == version
+
+    # 修正された問題と新規問題のみが書き込まれる
+    questions[1]["correct_answer"] = "イ"
+    questions.append(dict(questions[0], question_id="2032_s_q4"))
+    job = upload(questions)
+    assert (job["saved_count"], job["unchanged_count"]) == (2, 2)
+    assert db.get_catalog_version() == version + 1
+    row = db.execute_query("SELECT correct_answer FROM questions WHERE question_id = ?", ("2032_s_q2",))
+    assert row[0]["correct_answer"] == "イ"
@@ -0,0 +1,19 @@
+from app.services import genre_stats
+
+
+def test_summarize_totals_and_weak_areas():
+    genres = [{"name": "ネットワーク", "count": 10}, {"name": "データベース", "count": 5}, {"name": "セキュリティ", "count": 3}]
+    rows = [
+        {"genre": "ネットワーク", "attempts": 10, "correct_answers": 3},
+        {"genre": "データベース", "attempts": 4, "correct_answers": 0},  # 解答数が少ないので苦手とは判定しない
+        {"genre": "", "attempts": 2, "correct_answers": 2},  # ジャンル未設定の問題も全体の集計には含める
+    ]
+
+    progress = genre_stats.summarize(rows, genres)
+
+    assert (progress["total_answers"], progress["correct_answers"], progress["accuracy_rate"]) == (16, 5, 31.2)
+    by_name = {g["name"]: g for g in progress["genres"]}
+    assert by_name["ネットワーク"]["accuracy_rate"] == 30.0 and by_name["ネットワーク"]["is_weak"]
+    assert not by_name["データベース"]["is_weak"]
+    assert by_name["セキュリティ"]["attempts"] == 0
+    assert [g["name"] for g in progress["weak_areas"]] == ["ネットワーク"]
@@ -0,0 +1,131 @@
+import threading
+
+from flask import Flask
+
+from app.core.database import DatabaseManager
+from app.services.import_jobs import ImportJobManager
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def make_manager(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "jobs.db"))
+    db.init_database()
+    return ImportJobManager(db, max_workers=2, poll_interval=0.01)
+
+
+def test_job_records_progress_and_result(tmp_path):
+    jobs = make_manager(tmp_path)
+
+    def task(progress):
+        progress(10, 8)
+        return {"success": True, "rows": 20, "count": 18, "errors": ["問題 3: 不正"]}
+
+    job_id = jobs.submit(Flask(__name__), "2024_s.json", "2024_spring", task)
+    job = jobs.wait(job_id, timeout=10)
+
+    assert job["state"] == "succeeded"
+    assert job["finished"] is True
+    assert (job["rows_processed"], job["saved_count"]) == (20, 18)
+    assert job["errors"] == ["問題 3: 不正"]
+    assert job["elapsed_seconds"] is not None
+
+
+def test_failed_task_is_reported(tmp_path):
+    jobs = make_manager(tmp_path)
+
+    def task(progress):
+        raise RuntimeError("boom")
+
+    job_id = jobs.submit(Flask(__name__), "broken.json", "broken.json", task)
+    job = jobs.wait(job_id, timeout=10)
+
+    assert job["state"] == "failed"
+    assert job["errors"] == ["boom"]
+
+
+def test_same_exam_imports_are_serialized(tmp_path):
+    jobs = make_manager(tmp_path)
+    app = Flask(__name__)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_task(progress):
+        started.set()
+        release.wait(10)
+        return {"success": True}
+
+    first = jobs.submit(app, "a.json", "2024_spring", slow_task)
+    assert started.wait(10)
+    second = jobs.submit(app, "b.json", "2024_spring", lambda progress: {"success": True})
+    other = jobs.submit(app, "c.json", "2025_spring", lambda progress: {"success": True})
+
+    # 別の試験は待たされず、同じ試験は先行ジョブの完了まで待機する
+    assert jobs.wait(other, timeout=10)["state"] == "succeeded"
+    assert jobs.get(second)["state"] == "queued"
+
+    release.set()
+    assert jobs.wait(first, timeout=10)["state"] == "succeeded"
+    assert jobs.wait(second, timeout=10)["state"] == "succeeded"
+
+
+def test_jobs_of_stopped_workers_are_recovered(tmp_path):
+    jobs = make_manager(tmp_path)
+    db = jobs.db_manager
+    # 停止したワーカーが残したジョブ（生存確認が古い）と、稼働中のワーカーのジョブ
+    db.execute_query(
+        "INSERT INTO import_jobs (id, filename, exam_key, state, created_at, started_at, owner, heartbeat_at) VALUES "
+        "('dead_running', 'a.json', '2024_spring', 'running', '2026-01-01 00:00:00', '2026-01-01 00:00:00', 'gone', '2026-01-01 00:00:00'), "
+        "('dead_queued', 'b.json', '2024_spring', 'queued', '2026-01-01 00:00:00', NULL, 'gone', '2026-01-01 00:00:00')"
+    )
+    assert jobs.recover_abandoned() == 2
+    assert jobs.get("dead_running")["state"] == "failed"
+    assert "ワーカーが停止" in jobs.get("dead_queued")["errors"][0]
+
+    # 回収後は同じ試験の取り込みがすぐに実行される
+    job_id = jobs.submit(Flask(__name__), "c.json", "2024_spring", lambda progress: {"success": True})
+    assert jobs.wait(job_id, timeout=10)["state"] == "succeeded"
+
+
+def test_running_job_without_heartbeat_does_not_block(tmp_path):
+    jobs = make_manager(tmp_path)
+    jobs.db_manager.execute_query(
+        "INSERT INTO import_jobs (id, filename, exam_key, state, created_at, started_at, owner, heartbeat_at) VALUES "
+        "('stale', 'a.json', '2024_spring', 'running', '2026-01-01 00:00:00', datetime('now', 'localtime'), 'gone', "
+        "'2026-01-01 00:00:00')"
+    )
+    jobs.db_manager.execute_query(
+        "INSERT INTO import_jobs (id, filename, exam_key, state, created_at) VALUES "
+        "('next', 'b.json', '2024_spring', 'queued', '2026-01-01 00:00:00')"
+    )
+    assert jobs._try_acquire("next", "2024_spring") is True
+
+
+def test_concurrent_claims_for_same_exam_run_one_job(tmp_path):
+    jobs = make_manager(tmp_path)
+    for job_id in ("a", "b", "c", "d"):
+        jobs.db_manager.execute_query(
+            "INSERT INTO import_jobs (id, filename, exam_key, state, created_at) VALUES "
+            "(?, 'x.json', '2024_spring', 'queued', '2026-01-01 00:00:00')",
+            (job_id,),
+        )
+    barrier = threading.Barrier(4)
+    results = {}
+
+    def claim(job_id):
+        barrier.wait()
+        results[job_id] = jobs._try_acquire(job_id, "2024_spring")
+
+    threads = [threading.Thread(target=claim, args=(job_id,)) for job_id in ("a", "b", "c", "d")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(results.values()) == 1
+    assert jobs.db_manager.execute_query("SELECT exam_key FROM import_job_locks") == [{"exam_key": "2024_spring"}]
@@ -0,0 +1,78 @@
+import pytest
+
+from app.core.database import DatabaseManager
+from app.services import irt
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def test_calibrate_requires_numpy(monkeypatch):
+    monkeypatch.setattr(irt, "_numpy", False)
+    with pytest.raises(RuntimeError, match="NumPy"):
+        irt.calibrate(None)
+
+
+def test_build_responses_keeps_first_attempt():
+    pytest.importorskip("numpy")
+    responses = irt.build_responses([7, 7, 3, 7], [10, 10, 10, 20], [0, 1, 1, 1])
+
+    assert list(responses.user_ids) == [3, 7] and list(responses.question_ids) == [10, 20]
+    first = sorted(zip(responses.users.tolist(), responses.items.tolist(), responses.correct.tolist()))
+    assert first == [(0, 0, 1.0), (1, 0, 0.0), (1, 1, 1.0)]
+
+
+@pytest.mark.parametrize("model", irt.MODELS)
+def test_fit_recovers_simulated_parameters(model):
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(1)
+    theta = rng.normal(size=2000)
+    b = rng.normal(size=60)
+    a = rng.lognormal(0.0, 0.3, size=60) if model == "2pl" else np.ones(60)
+    users = np.repeat(np.arange(2000), 60)
+    items = np.tile(np.arange(60), 2000)
+    correct = rng.random(len(users)) < 1.0 / (1.0 + np.exp(-a[items] * (theta[users] - b[items])))
+
+    result = irt.fit(irt.build_responses(users, items, correct), model=model)
+
+    assert result["converged"]
+    assert np.corrcoef(result["difficulty"], b)[0, 1] > 0.98
+    assert np.corrcoef(result["ability"], theta)[0, 1] > 0.9
+    if model == "2pl":
+        assert np.corrcoef(result["discrimination"], a)[0, 1] > 0.8
+    else:
+        assert np.all(result["discrimination"] == 1.0)
+
+
+def test_calibrate_stores_parameters(tmp_path):
+    pytest.importorskip("numpy")
+    db = DatabaseManager(SQLiteConfig(tmp_path / "irt.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x'), ('b', 'x'), ('c', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES "
+        + ", ".join(f"('Q{i}', 'q', '{{}}', 'ア')" for i in range(6))
+    )
+    # ユーザー1は全問正解、ユーザー2は半分、ユーザー3は1問だけ解答
+    for user_id, question_id, is_correct in (
+        [(1, q, 1) for q in range(1, 7)] + [(2, q, q % 2) for q in range(1, 7)] + [(3, 1, 0)]
+    ):
+        db.execute_query(
+            "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) "
+            "VALUES (?, ?, 'ア', ?, '2026-01-01 10:00:00')",
+            (user_id, question_id, is_correct),
+        )
+
+    result = irt.calibrate(db, model="1pl", min_responses=2)
+
+    assert (result["responses"], result["questions"], result["users"]) == (13, 6, 2)
+    abilities = {row["user_id"]: row["ability"] for row in db.execute_query("SELECT user_id, ability FROM user_ability")}
+    assert abilities[1] > abilities[2]
+    items = {row["question_id"]: row for row in db.execute_query("SELECT * FROM question_irt")}
+    # 全員が正解した問題は、半分が間違えた問題より易しい
+    assert items[3]["difficulty"] < items[2]["difficulty"]
+    assert items[1]["model"] == "1pl" and items[1]["discrimination"] == 1.0
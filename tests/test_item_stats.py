@@ -0,0 +1,94 @@
+import threading
+import time
+
+from app.services.item_stats import MIN_ATTEMPTS, ItemStats, summarize
+
+
+class FakeDB:
+    def __init__(self, stats):
+        self.stats = stats
+        self.loads = []
+        self.changed = set()
+
+    def get_item_stats(self, since=None):
+        self.loads.append(since)
+        ids = self.stats if since is None else self.changed
+        return {question_id: dict(self.stats[question_id], choices=dict(self.stats[question_id]["choices"]))
+                for question_id in ids}
+
+
+def test_summarize_reports_rates_and_most_chosen():
+    assert summarize(MIN_ATTEMPTS - 1, 0, {}) is None
+    stats = summarize(8, 3, {"ア": 3, "ウ": 4, "エ": 1})
+    assert stats["accuracy_rate"] == 37.5
+    assert stats["choice_rates"] == {"ア": 37.5, "ウ": 50.0, "エ": 12.5}
+    assert stats["most_chosen"] == "ウ"
+    # 同数なら先の選択肢
+    assert summarize(6, 3, {"イ": 3, "ア": 3})["most_chosen"] == "ア"
+
+
+def test_item_stats_records_locally_and_reloads():
+    db = FakeDB({1: {"attempts": 4, "correct_answers": 1, "choices": {"ア": 1, "イ": 3}}})
+    item_stats = ItemStats(reload_interval=3600, background=False)
+
+    # 読み込み前の記録は捨てる（読み込み時にDBの値に含まれる）
+    item_stats.record(1, "ア", True)
+    assert item_stats.get(db, 1) is None
+    item_stats.record(1, "ア", True)
+    stats = item_stats.get(db, 1)
+    assert stats["attempts"] == 5 and stats["choice_rates"] == {"ア": 40.0, "イ": 60.0}
+    assert db.loads == [None]
+
+    db.stats[1]["attempts"] = 10
+    item_stats.reset()
+    assert item_stats.get(db, 1)["attempts"] == 10
+    assert db.loads == [None, None]
+
+
+def test_item_stats_reloads_only_changed_questions():
+    db = FakeDB({
+        1: {"attempts": 5, "correct_answers": 1, "choices": {"ア": 5}},
+        2: {"attempts": 5, "correct_answers": 5, "choices": {"イ": 5}},
+    })
+    item_stats = ItemStats(reload_interval=0, background=False)
+    assert item_stats.get(db, 1)["attempts"] == 5
+
+    # 他のワーカーで問題2にだけ解答があった
+    db.stats[2] = {"attempts": 6, "correct_answers": 5, "choices": {"イ": 5, "ア": 1}}
+    db.changed = {2}
+    assert item_stats.get(db, 2)["attempts"] == 6
+    assert item_stats.get(db, 1)["attempts"] == 5
+    # 2回目以降は前回の読み込みの開始時刻（より少し前）以降に更新された問題だけを読む
+    assert db.loads[0] is None and all(since is not None for since in db.loads[1:])
+    assert db.loads[2] > db.loads[1]
+
+
+def test_item_stats_reloads_in_background_one_at_a_time():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowDB(FakeDB):
+        calls = 0
+
+        def get_item_stats(self, since=None):
+            self.calls += 1
+            started.set()
+            release.wait(5)
+            return super().get_item_stats(since)
+
+    db = SlowDB({1: {"attempts": 5, "correct_answers": 5, "choices": {"ア": 5}}})
+    item_stats = ItemStats(reload_interval=0)
+
+    # 読み込み中でもリクエストは待たず、読み直しも重ねて始めない
+    assert item_stats.get(db, 1) is None
+    assert started.wait(5)
+    for _ in range(5):
+        assert item_stats.get(db, 1) is None
+    assert item_stats.refresh(db) is False
+    assert db.calls == 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while item_stats.get(db, 1) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert item_stats.get(db, 1)["attempts"] == 5
+
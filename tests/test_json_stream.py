@@ -0,0 +1,36 @@
+import io
+import json
+
+import pytest
+
+from app.utils.json_stream import iter_json_array, iter_chunks, NotJSONArrayError
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 64])
+def test_iter_json_array_matches_json_load(read_size):
+    doc = json.dumps([
+        {"question_id": "Q1", "question_text": "テスト", "choices": {"ア": "1", "イ": "2"}},
+        12345,
+        "文字列",
+        [1, [2, 3]],
+        None,
+    ], ensure_ascii=False)
+
+    items = list(iter_json_array(io.StringIO("\ufeff" + doc + "\n"), read_size=read_size))
+
+    assert items == json.loads(doc)
+
+
+def test_iter_json_array_rejects_non_array():
+    with pytest.raises(NotJSONArrayError):
+        list(iter_json_array(io.StringIO('{"a": 1}')))
+
+
+@pytest.mark.parametrize("doc", ["[1,]", "[1 2]", "[{\"a\": 1}", ""])
+def test_iter_json_array_rejects_broken_json(doc):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(io.StringIO(doc), read_size=2))
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
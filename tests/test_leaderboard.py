@@ -0,0 +1,106 @@
+import random
+from datetime import datetime
+
+from app.core.database import DatabaseManager
+from app.services.leaderboard import IndexableSkipList, Leaderboard
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def test_skiplist_rank_and_index_match_sorted_list():
+    rng = random.Random(42)
+    skiplist = IndexableSkipList()
+    expected = []
+    for _ in range(500):
+        key = (rng.randint(0, 50), rng.random())
+        if expected and rng.random() < 0.3:
+            victim = expected.pop(rng.randrange(len(expected)))
+            skiplist.remove(victim)
+        else:
+            expected.append(key)
+            skiplist.insert(key)
+    expected.sort()
+
+    assert len(skiplist) == len(expected)
+    assert list(skiplist) == expected
+    assert skiplist.first(10) == expected[:10]
+    for index in rng.sample(range(len(expected)), 50):
+        assert skiplist[index] == expected[index]
+        assert skiplist.count_less(expected[index]) == index
+
+
+def row(user_id, accuracy, total, last="2024-01-01 10:00:00"):
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "total_answers": total,
+        "correct_answers": round(total * accuracy / 100),
+        "accuracy_rate": accuracy,
+        "last_answered_at": last,
+    }
+
+
+def test_leaderboard_orders_and_ranks_ties_together():
+    board = Leaderboard()
+    board.update(row(1, 50.0, 10))
+    board.update(row(2, 80.0, 5))
+    board.update(row(3, 80.0, 10))
+    board.update(row(4, 50.0, 10))  # user1 と同点
+
+    assert [entry["id"] for entry in board.top(3)] == [3, 2, 1]
+    # 一覧の順位も rank と同じく同点は同じ順位
+    assert [entry["rank"] for entry in board.top(4)] == [1, 2, 3, 3]
+    assert board.rank(3) == 1
+    assert board.rank(1) == board.rank(4) == 3
+
+    # 統計が変わると並び直し、解答数0になると対象外
+    board.update(row(1, 90.0, 11, "2024-01-02 09:00:00"))
+    assert board.rank(1) == 1
+    assert board.rank(4) == 4
+    board.update(row(2, 0.0, 0, None))
+    assert board.rank(2) is None
+    assert len(board) == 3
+
+
+def test_leaderboard_sync_picks_up_other_workers_and_deletes(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "board.db"))
+    db.init_database()
+    for name in ("alice", "bob"):
+        db.execute_query("INSERT INTO users (username, password_hash) VALUES (?, ?)", (name, "x"))
+    alice, bob = (r["id"] for r in db.execute_query("SELECT id FROM users ORDER BY username"))
+    db.execute_query("INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES ('Q1', 'q', '{}', 'A')")
+    question_id = db.execute_query("SELECT id FROM questions")[0]["id"]
+
+    def answer(user_id, is_correct):
+        answered_at = datetime.now()
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (?, ?, 'A', ?, ?)",
+                (user_id, question_id, is_correct, answered_at),
+            )
+            db.record_user_answer(user_id, is_correct, answered_at, tx=tx)
+
+    answer(alice, 1)
+    board = Leaderboard(sync_interval=0)
+    board.sync(db)
+    assert [entry["username"] for entry in board.top(10)] == ["alice"]
+
+    # 別のワーカーでの解答（このリーダーボードには refresh_user されていない）
+    answer(bob, 1)
+    answer(bob, 1)
+    board.sync(db)
+    assert [entry["username"] for entry in board.top(10)] == ["bob", "alice"]
+
+    # 削除は leaderboard_epoch で全件の読み直しになる
+    with db.transaction() as tx:
+        tx.execute("DELETE FROM user_stats WHERE user_id = ?", (bob,))
+        tx.execute("DELETE FROM users WHERE id = ?", (bob,))
+        db.increment_meta("leaderboard_epoch", 1, tx=tx)
+    board.sync(db)
+    assert [entry["username"] for entry in board.top(10)] == ["alice"]
+    assert board.rank(bob) is None
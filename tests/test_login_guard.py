@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from app.core.database import DatabaseManager
+from app.core.passwords import canonical_method, hash_password, needs_rehash, rehash_if_needed
+from app.services import login_guard as login_guard_module
+from app.services.login_guard import DatabaseBucketStore, LoginBusy, LoginGuard, MemoryBucketStore
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def make_store(kind, tmp_path):
+    if kind == "memory":
+        return MemoryBucketStore()
+    db = DatabaseManager(SQLiteConfig(tmp_path / "buckets.db"))
+    db.init_database()
+    return DatabaseBucketStore(db)
+
+
+@pytest.mark.parametrize("kind", ["memory", "database"])
+def test_token_bucket_allows_burst_then_refills(kind, tmp_path):
+    store = make_store(kind, tmp_path)
+
+    # 容量3・毎秒0.5トークン
+    assert [store.take("k", 3, 0.5, 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("k", 3, 0.5, 100.0) == pytest.approx(2.0)
+
+    # 2秒で1トークン補充される。別のキーには影響しない
+    assert store.take("k", 3, 0.5, 102.0) == 0.0
+    assert store.take("k", 3, 0.5, 102.0) > 0
+    assert store.take("other", 3, 0.5, 102.0) == 0.0
+
+
+def test_memory_store_evicts_least_recent_keys():
+    store = MemoryBucketStore(max_keys=2)
+    store.take("a", 1, 1.0, 0.0)
+    store.take("b", 1, 1.0, 0.0)
+    store.take("c", 1, 1.0, 0.0)
+
+    # 最も古い a は捨てられて満タンから数え直す
+    assert store.take("a", 1, 1.0, 0.0) == 0.0
+    assert store.take("c", 1, 1.0, 0.0) > 0
+
+
+def test_check_rate_limits_by_ip_and_username():
+    guard = LoginGuard(MemoryBucketStore(), ip_burst=3, ip_per_minute=1, user_burst=2, user_per_minute=1)
+
+    assert guard.check_rate("10.0.0.1", "Alice") == 0
+    assert guard.check_rate("10.0.0.2", "alice") == 0
+    # ユーザー名ごとの上限（大文字小文字は区別しない）
+    assert guard.check_rate("10.0.0.3", "ALICE") > 0
+    # IPアドレスごとの上限
+    assert guard.check_rate("10.0.0.1", "bob") == 0
+    assert guard.check_rate("10.0.0.1", "carol") == 0
+    assert guard.check_rate("10.0.0.1", "dave") > 0
+
+
+def test_verify_password_rejects_when_queue_is_full(monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_check(password_hash, password):
+        started.set()
+        release.wait(5)
+        return password == "ok"
+
+    monkeypatch.setattr(login_guard_module, "check_password_hash", slow_check)
+    guard = LoginGuard(MemoryBucketStore(), verify_workers=1, verify_queue=1, verify_timeout=5)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(guard.verify_password("h", "ok"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+
+    # 実行中1 + 待機1で一杯なので、3件目は検証せずにすぐ拒否される
+    with pytest.raises(LoginBusy):
+        guard.verify_password("h", "ok")
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True, True]
+    assert guard.verify_password("h", "ng") is False
+
+
+def test_needs_rehash_compares_method_and_cost():
+    stored = hash_password("secret", "pbkdf2:sha256:1000")
+
+    assert canonical_method("pbkdf2:sha256:1000") == "pbkdf2:sha256:1000"
+    assert not needs_rehash(stored, "pbkdf2:sha256:1000")
+    assert needs_rehash(stored, "pbkdf2:sha256:2000")
+    assert needs_rehash(stored, "scrypt:1024:8:1")
+    assert rehash_if_needed(stored, "secret", "pbkdf2:sha256:1000") is None
+
+    upgraded = rehash_if_needed(stored, "secret", "pbkdf2:sha256:2000")
+    assert upgraded.startswith("pbkdf2:sha256:2000$")
+
+
+def test_run_uses_bounded_executor():
+    guard = LoginGuard(MemoryBucketStore(), verify_workers=1, verify_queue=0)
+    assert guard.run(pow, 2, 10) == 1024
@@ -36,3 +36,43 @@ def test_random_query_uses_random_for_sqlite():
 
     assert "RANDOM()" in db.captured_query
     assert "RAND()" not in db.captured_query
+
+
+class SummaryDB(DummyDB):
+    def __init__(self):
+        super().__init__(db_type="sqlite")
+        self.version = 1
+        self.queries = []
+
+    def get_catalog_version(self):
+        self.queries.append("version")
+        return self.version
+
+    def execute_query(self, query, params=None):
+        self.queries.append(query)
+        return [{"genre": "ネットワーク", "count": 2}, {"genre": "データベース", "count": 3}, {"genre": None, "count": 1}]
+
+
+def test_question_summary_is_cached_until_catalog_version_changes():
+    db = SummaryDB()
+    qm = QuestionManager(db)
+    qm.catalog_check_interval = 3600
+
+    summary = qm.get_question_summary()
+    assert summary["total_questions"] == 6
+    assert [g["name"] for g in summary["genres"]] == ["データベース", "ネットワーク"]
+    assert len(db.queries) == 2
+
+    # 確認間隔内はDBを読まない
+    qm.get_question_summary()
+    assert len(db.queries) == 2
+
+    # バージョンが同じなら集計し直さない
+    qm.invalidate_catalog()
+    qm.get_question_summary()
+    assert db.queries[2:] == ["version"]
+
+    db.version = 2
+    qm.invalidate_catalog()
+    qm.get_question_summary()
+    assert len(db.queries) == 5
@@ -0,0 +1,87 @@
+import pathlib
+import subprocess
+import sys
+
+from app.core.database import DatabaseManager
+from app.core.question_manager import QuestionManager
+from app.services.question_pipeline import QuestionImportPipeline, _mp_context, prepare_chunk
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+def make_question_manager(tmp_path, name="pipeline.db"):
+    db = DatabaseManager(SQLiteConfig(tmp_path / name))
+    db.init_database()
+    return QuestionManager(db)
+
+
+def make_questions(n):
+    return [
+        {
+            "question_id": f"2033_s_q{i}",
+            "question_text": f"問題{i} images/questions/q{i}.png",
+            "choices": {"ア": f"選択肢{i}", "イ": "q.png"},
+            "correct_answer": "ア",
+        }
+        for i in range(n)
+    ]
+
+
+def test_prepare_chunk_reports_invalid_rows():
+    items = make_questions(2) + [{"question_id": "broken"}]
+
+    rows, hashes, errors = prepare_chunk(items, start_index=10)
+
+    assert [row[0] for row in rows] == ["2033_s_q0", "2033_s_q1"]
+    assert hashes == [QuestionManager.question_content_hash(row) for row in rows]
+    assert errors == ["問題 13: 必須フィールドが不足しています"]
+
+
+def test_prepare_chunk_normalizes_like_question_manager():
+    items = make_questions(1)
+
+    rows, _, _ = prepare_chunk(items, normalize=True)
+
+    assert rows == [QuestionManager(None)._build_question_row(items[0], 0)]
+    assert rows[0][1] == "問題0"
+
+
+def test_process_pool_matches_single_process(tmp_path):
+    questions = make_questions(25)
+
+    single = make_question_manager(tmp_path, "single.db")
+    parallel = make_question_manager(tmp_path, "parallel.db")
+
+    r1 = QuestionImportPipeline(single, processes=1, chunk_size=4).run(iter(questions), normalize=True)
+    progress = []
+    r2 = QuestionImportPipeline(parallel, processes=2, chunk_size=4).run(
+        iter(questions), normalize=True, progress_callback=lambda rows, count: progress.append(rows)
+    )
+
+    assert r1 == r2
+    assert r2["inserted"] == 25
+    assert progress == [4, 8, 12, 16, 20, 24, 25]
+
+    query = "SELECT question_id, question_text, choices, content_hash FROM questions ORDER BY id"
+    assert single.db_manager.execute_query(query) == parallel.db_manager.execute_query(query)
+
+
+def test_worker_processes_are_not_forked():
+    # 取り込みジョブのスレッドから fork するとロックや DB 接続を引き継ぐ
+    assert _mp_context().get_start_method() in ("forkserver", "spawn")
+
+
+def test_worker_module_imports_no_app_state():
+    # ワーカープロセスは Flask・DB・スレッドを持つモジュールを読み込まない
+    code = (
+        "import sys, app.services.import_worker; "
+        "print([m for m in ('flask', 'threading', 'app.core.question_manager', 'app.core.database') if m in sys.modules])"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=pathlib.Path(__file__).resolve().parents[1]).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,116 @@
+import threading
+from datetime import datetime, timedelta
+
+from app.core.database import DatabaseManager
+from app.services import spaced_repetition
+from app.services.spaced_repetition import schedule
+
+
+class SQLiteConfig:
+    DATABASE_TYPE = "sqlite"
+
+    def __init__(self, path):
+        self.DATABASE = str(path)
+
+
+NOW = datetime(2026, 1, 1, 9, 0, 0)
+
+
+def test_schedule_follows_sm2_intervals():
+    state = schedule(None, False, NOW)
+    assert state["repetitions"] == 0
+    assert state["due_at"] == "2026-01-01 09:10:00"
+
+    intervals = []
+    for _ in range(3):
+        state = schedule(state, True, NOW)
+        intervals.append(state["interval_days"])
+    assert intervals[:2] == [1.0, 6.0]
+    assert intervals[2] == round(6.0 * state["ease_factor"], 1)
+
+    # 間違えると最初からやり直し、易しさ係数は下がる（下限あり）
+    lapsed = schedule(state, False, NOW)
+    assert (lapsed["repetitions"], lapsed["interval_days"]) == (0, 0.0)
+    assert lapsed["ease_factor"] < state["ease_factor"]
+    for _ in range(10):
+        lapsed = schedule(lapsed, False, NOW)
+    assert lapsed["ease_factor"] == spaced_repetition.EASE_MIN
+
+
+def test_review_items_follow_answers_and_rebuild(tmp_path):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "review.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES "
+        "('Q1', 'q', '{}', 'ア'), ('Q2', 'q', '{}', 'ア')"
+    )
+    answers = [(1, 1, NOW), (2, 0, NOW + timedelta(minutes=1)), (2, 1, NOW + timedelta(minutes=20))]
+    for question_id, is_correct, answered_at in answers:
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (1, ?, 'ア', ?, ?)",
+                (question_id, is_correct, answered_at.strftime(spaced_repetition.DATETIME_FORMAT)),
+            )
+            spaced_repetition.record_answer(db, 1, question_id, bool(is_correct), answered_at, tx=tx)
+
+    # 最初から正解した問題は復習対象にならない
+    assert db.get_review_item(1, 1) is None
+    item = db.get_review_item(1, 2)
+    assert (item["repetitions"], item["due_at"]) == (1, "2026-01-02 09:20:00")
+
+    query = "SELECT * FROM review_items ORDER BY user_id, question_id"
+    incremental = db.execute_query(query)
+    db.rebuild_review_items()
+    assert db.execute_query(query) == incremental
+
+    assert db.get_review_queue(1, "2026-01-02 09:00:00") == {
+        "next": None, "due_count": 0, "next_due_at": "2026-01-02 09:20:00"
+    }
+    queue = db.get_review_queue(1, "2026-01-03 00:00:00")
+    assert (queue["next"]["question_id"], queue["due_count"]) == (2, 1)
+
+    # 削除された問題の行が先頭にあっても、その次の期限の来た問題を出題する
+    db.execute_query(
+        "INSERT INTO review_items (user_id, question_id, due_at) VALUES (1, 99, '2026-01-01 00:00:00')"
+    )
+    queue = db.get_review_queue(1, "2026-01-03 00:00:00")
+    assert (queue["next"]["question_id"], queue["due_count"]) == (2, 1)
+
+
+def test_answer_saved_during_rebuild_is_not_lost(tmp_path, monkeypatch):
+    db = DatabaseManager(SQLiteConfig(tmp_path / "review.db"))
+    db.init_database()
+    db.execute_query("INSERT INTO users (username, password_hash) VALUES ('a', 'x')")
+    db.execute_query(
+        "INSERT INTO questions (question_id, question_text, choices, correct_answer) VALUES "
+        "('Q1', 'q', '{}', 'ア'), ('Q2', 'q', '{}', 'ア')"
+    )
+
+    def answer(question_id, answered_at):
+        with db.transaction() as tx:
+            tx.execute(
+                "INSERT INTO user_answers (user_id, question_id, user_answer, is_correct, answered_at) VALUES (1, ?, 'イ', 0, ?)",
+                (question_id, answered_at.strftime(spaced_repetition.DATETIME_FORMAT)),
+            )
+            spaced_repetition.record_answer(db, 1, question_id, False, answered_at, tx=tx)
+
+    answer(1, NOW)
+
+    # 再構築が回答履歴を読んでいる最中に別の解答が保存される
+    writer = []
+    parse = spaced_repetition._parse_datetime
+
+    def parse_and_answer(value):
+        if not writer:
+            writer.append(threading.Thread(target=answer, args=(2, NOW + timedelta(minutes=1))))
+            writer[0].start()
+            writer[0].join(0.2)
+        return parse(value)
+
+    monkeypatch.setattr(spaced_repetition, "_parse_datetime", parse_and_answer)
+    spaced_repetition.rebuild(db)
+    writer[0].join()
+
+    assert db.get_review_item(1, 1) is not None
+    assert db.get_review_item(1, 2) is not None
@@ -0,0 +1,112 @@
+import random
+from collections import Counter
+
+from app.services import coverage
+from app.services.weighted_sampler import AliasTable, WeakAreaSampler, question_factor
+
+
+def test_alias_table_matches_weights():
+    weights = [1, 2, 3, 0, 4]
+    table = AliasTable(weights)
+    rng = random.Random(1)
+    draws = Counter(table.sample(rng) for _ in range(100000))
+
+    assert draws[3] == 0
+    for index, weight in enumerate(weights):
+        assert abs(draws[index] / 100000 - weight / 10) < 0.01
+
+
+class FakeQuestionManager:
+    def __init__(self, ids, genres, version=1):
+        self.pool = {"version": version, "ids": tuple(ids), "genres": tuple(genres),
+                     "slots": tuple(range(len(ids)))}
+
+    def get_question_pool(self):
+        return self.pool
+
+
+class FakeDB:
+    def __init__(self, genre_rows=(), question_rows=(), coverage=b""):
+        self.genre_rows = list(genre_rows)
+        self.question_rows = list(question_rows)
+        self.coverage = coverage
+        self.loads = 0
+
+    def get_genre_stats(self, user_id):
+        self.loads += 1
+        return self.genre_rows
+
+    def get_question_stats(self, user_id):
+        return self.question_rows
+
+    def get_coverage(self, user_id):
+        return self.coverage
+
+
+def draw_counts(sampler, n, genre=None):
+    return Counter(sampler.draw(1, genre) for _ in range(n))
+
+
+def test_sampler_prefers_missed_questions_and_weak_genres():
+    random.seed(0)
+    db = FakeDB(
+        genre_rows=[{"genre": "ネットワーク", "attempts": 20, "correct_answers": 2},
+                    {"genre": "データベース", "attempts": 20, "correct_answers": 19}],
+        question_rows=[{"question_id": 1, "attempts": 4, "wrong_answers": 4},
+                       {"question_id": 2, "attempts": 4, "wrong_answers": 0}],
+        coverage=coverage.from_indexes([0, 1]),
+    )
+    qm = FakeQuestionManager([1, 2, 3, 4], ["ネットワーク", "ネットワーク", "データベース", "データベース"])
+    sampler = WeakAreaSampler(db, qm)
+
+    counts = draw_counts(sampler, 4000)
+    # 間違え続けている問題 > 正解し続けている問題、苦手なジャンル > 得意なジャンル
+    assert counts[1] > counts[2]
+    assert counts[1] + counts[2] > counts[3] + counts[4]
+    assert set(draw_counts(sampler, 200, "データベース")) == {3, 4}
+    assert db.loads == 1
+
+
+def test_sampler_updates_weights_incrementally_and_avoids_repeats():
+    random.seed(0)
+    db = FakeDB()
+    qm = FakeQuestionManager([1, 2], [None, None])
+    sampler = WeakAreaSampler(db, qm)
+
+    previous = None
+    for _ in range(50):
+        current = sampler.draw(1)
+        assert current != previous
+        previous = current
+
+    for _ in range(10):
+        sampler.record(1, 2, True)
+    weights = sampler._users[1].question_weights
+    assert weights[1] == question_factor(10, 0) < weights[0]
+    assert db.loads == 1
+
+    # 問題が更新されたら読み直す
+    qm.pool = {"version": 2, "ids": (1, 2, 3), "genres": (None, None, None)}
+    sampler.draw(1)
+    assert db.loads == 2
+
+
+def test_sampler_boosts_unattempted_questions():
+    random.seed(0)
+    # 問題1・2は解答済み（同じ成績）、問題3は未解答
+    db = FakeDB(
+        question_rows=[{"question_id": 1, "attempts": 1, "wrong_answers": 0},
+                       {"question_id": 2, "attempts": 1, "wrong_answers": 0}],
+        coverage=coverage.from_indexes([0, 1]),
+    )
+    qm = FakeQuestionManager([1, 2, 3], [None, None, None])
+    sampler = WeakAreaSampler(db, qm)
+
+    weights = sampler._weights(1)
+    assert weights.unseen == {2}
+    counts = draw_counts(sampler, 6000)
+    assert counts[3] > max(counts[1], counts[2])
+
+    # 解答すると未解答の扱いではなくなる
+    sampler.record(1, 3, True)
+    assert weights.unseen == set()
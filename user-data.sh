@@ -24,4 +24,7 @@ SECRET_KEY=$(openssl rand -hex 32)
 EOF
 
 # Dockerコンテナ起動
-docker compose -f docker-compose.yaml up -d
\ No newline at end of file
+docker compose -f docker-compose.yaml up -d
+
+# 初期問題データの読み込み・集計の再構築（デプロイ時に1度だけ）
+docker compose -f docker-compose.yaml run --rm app python app.py --maintenance
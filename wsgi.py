@@ -0,0 +1,67 @@
+"""
+本番用WSGIエントリポイント
+gunicorn から "wsgi:create_app()" として読み込む（設定は gunicorn.conf.py）
+
+ルートの app.py は app/ パッケージと名前が衝突して "app:app" では import できないため、
+ファイルパスから読み込む。
+"""
+
+import importlib.util
+import os
+import random
+import sys
+
+_APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def _load_app_module():
+    """ルートの app.py をモジュールとして読み込む"""
+    spec = importlib.util.spec_from_file_location('fe_master_app', _APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Flask はテンプレート等の基準ディレクトリを sys.modules のモジュールから決める
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_app():
+    """
+    本番用のアプリを生成する
+
+    preload_app ではマスタープロセスでフォーク前に1度だけ呼ばれるので、
+    問題カタログの読み込みもここで行い、全ワーカーで共有する。
+    カタログはスナップショットファイルのバージョンがDBと一致すれば mmap するだけで済む。
+    問題テーブルが空の新しいDBでは初期問題データをここで読み込む（問題があれば1行読むだけ）。
+    集計の再構築は起動処理から外し、python app.py --maintenance で行う。
+    """
+    module = _load_app_module()
+    application = module.create_app()
+    profile = application.startup_profile
+
+    with profile.phase('initial_questions'):
+        module.load_initial_questions(application)
+
+    if application.config.get('QUESTION_CATALOG'):
+        with profile.phase('catalog'):
+            catalog = application.question_manager.enable_catalog(
+                application.config.get('CATALOG_CHECK_INTERVAL'),
+                snapshot_path=application.config.get('CATALOG_SNAPSHOT_PATH') or None
+            )
+        application.logger.info(f"問題カタログを構築しました（{len(catalog)}問, version={catalog.version}）")
+
+    application.logger.info(f"起動処理 {profile.total * 1000:.0f}ms")
+    return application
+
+
+def reset_after_fork(application):
+    """
+    フォーク直後のワーカーでプロセス固有の状態を作り直す（gunicorn の post_fork から呼ぶ）
+
+    DB接続はクエリごとに開閉しておりフォークをまたいで共有されるものは無い。
+    """
+    # 全ワーカーが同じ乱数系列で出題しないように
+    random.seed()
+    # 親プロセスで作成したスレッドプールは子では使えない
+    application.import_jobs.reset_after_fork()
+    application.login_guard.reset_after_fork()
+    application.question_manager.item_stats.reset_after_fork()